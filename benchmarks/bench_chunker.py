@@ -0,0 +1,83 @@
+"""
+Micro-benchmark of the transcript chunker in meeting_summarizer.utils.
+
+Compares the previous chunker, which rebuilt the tokenizer on every count and cut the
+transcript by character offsets, with split_text_by_tokens on a synthetic transcript.
+
+Usage (from the repository root):
+    python benchmarks/bench_chunker.py --tokens 200000
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import tiktoken  # noqa: E402
+
+from meeting_summarizer.utils import count_tokens, create_messages_from_transcripts, get_encoding  # noqa: E402
+from synthetic_data import make_transcript_tokens  # noqa: E402
+
+
+def legacy_count_tokens(text: str, encoding_name: str) -> int:
+    encoding = tiktoken.get_encoding(encoding_name)
+    return len(encoding.encode(text))
+
+
+def legacy_create_messages(transcriptions: str, encoding_name: str, token_limit: int, num_token_completion: int):
+    num_tokens_in_transcriptions = legacy_count_tokens(transcriptions, encoding_name)
+    num_token_left = token_limit - num_token_completion
+    number_of_chunks = num_tokens_in_transcriptions // num_token_left + 1
+    messages = [{"role": "system", "content": "You are a helpful assistant."}]
+    for i in range(number_of_chunks):
+        messages.append({"role": "user", "content": transcriptions[i * num_token_left:(i + 1) * num_token_left]})
+    return messages
+
+
+def best_of(repeat: int, function, *args) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tokens", type=int, default=200000, help="size of the synthetic transcript")
+    parser.add_argument("--model", default="gpt-4o")
+    parser.add_argument("--completion-tokens", type=int, default=777)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    transcript = make_transcript_tokens(args.tokens)
+    encoding_name = get_encoding(args.model).name
+    num_tokens = count_tokens(transcript, args.model)
+    print("transcript: {} characters, {} tokens".format(len(transcript), num_tokens))
+
+    legacy_time = best_of(args.repeat, legacy_count_tokens, transcript, encoding_name)
+    cached_time = best_of(args.repeat, count_tokens, transcript, args.model)
+    print("count_tokens      legacy {:8.1f} ms   cached encoder {:8.1f} ms   speedup {:.1f}x".format(
+        legacy_time * 1000, cached_time * 1000, legacy_time / cached_time))
+
+    token_limit = 128000
+    legacy_messages = legacy_create_messages(transcript, encoding_name, token_limit, args.completion_tokens)
+    legacy_time = best_of(args.repeat, legacy_create_messages, transcript, encoding_name, token_limit,
+                          args.completion_tokens)
+    messages = create_messages_from_transcripts(transcript, args.model, args.completion_tokens)
+    new_time = best_of(args.repeat, create_messages_from_transcripts, transcript, args.model,
+                       args.completion_tokens)
+
+    legacy_covered = sum(len(message["content"]) for message in legacy_messages[1:])
+    print("chunker           legacy {:8.1f} ms   token offsets  {:8.1f} ms".format(legacy_time * 1000, new_time * 1000))
+    print("  legacy: {} chunks, {:.0f}% of the transcript sent, largest chunk {} tokens".format(
+        len(legacy_messages) - 1, 100 * legacy_covered / len(transcript),
+        max(count_tokens(message["content"], args.model) for message in legacy_messages[1:])))
+    print("  new:    {} chunks, 100% of the transcript sent, largest chunk {} tokens".format(
+        len(messages) - 1, max(count_tokens(message["content"], args.model) for message in messages[1:])))
+
+
+if __name__ == "__main__":
+    main()
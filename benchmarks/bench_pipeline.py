@@ -0,0 +1,275 @@
+"""
+End-to-end benchmarks of the pipeline against a local fake OpenAI server.
+
+Each case runs in a fresh process and reports its wall time, its peak RSS and that of the
+subprocesses (ffmpeg) it started, the number of API calls it made and, for the pipelines, the
+time to the first token of each streamed summary. The synthetic recordings are
+generated once per duration in the work folder and reused by the later runs.
+
+Cases:
+    split       split_audio_file_by_size and split_audio_file_on_silence (and the legacy
+                pydub split_audio_file with --legacy)
+    encode      encode_for_upload to each upload codec, with the bytes per minute and chunks saved
+    messages    create_messages_from_transcripts
+    transcribe  transcribe_audio
+    audio       pipelines.audio_to_summary
+    video       pipelines.video_to_summary
+    pipelined   pipelines.video_to_summary_pipelined
+
+Usage (from the repository root):
+    python benchmarks/bench_pipeline.py --minutes 10 60 480 --latency 0.5 --error-rate 0.02
+"""
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from fake_openai_server import FakeOpenAIServer  # noqa: E402
+from synthetic_data import make_audio, make_transcript, make_video  # noqa: E402
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+PROJECT = "bench"
+CASES = ["split", "encode", "messages", "transcribe", "audio", "video", "pipelined"]
+
+
+def bench_split(audio_path: str, max_chunk_size: int, legacy: bool) -> None:
+    from speech_transcriber.speech_transcriber import (
+        split_audio_file,
+        split_audio_file_by_size,
+        split_audio_file_on_silence,
+    )
+
+    for split in (split_audio_file_by_size, split_audio_file_on_silence):
+        output_dir = tempfile.mkdtemp(prefix="bench_chunks_")
+        start = time.perf_counter()
+        chunks = split(audio_path, max_chunk_size, output_dir=output_dir)
+        print("    {:28s} {:8.2f} s  {} chunks".format(split.__name__, time.perf_counter() - start, len(chunks)))
+        shutil.rmtree(output_dir)
+
+    if legacy:
+        from pydub import AudioSegment
+        from media_tools import get_ffmpeg_binary
+
+        AudioSegment.converter = get_ffmpeg_binary()
+        start = time.perf_counter()
+        chunks = split_audio_file(audio_path)
+        print("    {:28s} {:8.2f} s  {} chunks".format("split_audio_file (legacy)", time.perf_counter() - start,
+                                                       len(chunks)))
+        for chunk in chunks:
+            os.remove(chunk)
+
+
+def bench_encode(audio_path: str) -> None:
+    from speech_transcriber.speech_transcriber import UPLOAD_CODECS, encode_for_upload, upload_savings
+
+    for codec in UPLOAD_CODECS:
+        output_dir = tempfile.mkdtemp(prefix="bench_upload_")
+        start = time.perf_counter()
+        upload_path = encode_for_upload(audio_path, output_dir, codec)
+        elapsed = time.perf_counter() - start
+        savings = upload_savings(audio_path, upload_path)
+        print("    {:28s} {:8.2f} s  {:.2f} -> {:.2f} MB/min, {} -> {} chunks".format(
+            codec, elapsed, savings["bytes_per_minute_before"] / 2 ** 20, savings["bytes_per_minute_after"] / 2 ** 20,
+            savings["chunks_before"], savings["chunks_after"]))
+        shutil.rmtree(output_dir)
+
+
+def bench_messages(transcript_path: str, model: str, completion_tokens: int) -> None:
+    from meeting_summarizer import create_messages_from_transcripts
+
+    transcript = open(transcript_path, "r", encoding="utf-8").read()
+    messages = create_messages_from_transcripts(transcript, model, completion_tokens)
+    print("    {} chunks".format(len(messages) - 1))
+
+
+def bench_transcribe(audio_path: str, base_url: str, max_workers: int) -> None:
+    from openai_api_interaction import OpenAIAudioAPI
+    from speech_transcriber import transcribe_audio
+
+    config = OpenAIAudioAPI(api_key="bench", file_path=audio_path, base_url=base_url, max_workers=max_workers)
+    print("    {} characters transcribed".format(len(transcribe_audio(config))))
+
+
+def bench_audio(audio_name: str) -> None:
+    from pipelines import audio_to_summary
+
+    audio_to_summary(PROJECT, "projects/{}/audios/{}".format(PROJECT, audio_name), "bench")
+
+
+def bench_video(video_name: str) -> None:
+    from pipelines import video_to_summary
+
+    video_to_summary(PROJECT, video_name, "bench")
+
+
+def bench_pipelined(video_name: str) -> None:
+    from pipelines import video_to_summary_pipelined
+
+    video_to_summary_pipelined(PROJECT, video_name, "bench")
+
+
+def _measure(function: Callable, args: tuple, results) -> None:
+    # The pipelines write their progress to stdout, keep the report readable
+    if function in (bench_audio, bench_video, bench_pipelined):
+        sys.stdout = open(os.devnull, "w")
+    start = time.perf_counter()
+    function(*args)
+    wall_time = time.perf_counter() - start
+    results.put({"wall_time": wall_time,
+                 # kilobytes on Linux
+                 "peak_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+                 "children_peak_rss": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024})
+
+
+def run_case(name: str, function: Callable, args: tuple, server: FakeOpenAIServer) -> Dict[str, float]:
+    """
+    Runs a benchmark in a new process and returns its measurements.
+    """
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    calls_before = server.stats()
+    process = context.Process(target=_measure, args=(function, args, results))
+    process.start()
+    process.join()
+    if process.exitcode != 0:
+        raise RuntimeError("The {} benchmark failed".format(name))
+    measurements = results.get()
+    calls_after = server.stats()
+    for key, value in calls_after.items():
+        measurements[key] = value - calls_before.get(key, 0)
+    for span_name, seconds in first_token_times().items():
+        measurements["ttft_" + span_name] = seconds
+    return measurements
+
+
+def first_token_times() -> Dict[str, float]:
+    """
+    Returns the time to the first token of each streamed completion traced by the pipelines,
+    by span name, e.g. "summarize" and "meeting_summary".
+    """
+    times = {}
+    for trace_path in glob.glob(os.path.join("projects", PROJECT, "traces", "*.jsonl")):
+        with open(trace_path, "r", encoding="utf-8") as trace_file:
+            for line in trace_file:
+                record = json.loads(line)
+                if "first_token_seconds" in record["attributes"]:
+                    times[record["name"]] = record["attributes"]["first_token_seconds"]
+    return times
+
+
+def format_measurements(name: str, minutes: float, measurements: Dict[str, float]) -> str:
+    calls = ", ".join("{} {}".format(key, value) for key, value in sorted(measurements.items())
+                      if key.startswith(("calls_", "errors_")) and value)
+    ttft = ", ".join("{} {:.2f} s".format(key[len("ttft_"):], value) for key, value in sorted(measurements.items())
+                     if key.startswith("ttft_"))
+    return "{:10s} {:6.0f} min  {:9.2f} s  peak RSS {:7.1f} MB (subprocesses {:6.1f} MB)  {}{}".format(
+        name, minutes, measurements["wall_time"], measurements["peak_rss"] / 2 ** 20,
+        measurements["children_peak_rss"] / 2 ** 20, calls or "no API calls",
+        "  TTFT " + ttft if ttft else "")
+
+
+def prepare_inputs(work_dir: str, minutes: float, cases: List[str]) -> Dict[str, str]:
+    """
+    Generates the recordings and the transcript of a duration, unless already generated.
+    """
+    name = "meeting_{:g}min".format(minutes)
+    paths = {"audio": os.path.join("projects", PROJECT, "audios", name + ".wav"),
+             "video": os.path.join("projects", PROJECT, "videos", name + "_video.mp4"),
+             "transcript": os.path.join(work_dir, name + ".txt")}
+    if set(cases) & {"split", "encode", "transcribe", "audio"} and not os.path.exists(paths["audio"]):
+        make_audio(paths["audio"], minutes)
+    if set(cases) & {"video", "pipelined"} and not os.path.exists(paths["video"]):
+        make_video(paths["video"], minutes)
+    if "messages" in cases and not os.path.exists(paths["transcript"]):
+        with open(paths["transcript"], "w", encoding="utf-8") as transcript_file:
+            transcript_file.write(make_transcript(minutes))
+    return paths
+
+
+def prepare_work_dir(work_dir: str) -> None:
+    """
+    Lays out a project folder, and links the prompts the pipelines open by relative paths.
+    """
+    for folder in ["videos", "audios", "transcriptions", "summaries"]:
+        os.makedirs(os.path.join(work_dir, "projects", PROJECT, folder), exist_ok=True)
+    for package in ["meeting_summarizer", "generate_meeting_summary"]:
+        prompts_link = os.path.join(work_dir, package, "prompts")
+        if not os.path.exists(prompts_link):
+            os.makedirs(os.path.dirname(prompts_link), exist_ok=True)
+            os.symlink(os.path.abspath(os.path.join(SRC_DIR, package, "prompts")), prompts_link)
+
+
+def reset_outputs() -> None:
+    # Each pipeline run starts from scratch, without the cache or the checkpoints of a previous run
+    for folder in ["cache", "manifests", "traces", "transcriptions", "summaries"]:
+        shutil.rmtree(os.path.join("projects", PROJECT, folder), ignore_errors=True)
+    for folder in ["transcriptions", "summaries"]:
+        os.makedirs(os.path.join("projects", PROJECT, folder))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--minutes", type=float, nargs="+", default=[10, 60],
+                        help="durations of the synthetic meetings, from 10 minutes to 8 hours (480)")
+    parser.add_argument("--cases", nargs="+", choices=CASES, default=CASES)
+    parser.add_argument("--work-dir", default=os.path.join(tempfile.gettempdir(), "meeting_summary_bench"),
+                        help="folder of the generated inputs, kept between runs")
+    parser.add_argument("--latency", type=float, default=0.2, help="server latency per request in seconds")
+    parser.add_argument("--upload-bytes-per-second", type=float, default=None)
+    parser.add_argument("--tokens-per-second", type=float, default=None)
+    parser.add_argument("--max-concurrency", type=int, default=None)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=429)
+    parser.add_argument("--max-chunk-size", type=int, default=4 * 1024 * 1024,
+                        help="chunk size of the split benchmark in bytes")
+    parser.add_argument("--max-workers", type=int, default=4, help="concurrent uploads of the transcribe benchmark")
+    parser.add_argument("--model", default="gpt-4o")
+    parser.add_argument("--completion-tokens", type=int, default=777)
+    parser.add_argument("--legacy", action="store_true", help="also benchmark the pydub split_audio_file")
+    args = parser.parse_args()
+
+    os.makedirs(args.work_dir, exist_ok=True)
+    prepare_work_dir(args.work_dir)
+    os.chdir(args.work_dir)
+
+    server = FakeOpenAIServer(latency=args.latency,
+                              upload_bytes_per_second=args.upload_bytes_per_second,
+                              tokens_per_second=args.tokens_per_second,
+                              max_concurrency=args.max_concurrency,
+                              error_rate=args.error_rate,
+                              error_status=args.error_status)
+    # The pipelines build their own configurations, the client falls back to this variable
+    os.environ["OPENAI_BASE_URL"] = server.base_url
+    os.environ["PYTHONPATH"] = os.pathsep.join([os.path.dirname(os.path.abspath(__file__)),
+                                                os.path.abspath(SRC_DIR), os.environ.get("PYTHONPATH", "")])
+
+    with server:
+        for minutes in args.minutes:
+            print("Generating the inputs of a {:g} minute meeting...".format(minutes))
+            paths = prepare_inputs(args.work_dir, minutes, args.cases)
+            arguments = {
+                "split": (bench_split, (paths["audio"], args.max_chunk_size, args.legacy)),
+                "encode": (bench_encode, (paths["audio"],)),
+                "messages": (bench_messages, (paths["transcript"], args.model, args.completion_tokens)),
+                "transcribe": (bench_transcribe, (paths["audio"], server.base_url, args.max_workers)),
+                "audio": (bench_audio, (os.path.basename(paths["audio"]),)),
+                "video": (bench_video, (os.path.basename(paths["video"]),)),
+                "pipelined": (bench_pipelined, (os.path.basename(paths["video"]),)),
+            }
+            for name in args.cases:
+                reset_outputs()
+                function, case_args = arguments[name]
+                print(format_measurements(name, minutes, run_case(name, function, case_args, server)))
+
+
+if __name__ == "__main__":
+    main()
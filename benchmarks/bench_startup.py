@@ -0,0 +1,74 @@
+"""
+Startup-time benchmark of the entry points.
+
+Times a fresh interpreter importing each module, and lists the heavy dependencies the import
+loaded. Starting from a transcript (option 3 of main.py) should not load moviepy, pydub, numpy
+or tiktoken before they are needed.
+
+Usage (from the repository root):
+    python benchmarks/bench_startup.py --repeat 10
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+SRC_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+ROOT_DIR = os.path.dirname(SRC_DIR)
+
+HEAVY_MODULES = ["moviepy", "imageio", "pydub", "numpy", "tiktoken", "openai"]
+
+# Entry points, and the dependencies they cannot avoid
+ENTRY_POINTS = [
+    ("main", "import main"),
+    ("pipelines", "import pipelines"),
+    ("text to summary", "from pipelines import text_to_summary"),
+    ("audio to summary", "from pipelines import audio_to_summary; import speech_transcriber"),
+    ("video to summary", "from pipelines import video_to_summary; import audio_extractor, speech_transcriber"),
+]
+
+
+def time_import(statement: str, repeat: int) -> float:
+    """
+    Returns the best wall time in seconds of a new interpreter running the statement.
+    """
+    environment = dict(os.environ, PYTHONPATH=os.pathsep.join([SRC_DIR, ROOT_DIR]))
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", statement], check=True, env=environment, cwd=SRC_DIR,
+                       stderr=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def loaded_modules(statement: str) -> list:
+    """
+    Returns the heavy dependencies loaded by the statement.
+    """
+    environment = dict(os.environ, PYTHONPATH=os.pathsep.join([SRC_DIR, ROOT_DIR]))
+    check = "{}; import sys; print(' '.join(m for m in {!r} if m in sys.modules))".format(statement, HEAVY_MODULES)
+    output = subprocess.run([sys.executable, "-c", check], check=True, env=environment, cwd=SRC_DIR,
+                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL).stdout
+    return output.decode("utf-8").split()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    interpreter = time_import("pass", args.repeat)
+    print("{:18s} {:8.1f} ms".format("interpreter", interpreter * 1000))
+    for name, statement in ENTRY_POINTS:
+        elapsed = time_import(statement, args.repeat)
+        print("{:18s} {:8.1f} ms  loads: {}".format(name, (elapsed - interpreter) * 1000,
+                                                    ", ".join(loaded_modules(statement)) or "-"))
+    for module in HEAVY_MODULES:
+        statement = "import moviepy.editor" if module == "moviepy" else "import " + module
+        print("  {:16s} {:8.1f} ms on its own".format(module, (time_import(statement, args.repeat) - interpreter) * 1000))
+
+
+if __name__ == "__main__":
+    main()
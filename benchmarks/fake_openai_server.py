@@ -0,0 +1,260 @@
+"""
+A local stand-in for the OpenAI API, serving /v1/audio/transcriptions and /v1/chat/completions.
+
+The responses are synthetic: a transcription has one word per TRANSCRIPT_BYTES_PER_WORD bytes
+of uploaded audio, and a completion has completion_words words. The latency, the upload and
+generation throughput, the number of requests served at once and the share of failed requests
+can be set, so the pipeline can be benchmarked and its retries exercised without an API key.
+
+Usage as a server (from the repository root):
+    python benchmarks/fake_openai_server.py --port 8000 --latency 0.5 --error-rate 0.05
+    OPENAI_BASE_URL=http://127.0.0.1:8000/v1 python src/main.py
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+WORDS = ("budget quarter client roadmap release team review design deadline hiring "
+         "customer feedback metrics launch planning risk vendor contract").split()
+
+# Roughly the number of bytes of 16 kHz mono speech audio per spoken word
+TRANSCRIPT_BYTES_PER_WORD = 800
+# The speaking rate the segments of the verbose transcriptions are dated with
+WORDS_PER_SECOND = 2.5
+
+
+class FakeOpenAIServer:
+    """
+    A fake OpenAI API server running in a background thread.
+
+    Parameters
+    ----------
+    port : int, optional
+        The port to listen on, by default 0 (any free port).
+    latency : float, optional
+        The delay in seconds before each response, by default 0.0.
+    upload_bytes_per_second : float, optional
+        The rate at which uploaded audio is "processed", by default None (instant).
+    tokens_per_second : float, optional
+        The rate at which completion words are generated, by default None (instant).
+    max_concurrency : int, optional
+        The number of requests served at once, the others queue, by default None (unlimited).
+    error_rate : float, optional
+        The share of requests failing with error_status, by default 0.0.
+    error_status : int, optional
+        The status of the injected errors, 429 (with a Retry-After) or a 5xx, by default 429.
+    retry_after : float, optional
+        The delay in seconds sent in the Retry-After header of injected 429s, by default 0.1.
+    completion_words : int, optional
+        The number of words of each completion, by default 150.
+    seed : int, optional
+        The seed of the error injection, by default 0.
+    """
+
+    def __init__(self,
+                 port: int = 0,
+                 latency: float = 0.0,
+                 upload_bytes_per_second: Optional[float] = None,
+                 tokens_per_second: Optional[float] = None,
+                 max_concurrency: Optional[int] = None,
+                 error_rate: float = 0.0,
+                 error_status: int = 429,
+                 retry_after: float = 0.1,
+                 completion_words: int = 150,
+                 seed: int = 0):
+        self.latency = latency
+        self.upload_bytes_per_second = upload_bytes_per_second
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.completion_words = completion_words
+        self.calls: Counter = Counter()
+        self.errors: Counter = Counter()
+        self.uploaded_bytes = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_concurrency) if max_concurrency else None
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return "http://127.0.0.1:{}/v1".format(self._server.server_address[1])
+
+    def start(self) -> "FakeOpenAIServer":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "FakeOpenAIServer":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns the number of calls and injected errors per endpoint, and the uploaded bytes.
+        """
+        with self._lock:
+            stats = {"calls_" + path: count for path, count in self.calls.items()}
+            stats.update({"errors_" + path: count for path, count in self.errors.items()})
+            stats["uploaded_bytes"] = self.uploaded_bytes
+            return stats
+
+    def _inject_error(self, endpoint: str, body_size: int) -> bool:
+        with self._lock:
+            self.calls[endpoint] += 1
+            self.uploaded_bytes += body_size
+            failed = self._random.random() < self.error_rate
+            if failed:
+                self.errors[endpoint] += 1
+            return failed
+
+    def _words(self, count: int) -> str:
+        return " ".join(WORDS[i % len(WORDS)] for i in range(count)) + "."
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args) -> None:
+                pass
+
+            def do_POST(self) -> None:
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                endpoint = self.path.split("?")[0].rstrip("/").split("/v1/")[-1]
+                if endpoint not in ("audio/transcriptions", "chat/completions"):
+                    self._send_json(404, {"error": {"message": "Unknown endpoint " + self.path}})
+                    return
+
+                if server._slots is not None:
+                    server._slots.acquire()
+                try:
+                    if server.latency:
+                        time.sleep(server.latency)
+                    if server._inject_error(endpoint, len(body)):
+                        headers = {}
+                        if server.error_status == 429:
+                            headers["retry-after-ms"] = str(int(server.retry_after * 1000))
+                        self._send_json(server.error_status, {"error": {"message": "Injected error",
+                                                                        "type": "injected"}}, headers)
+                    elif endpoint == "audio/transcriptions":
+                        self._transcribe(body)
+                    else:
+                        self._complete(json.loads(body))
+                finally:
+                    if server._slots is not None:
+                        server._slots.release()
+
+            def _transcribe(self, body: bytes) -> None:
+                if server.upload_bytes_per_second:
+                    time.sleep(len(body) / server.upload_bytes_per_second)
+                text = server._words(max(1, len(body) // TRANSCRIPT_BYTES_PER_WORD))
+                if b'name="response_format"\r\n\r\ntext' in body:
+                    self._send(200, text.encode("utf-8"), "text/plain")
+                elif b'name="response_format"\r\n\r\nverbose_json' in body:
+                    self._send_json(200, {"text": text, "segments": [
+                        {"id": 0, "start": 0.0, "end": len(text.split()) / WORDS_PER_SECOND, "text": text}]})
+                else:
+                    self._send_json(200, {"text": text})
+
+            def _complete(self, request: dict) -> None:
+                num_words = min(server.completion_words, request.get("max_tokens") or server.completion_words)
+                words = server._words(num_words).split(" ")
+                model = request.get("model", "gpt-4o")
+                # Words stand for tokens, as in the transcriptions
+                prompt_words = sum(len(str(message.get("content") or "").split())
+                                   for message in request.get("messages") or [])
+                usage = {"prompt_tokens": prompt_words, "completion_tokens": num_words,
+                         "total_tokens": prompt_words + num_words}
+                if not request.get("stream"):
+                    if server.tokens_per_second:
+                        time.sleep(num_words / server.tokens_per_second)
+                    self._send_json(200, {
+                        "id": "chatcmpl-fake", "object": "chat.completion", "created": int(time.time()),
+                        "model": model,
+                        "choices": [{"index": i, "message": {"role": "assistant", "content": " ".join(words)},
+                                     "finish_reason": "stop"} for i in range(request.get("n") or 1)],
+                        "usage": usage,
+                    })
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for i, word in enumerate(words):
+                    if server.tokens_per_second:
+                        time.sleep(1 / server.tokens_per_second)
+                    self._send_event({"id": "chatcmpl-fake", "object": "chat.completion.chunk",
+                                      "created": int(time.time()), "model": model,
+                                      "choices": [{"index": 0, "delta": {"content": word if i == 0 else " " + word},
+                                                   "finish_reason": None}]})
+                self._send_event({"id": "chatcmpl-fake", "object": "chat.completion.chunk",
+                                  "created": int(time.time()), "model": model,
+                                  "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+                if (request.get("stream_options") or {}).get("include_usage"):
+                    # As the API does, the usage comes in a last chunk without choices
+                    self._send_event({"id": "chatcmpl-fake", "object": "chat.completion.chunk",
+                                      "created": int(time.time()), "model": model, "choices": [], "usage": usage})
+                self._send_event("[DONE]")
+                self.wfile.write(b"0\r\n\r\n")
+
+            def _send_event(self, data) -> None:
+                payload = "data: {}\n\n".format(data if isinstance(data, str) else json.dumps(data)).encode("utf-8")
+                self.wfile.write("{:x}\r\n".format(len(payload)).encode("ascii") + payload + b"\r\n")
+                self.wfile.flush()
+
+            def _send_json(self, status: int, data: dict, headers: Optional[Dict[str, str]] = None) -> None:
+                self._send(status, json.dumps(data).encode("utf-8"), "application/json", headers)
+
+            def _send(self, status: int, payload: bytes, content_type: str,
+                      headers: Optional[Dict[str, str]] = None) -> None:
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(payload)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+        return Handler
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--upload-bytes-per-second", type=float, default=None)
+    parser.add_argument("--tokens-per-second", type=float, default=None)
+    parser.add_argument("--max-concurrency", type=int, default=None)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=429)
+    args = parser.parse_args()
+
+    server = FakeOpenAIServer(args.port, args.latency, args.upload_bytes_per_second, args.tokens_per_second,
+                              args.max_concurrency, args.error_rate, args.error_status)
+    print("Serving the fake OpenAI API on {}".format(server.base_url))
+    server.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Generators of synthetic meeting recordings and transcripts for the benchmarks.
+
+The audio alternates 7.5 second "speech" tones with 1.5 second pauses, so the silence-aligned
+splitter has pauses to find, and the transcript is a sequence of speaker turns spoken at about
+150 words per minute.
+"""
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from media_tools import run_ffmpeg  # noqa: E402
+
+WORDS = ("budget quarter client roadmap release team review design deadline hiring "
+         "customer feedback metrics launch planning risk vendor contract").split()
+SPEAKERS = ["Alice", "Bob", "Carol", "Dave"]
+
+# A tone whose pitch wavers like a voice, silent for the first 1.5 seconds of every 9
+SPEECH_EXPRESSION = "0.3*sin(2*PI*(180+40*sin(2*PI*3*t))*t)*gt(mod(t\\,9)\\,1.5)"
+
+
+def make_transcript_tokens(num_tokens: int, seed: int = 0) -> str:
+    """
+    Generates a transcript of speaker turns with roughly num_tokens tokens.
+    """
+    rng = random.Random(seed)
+    turns = []
+    size = 0
+    while size < num_tokens:
+        sentences = [" ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 15))).capitalize() + "."
+                     for _ in range(rng.randint(1, 4))]
+        turn = "{}: {}".format(rng.choice(SPEAKERS), " ".join(sentences))
+        turns.append(turn)
+        size += len(turn.split()) + 2
+    return "\n".join(turns)
+
+
+def make_transcript(minutes: float, words_per_minute: int = 150, seed: int = 0) -> str:
+    """
+    Generates the transcript of a meeting lasting the given number of minutes.
+    """
+    # A speaker name and its colon add about two tokens per turn
+    return make_transcript_tokens(int(minutes * words_per_minute), seed)
+
+
+def make_audio(audio_path: str, minutes: float, sample_rate: int = 16000, bit_rate: str = "32k") -> str:
+    """
+    Writes a mono recording of the given number of minutes, encoded after its extension.
+    """
+    codec_args = ["-b:a", bit_rate] if audio_path.endswith((".mp3", ".m4a", ".ogg", ".webm")) else []
+    run_ffmpeg(["-f", "lavfi", "-i", "aevalsrc='{}':s={}:d={}".format(SPEECH_EXPRESSION, sample_rate, minutes * 60),
+                "-ac", "1"] + codec_args + [audio_path])
+    return audio_path
+
+
+def make_video(video_path: str, minutes: float, sample_rate: int = 44100) -> str:
+    """
+    Writes a small video of the given number of minutes with a stereo AAC soundtrack, like a
+    screen recording of a meeting.
+    """
+    run_ffmpeg(["-f", "lavfi", "-i", "color=c=gray:s=320x240:r=2:d={}".format(minutes * 60),
+                "-f", "lavfi", "-i", "aevalsrc='{}':s={}:d={}".format(SPEECH_EXPRESSION, sample_rate, minutes * 60),
+                "-c:v", "libx264", "-preset", "ultrafast", "-tune", "stillimage",
+                "-c:a", "aac", "-b:a", "96k", "-ac", "2", "-shortest", video_path])
+    return video_path
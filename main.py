@@ -1,7 +1,9 @@
+import argparse
 import os
+import time
 from typing import Optional
 
-from pipelines import video_to_summary, audio_to_summary, text_to_summary
+from pipelines import video_to_summary, video_to_summary_pipelined, audio_to_summary, text_to_summary
 
 
 def main(
@@ -11,6 +13,16 @@ def main(
         video_name: Optional[str] = None,
         transcription_path: Optional[str] = None,
         audio_path: Optional[str] = None,
+        metrics: bool = False,
+        compression_ratio: Optional[float] = None,
+        dedup_threshold: Optional[float] = None,
+        dedup_shingle_size: Optional[int] = None,
+        trim_silence: bool = False,
+        cache_completions: bool = False,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        transcription_backend: str = "openai",
+        pipelined: bool = False,
 ) -> None:
     """
     Extracts audio from a video, transcribes the audio, and summarizes the meeting.
@@ -29,19 +41,193 @@ def main(
         The path to the input transcription file, by default None.
     audio_path : str, optional
         The path to save the extracted audio, by default None.
+    metrics : bool, optional
+        Whether to write a Prometheus text file of the run metrics next to its trace, by
+        default False.
+    compression_ratio : float, optional
+        The fraction of the transcript tokens kept by the extractive reduction before
+        summarizing, by default None (the whole transcript is summarized).
+    dedup_threshold : float, optional
+        The similarity above which a transcript sentence or a summary line repeating an earlier
+        one is not sent, by default None (no deduplication).
+    dedup_shingle_size : int, optional
+        The number of consecutive words compared by the deduplication, by default 3.
+    trim_silence : bool, optional
+        Whether to remove the long pauses of the audio before transcribing it, by default
+        False.
+    cache_completions : bool, optional
+        Whether to serve identical completion requests from projects/<project>/cache, by
+        default False.
+    requests_per_minute : float, optional
+        The request quota of each model, by default None (unlimited).
+    tokens_per_minute : float, optional
+        The token quota of the completion model, by default None (unlimited).
+    transcription_backend : str, optional
+        The transcription backend: "openai", "local" (faster-whisper on the CPU) or "auto"
+        (the fastest one measured), by default "openai".
+    pipelined : bool, optional
+        Whether to extract, transcribe and summarize a video with the stages running
+        concurrently, see video_to_summary_pipelined, by default False.
     """
-    if option == 1:
-        video_to_summary(project=project, video_name=video_name, api_key=api_key)
+    dedup = dict(dedup_threshold=dedup_threshold, cache_completions=cache_completions,
+                 requests_per_minute=requests_per_minute, tokens_per_minute=tokens_per_minute)
+    if dedup_shingle_size is not None:
+        dedup["dedup_shingle_size"] = dedup_shingle_size
+    if option == 1 and pipelined:
+        video_to_summary_pipelined(project, video_name, api_key, metrics=metrics, cache_completions=cache_completions,
+                                   requests_per_minute=requests_per_minute, tokens_per_minute=tokens_per_minute,
+                                   transcription_backend=transcription_backend)
+    elif option == 1:
+        video_to_summary(project=project, video_name=video_name, api_key=api_key, metrics=metrics,
+                         compression_ratio=compression_ratio, echo=True, trim_silence=trim_silence,
+                         transcription_backend=transcription_backend, **dedup)
     elif option == 2:
-        audio_to_summary(project, audio_path=audio_path, api_key=api_key)
+        audio_to_summary(project, audio_path=audio_path, api_key=api_key, metrics=metrics,
+                         compression_ratio=compression_ratio, echo=True, trim_silence=trim_silence,
+                         transcription_backend=transcription_backend, **dedup)
     elif option == 3:
         transcription = open(transcription_path, "r", encoding='utf-8').read()
         name = transcription_path.split("/")[-1].split(".")[0]
-        text_to_summary(project, transcription=transcription, name=name, api_key=api_key)
+        text_to_summary(project, transcription=transcription, name=name, api_key=api_key, metrics=metrics,
+                        compression_ratio=compression_ratio, echo=True, **dedup)
+
+
+def batch(
+        project: str,
+        api_key: str,
+        extract_workers: Optional[int] = None,
+        max_concurrency: int = 4,
+        trim_silence: bool = False,
+        cache_completions: bool = False,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        transcription_backend: str = "openai",
+) -> bool:
+    """
+    Processes every video, audio and text file of a project, and prints a report.
+
+    Parameters
+    ----------
+    project : str
+        The name of the project.
+    api_key : str
+        The OpenAI API key.
+    extract_workers : int, optional
+        The number of processes extracting audio, by default the number of CPUs.
+    max_concurrency : int, optional
+        The number of files transcribed or summarized concurrently, by default 4.
+    trim_silence : bool, optional
+        Whether to remove the long pauses of the audio before transcribing it, by default
+        False.
+    cache_completions : bool, optional
+        Whether to serve identical completion requests from projects/<project>/cache, by
+        default False.
+    requests_per_minute : float, optional
+        The request quota of each model, by default None (unlimited).
+    tokens_per_minute : float, optional
+        The token quota of the completion model, by default None (unlimited).
+    transcription_backend : str, optional
+        The transcription backend: "openai", "local" (faster-whisper on the CPU) or "auto"
+        (the fastest one measured), by default "openai".
+
+    Returns
+    -------
+    bool
+        Whether every file was processed successfully.
+    """
+    # The batch runner loads the audio extraction, which the interactive runs may not need
+    from batch_runner import discover_jobs, format_batch_report, run_batch
+
+    jobs = discover_jobs(project)
+    print("Found {} files to process in projects/{}".format(len(jobs), project))
+    start = time.time()
+    jobs = run_batch(project, api_key, extract_workers=extract_workers, max_concurrency=max_concurrency, jobs=jobs,
+                     trim_silence=trim_silence, cache_completions=cache_completions,
+                     requests_per_minute=requests_per_minute, tokens_per_minute=tokens_per_minute,
+                     transcription_backend=transcription_backend)
+    print("_____________________________________________________________")
+    print(format_batch_report(jobs, time.time() - start))
+    return all(job.status == "done" for job in jobs)
+
+
+def search(query: str, project: Optional[str] = None, limit: int = 10) -> None:
+    """
+    Prints the meetings whose transcriptions or summaries match a query, best first.
+
+    Parameters
+    ----------
+    query : str
+        The words to search for.
+    project : str, optional
+        The project to search, by default all of them.
+    limit : int, optional
+        The maximum number of meetings, by default 10.
+    """
+    from search_index import SearchIndex
+
+    with SearchIndex("projects") as index:
+        # Picks up the files copied or edited by hand since they were indexed
+        counts = index.update_directory()
+        start = time.perf_counter()
+        results = index.search(query, limit=limit, project=project)
+        elapsed = time.perf_counter() - start
+    if counts["indexed"] or counts["removed"]:
+        print("Indexed {} files, removed {}".format(counts["indexed"], counts["removed"]))
+    print("{} meetings found in {:.1f} ms".format(len(results), elapsed * 1000))
+    for rank, result in enumerate(results, start=1):
+        print("{}. {}/{} (score {:.2f})".format(rank, result.project, result.meeting, result.score))
+        for kind, snippet in result.snippets:
+            print("   [{}] {}".format(kind, " ".join(snippet.split())))
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize meetings from video, audio or text files.")
+    parser.add_argument("--batch", metavar="PROJECT",
+                        help="process every file of the project without prompting")
+    parser.add_argument("--extract-workers", type=int, default=None,
+                        help="number of processes extracting audio in batch mode")
+    parser.add_argument("--max-concurrency", type=int, default=4,
+                        help="number of files transcribed or summarized concurrently in batch mode")
+    parser.add_argument("--metrics", action="store_true",
+                        help="write the metrics of each run to a Prometheus text file next to its trace")
+    parser.add_argument("--compression-ratio", type=float, default=None, metavar="RATIO",
+                        help="summarize only the most central sentences of the transcript, keeping "
+                             "this fraction of its tokens, e.g. 0.5")
+    parser.add_argument("--dedup-threshold", type=float, default=None, metavar="SIMILARITY",
+                        help="drop transcript sentences and summary lines more similar than this to an "
+                             "earlier one before sending them, e.g. 0.8")
+    parser.add_argument("--dedup-shingle-size", type=int, default=None, metavar="WORDS",
+                        help="number of consecutive words compared by --dedup-threshold (default 3)")
+    parser.add_argument("--trim-silence", action="store_true",
+                        help="remove the pauses longer than 2 seconds from the audio before transcribing it")
+    parser.add_argument("--cache-completions", action="store_true",
+                        help="serve identical completion requests from the project cache instead of "
+                             "sampling them again")
+    parser.add_argument("--requests-per-minute", type=float, default=None, metavar="RPM",
+                        help="request quota of the transcription and of the completion model")
+    parser.add_argument("--tokens-per-minute", type=float, default=None, metavar="TPM",
+                        help="token quota of the completion model")
+    parser.add_argument("--transcription-backend", choices=["openai", "local", "auto"], default="openai",
+                        help="transcribe with the OpenAI API, with faster-whisper on the CPU, or with the "
+                             "fastest of the two measured (default openai)")
+    parser.add_argument("--pipelined", action="store_true",
+                        help="extract, transcribe and summarize a video with the stages running concurrently, "
+                             "in overlapping 10-minute segments")
+    parser.add_argument("--search", metavar="QUERY",
+                        help="search the transcriptions and summaries of the projects")
+    parser.add_argument("--project", default=None,
+                        help="restrict --search to a project")
+    args = parser.parse_args()
+    if args.search:
+        search(args.search, args.project)
+        exit(0)
+
     OPENAI_API_KEY = open("openai_apikey.txt", "r").read().strip()
+    if args.batch:
+        succeeded = batch(args.batch, OPENAI_API_KEY, args.extract_workers, args.max_concurrency, args.trim_silence,
+                          args.cache_completions, args.requests_per_minute, args.tokens_per_minute,
+                          args.transcription_backend)
+        exit(0 if succeeded else 1)
 
     print("Welcome to the meeting summarizer!")
     print("This program will summarize a meeting from a video, audio file, or text file.")
@@ -79,7 +265,17 @@ if __name__ == "__main__":
         main(project=project_name,
              video_name=videoName,
              api_key=OPENAI_API_KEY,
-             option=int(chosen_option)
+             option=int(chosen_option),
+             metrics=args.metrics,
+             compression_ratio=args.compression_ratio,
+             dedup_threshold=args.dedup_threshold,
+             dedup_shingle_size=args.dedup_shingle_size,
+             trim_silence=args.trim_silence,
+             cache_completions=args.cache_completions,
+             requests_per_minute=args.requests_per_minute,
+             tokens_per_minute=args.tokens_per_minute,
+             transcription_backend=args.transcription_backend,
+             pipelined=args.pipelined
              )
 
     elif chosen_option == "2":
@@ -89,7 +285,16 @@ if __name__ == "__main__":
         main(project=project_name,
              audio_path=audioPath,
              api_key=OPENAI_API_KEY,
-             option=int(chosen_option)
+             option=int(chosen_option),
+             metrics=args.metrics,
+             compression_ratio=args.compression_ratio,
+             dedup_threshold=args.dedup_threshold,
+             dedup_shingle_size=args.dedup_shingle_size,
+             trim_silence=args.trim_silence,
+             cache_completions=args.cache_completions,
+             requests_per_minute=args.requests_per_minute,
+             tokens_per_minute=args.tokens_per_minute,
+             transcription_backend=args.transcription_backend
              )
         print("_____________________________________________________________")
 
@@ -100,7 +305,16 @@ if __name__ == "__main__":
         main(project=project_name,
              transcription_path=transcriptionPath,
              api_key=OPENAI_API_KEY,
-             option=int(chosen_option)
+             option=int(chosen_option),
+             metrics=args.metrics,
+             compression_ratio=args.compression_ratio,
+             dedup_threshold=args.dedup_threshold,
+             dedup_shingle_size=args.dedup_shingle_size,
+             trim_silence=args.trim_silence,
+             cache_completions=args.cache_completions,
+             requests_per_minute=args.requests_per_minute,
+             tokens_per_minute=args.tokens_per_minute,
+             transcription_backend=args.transcription_backend
              )
         print("_____________________________________________________________")
 
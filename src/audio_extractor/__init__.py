@@ -1 +1 @@
-from .audio_extractor import extract_audio_from_video
+from .audio_extractor import extract_audio_from_video, extract_audio_segments, concatenate_audio_files
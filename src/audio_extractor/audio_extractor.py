@@ -1,20 +1,41 @@
 import os
-from typing import Optional
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
 
-from moviepy.editor import VideoFileClip
-from pydub import AudioSegment
+from media_tools import probe_audio, run_ffmpeg
+
+# Output format -> (ffmpeg muxer, encoder, source codecs that can be stream-copied)
+AUDIO_FORMATS = {
+    "mp3": ("mp3", "libmp3lame", ["mp3"]),
+    "wav": ("wav", "pcm_s16le", ["pcm_s16le"]),
+    "m4a": ("ipod", "aac", ["aac"]),
+    "ogg": ("ogg", "libopus", ["opus", "vorbis"]),
+    "flac": ("flac", "flac", ["flac"]),
+    "webm": ("webm", "libopus", ["opus"]),
+}
 
 
 def extract_audio_from_video(
         video_path: str,
         audio_path: str,
-        audio_format: Optional[str] = "mp3",
+        audio_format: Optional[str] = None,
         start_time: Optional[float] = 0.0,
         end_time: Optional[float] = None,
+        single_pass: Optional[bool] = True,
+        sample_rate: Optional[int] = 16000,
+        num_segments: Optional[int] = 1,
+        max_workers: Optional[int] = None,
+        bit_rate: Optional[int] = None,
 ) -> None:
     """
     Extracts the audio from a video file and saves it in the specified format.
 
+    By default the audio stream is demuxed by ffmpeg in a single pass: it is copied as is
+    when its codec already matches the output format, and otherwise transcoded to mono at
+    a speech sample rate. No intermediate file is written.
+
     Parameters
     ----------
     video_path : str
@@ -22,16 +43,50 @@ def extract_audio_from_video(
     audio_path : str
         The path where the extracted audio file will be saved.
     audio_format : str, optional
-        The output format of the extracted audio, by default "wav".
+        The output format of the extracted audio, by default the extension of audio_path.
     start_time : float, optional
         The starting time (in seconds) from which to extract the audio, by default 0.0.
     end_time : float, optional
         The ending time (in seconds) up to which the audio will be extracted, by default None.
+    single_pass : bool, optional
+        Whether to extract the audio with ffmpeg in a single pass rather than decoding it
+        with moviepy and re-encoding it with pydub, by default True.
+    sample_rate : int, optional
+        The sample rate of transcoded audio in Hz, by default 16000.
+    num_segments : int, optional
+        The number of segments extracted in parallel and then concatenated, by default 1.
+        Only used by the single-pass extraction.
+    max_workers : int, optional
+        The number of processes extracting segments, by default the number of CPUs.
+    bit_rate : int, optional
+        The bit rate of transcoded audio in bits per second, by default the one of the
+        encoder.
 
     Returns
     -------
     None
     """
+    if audio_format is None:
+        audio_format = os.path.splitext(audio_path)[1].lstrip(".").lower() or "mp3"
+
+    if single_pass and audio_format in AUDIO_FORMATS:
+        if num_segments > 1:
+            segment_dir = tempfile.mkdtemp(prefix="audio_segments_")
+            try:
+                segments = extract_audio_segments(video_path, segment_dir, num_segments, audio_format,
+                                                  start_time, end_time, sample_rate, max_workers, bit_rate)
+                concatenate_audio_files(segments, audio_path, audio_format)
+            finally:
+                shutil.rmtree(segment_dir, ignore_errors=True)
+        else:
+            extract_audio_single_pass(video_path, audio_path, audio_format, start_time, end_time, sample_rate,
+                                      bit_rate)
+        return
+
+    # moviepy and pydub are slow to import and only needed by this path
+    from moviepy.editor import VideoFileClip
+    from pydub import AudioSegment
+
     # Load video and extract audio
     video = VideoFileClip(video_path)
     if end_time is None:
@@ -39,12 +94,168 @@ def extract_audio_from_video(
     audio = video.subclip(start_time, end_time).audio
 
     # Save audio to a temporary file
-    temp_audio_path = "temp_audio." + audio_format
-    audio.write_audiofile(temp_audio_path, codec=audio_format)
+    temp_audio_fd, temp_audio_path = tempfile.mkstemp(suffix="." + audio_format)
+    os.close(temp_audio_fd)
+    try:
+        audio.write_audiofile(temp_audio_path, codec=audio_format)
+
+        # Convert the temporary audio file to the desired format and save it
+        audio_segment = AudioSegment.from_file(temp_audio_path, format=audio_format)
+        audio_segment.export(audio_path, format=audio_format)
+    finally:
+        # Remove the temporary audio file
+        os.remove(temp_audio_path)
+
+
+def extract_audio_single_pass(
+        video_path: str,
+        audio_path: str,
+        audio_format: str,
+        start_time: Optional[float] = 0.0,
+        end_time: Optional[float] = None,
+        sample_rate: Optional[int] = 16000,
+        bit_rate: Optional[int] = None,
+) -> None:
+    """
+    Demuxes or transcodes the audio stream of a video to the output file in one ffmpeg pass.
+
+    Parameters
+    ----------
+    video_path : str
+        The path of the input video file.
+    audio_path : str
+        The path where the extracted audio file will be saved.
+    audio_format : str
+        The output format, one of the keys of AUDIO_FORMATS.
+    start_time : float, optional
+        The starting time (in seconds) from which to extract the audio, by default 0.0.
+    end_time : float, optional
+        The ending time (in seconds) up to which the audio will be extracted, by default None.
+    sample_rate : int, optional
+        The sample rate of transcoded audio in Hz, by default 16000.
+    bit_rate : int, optional
+        The bit rate of transcoded audio in bits per second, by default the one of the
+        encoder.
+
+    Returns
+    -------
+    None
+    """
+    muxer, encoder, copy_codecs = AUDIO_FORMATS[audio_format]
+    source_codec = probe_audio(video_path).codec
+
+    if source_codec in copy_codecs:
+        codec_args = ["-c:a", "copy"]
+    else:
+        codec_args = ["-c:a", encoder, "-ac", "1", "-ar", str(sample_rate)]
+        if bit_rate is not None and encoder not in ("pcm_s16le", "flac"):
+            codec_args += ["-b:a", str(bit_rate)]
+
+    time_args = ["-ss", str(start_time or 0.0)]
+    if end_time is not None:
+        time_args += ["-t", str(end_time - (start_time or 0.0))]
+
+    run_ffmpeg(time_args + ["-i", video_path, "-map", "0:a:0", "-vn", "-sn", "-dn"] + codec_args +
+               ["-f", muxer, audio_path])
 
-    # Convert the temporary audio file to the desired format and save it
-    audio_segment = AudioSegment.from_file(temp_audio_path, format=audio_format)
-    audio_segment.export(audio_path, format=audio_format)
 
-    # Remove the temporary audio file
-    os.remove(temp_audio_path)
+def extract_audio_segments(
+        video_path: str,
+        output_dir: str,
+        num_segments: int,
+        audio_format: Optional[str] = "mp3",
+        start_time: Optional[float] = 0.0,
+        end_time: Optional[float] = None,
+        sample_rate: Optional[int] = 16000,
+        max_workers: Optional[int] = None,
+        bit_rate: Optional[int] = None,
+) -> List[str]:
+    """
+    Splits the time range of a video into segments and extracts their audio in a process pool.
+
+    The segments can be concatenated with concatenate_audio_files, or transcribed directly as
+    pre-cut chunks.
+
+    Parameters
+    ----------
+    video_path : str
+        The path of the input video file.
+    output_dir : str
+        The folder in which to write the audio segments.
+    num_segments : int
+        The number of segments to extract.
+    audio_format : str, optional
+        The output format of the segments, one of the keys of AUDIO_FORMATS, by default "mp3".
+    start_time : float, optional
+        The starting time (in seconds) of the range to extract, by default 0.0.
+    end_time : float, optional
+        The ending time (in seconds) of the range to extract, by default the end of the video.
+    sample_rate : int, optional
+        The sample rate of transcoded audio in Hz, by default 16000.
+    max_workers : int, optional
+        The number of processes extracting segments, by default the number of CPUs.
+    bit_rate : int, optional
+        The bit rate of transcoded audio in bits per second, by default the one of the
+        encoder.
+
+    Returns
+    -------
+    List[str]
+        The paths of the audio segments, in playback order.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    start_time = start_time or 0.0
+    if end_time is None:
+        end_time = probe_audio(video_path).duration
+
+    segment_duration = (end_time - start_time) / num_segments
+    prefix = os.path.splitext(os.path.basename(video_path))[0]
+    segment_paths = [os.path.join(output_dir, "{}_segment_{:04d}.{}".format(prefix, i, audio_format))
+                     for i in range(num_segments)]
+    segment_starts = [start_time + i * segment_duration for i in range(num_segments)]
+    segment_ends = segment_starts[1:] + [end_time]
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(extract_audio_single_pass,
+                          [video_path] * num_segments,
+                          segment_paths,
+                          [audio_format] * num_segments,
+                          segment_starts,
+                          segment_ends,
+                          [sample_rate] * num_segments,
+                          [bit_rate] * num_segments))
+
+    return segment_paths
+
+
+def concatenate_audio_files(
+        audio_paths: List[str],
+        output_path: str,
+        audio_format: str,
+) -> None:
+    """
+    Concatenates audio files sharing the same encoding without re-encoding them.
+
+    Parameters
+    ----------
+    audio_paths : List[str]
+        The paths of the audio files, in playback order.
+    output_path : str
+        The path of the concatenated audio file.
+    audio_format : str
+        The format of the audio files, one of the keys of AUDIO_FORMATS.
+
+    Returns
+    -------
+    None
+    """
+    list_fd, list_path = tempfile.mkstemp(suffix=".txt")
+    try:
+        with os.fdopen(list_fd, "w", encoding="utf-8") as list_file:
+            for audio_path in audio_paths:
+                escaped_path = os.path.abspath(audio_path).replace("'", "'\\''")
+                list_file.write("file '{}'\n".format(escaped_path))
+        run_ffmpeg(["-f", "concat", "-safe", "0", "-i", list_path, "-c", "copy",
+                    "-f", AUDIO_FORMATS[audio_format][0], output_path])
+    finally:
+        os.remove(list_path)
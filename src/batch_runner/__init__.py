@@ -0,0 +1 @@
+from .batch_runner import BatchJob, discover_jobs, format_batch_report, run_batch
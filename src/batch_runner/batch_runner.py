@@ -0,0 +1,249 @@
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional, Tuple
+
+from audio_extractor import extract_audio_from_video
+from openai_api_interaction import OpenAIAudioAPI
+from pipelines import audio_to_summary, text_to_summary
+
+VIDEO_EXTENSIONS = {".mp4", ".mkv", ".mov", ".avi", ".webm", ".m4v"}
+AUDIO_EXTENSIONS = {".wav", ".mp3", ".m4a", ".ogg", ".oga", ".flac", ".mpga", ".mpeg", ".aac", ".opus"}
+TEXT_EXTENSIONS = {".txt"}
+
+
+@dataclass
+class BatchJob:
+    """
+    A dataclass to store a file of a project to process, and the outcome of its processing.
+
+    Parameters
+    ----------
+    name : str
+        The name of the meeting, i.e. the file name without extension.
+    kind : str
+        The stage the job starts from: "video", "audio" or "text".
+    path : str
+        The path to the input file.
+    size : int
+        The size of the input file in bytes.
+    status : str, optional
+        "pending", "done" or "failed", by default "pending".
+    error : Optional[str], optional
+        The error that made the job fail, by default None.
+    started : Optional[float], optional
+        The time at which the first stage of the job began to run, by default None.
+    finished : Optional[float], optional
+        The time at which the job finished, by default None.
+    stage_times : dict, optional
+        The duration in seconds of each stage of the job.
+    wait_time : float, optional
+        The time in seconds the stages of the job waited for a free worker, by default 0.0.
+    """
+    name: str
+    kind: str
+    path: str
+    size: int
+    status: str = "pending"
+    error: Optional[str] = None
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    stage_times: dict = field(default_factory=dict)
+    wait_time: float = 0.0
+
+    @property
+    def duration(self) -> float:
+        if self.started is None or self.finished is None:
+            return 0.0
+        return self.finished - self.started
+
+
+def discover_jobs(project: str) -> List[BatchJob]:
+    """
+    Lists the files to process under projects/<project>/videos, audios and transcriptions.
+
+    A meeting found in several folders is processed once, from its most advanced stage: an
+    existing transcription is summarized rather than transcribed again, and an audio file
+    is transcribed rather than extracted again from its video.
+
+    Parameters
+    ----------
+    project : str
+        The name of the project.
+
+    Returns
+    -------
+    List[BatchJob]
+        The jobs, sorted by name.
+    """
+    jobs = {}
+    for kind, folder, extensions in [("video", "videos", VIDEO_EXTENSIONS),
+                                     ("audio", "audios", AUDIO_EXTENSIONS),
+                                     ("text", "transcriptions", TEXT_EXTENSIONS)]:
+        folder_path = os.path.join("projects", project, folder)
+        if not os.path.isdir(folder_path):
+            continue
+        for file_name in sorted(os.listdir(folder_path)):
+            name, extension = os.path.splitext(file_name)
+            if extension.lower() not in extensions:
+                continue
+            if kind == "text" and name.startswith("transcription_"):
+                name = name[len("transcription_"):]
+            path = os.path.join(folder_path, file_name)
+            jobs[name] = BatchJob(name=name, kind=kind, path=path, size=os.path.getsize(path))
+    return [jobs[name] for name in sorted(jobs)]
+
+
+def _run_stage(function: Callable, *args, **kwargs) -> Tuple[float, Optional[Exception]]:
+    # Runs in the worker, so the time a stage waits in the queue of the pool is not counted as
+    # processing time
+    started = time.time()
+    try:
+        function(*args, **kwargs)
+    except Exception as error:
+        return started, error
+    return started, None
+
+
+def _summarize_text(project: str, transcription_path: str, name: str, api_key: str, **options) -> None:
+    transcription = open(transcription_path, "r", encoding='utf-8').read()
+    text_to_summary(project, transcription, name, api_key, **options)
+
+
+def run_batch(
+        project: str,
+        api_key: str,
+        extract_workers: Optional[int] = None,
+        max_concurrency: int = 4,
+        jobs: Optional[List[BatchJob]] = None,
+        trim_silence: bool = False,
+        cache_completions: bool = False,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        transcription_backend: str = "openai",
+) -> List[BatchJob]:
+    """
+    Processes every file of a project without user interaction.
+
+    Audio extraction runs in a process pool; the transcription and summarization stages, which
+    wait on the API, run in a thread pool of bounded size. A failing file is recorded and does
+    not stop the other ones. The time each stage waits for a free worker is recorded apart
+    from its processing time.
+
+    Parameters
+    ----------
+    project : str
+        The name of the project.
+    api_key : str
+        The OpenAI API key.
+    extract_workers : int, optional
+        The number of processes extracting audio, by default the number of CPUs.
+    max_concurrency : int, optional
+        The number of files transcribed or summarized concurrently, by default 4.
+    jobs : List[BatchJob], optional
+        The jobs to run, by default the ones found by discover_jobs.
+    trim_silence : bool, optional
+        Whether to remove the long pauses of the audio before transcribing it, by default
+        False.
+    cache_completions : bool, optional
+        Whether to serve identical completion requests from projects/<project>/cache, by
+        default False.
+    requests_per_minute : float, optional
+        The request quota of each model, by default None (unlimited).
+    tokens_per_minute : float, optional
+        The token quota of the completion model, by default None (unlimited).
+    transcription_backend : str, optional
+        The transcription backend: "openai", "local" (faster-whisper on the CPU) or "auto"
+        (the fastest one measured), by default "openai".
+
+    Returns
+    -------
+    List[BatchJob]
+        The jobs with their status and timings.
+    """
+    if jobs is None:
+        jobs = discover_jobs(project)
+    options = dict(cache_completions=cache_completions, requests_per_minute=requests_per_minute,
+                   tokens_per_minute=tokens_per_minute)
+
+    with ProcessPoolExecutor(max_workers=extract_workers) as processes, \
+            ThreadPoolExecutor(max_workers=max_concurrency) as threads:
+
+        def submit_summary(job: BatchJob, path: str):
+            if job.kind == "text":
+                return (threads.submit(_run_stage, _summarize_text, project, path, job.name, api_key, **options),
+                        "summarize")
+            return (threads.submit(_run_stage, audio_to_summary, project, path, api_key, trim_silence=trim_silence,
+                                   transcription_backend=transcription_backend, **options), "transcribe+summarize")
+
+        futures = {}
+        for job in jobs:
+            if job.kind == "video":
+                audio_path = os.path.join("projects", project, "audios", job.name + ".ogg")
+                future = processes.submit(_run_stage, extract_audio_from_video, job.path, audio_path,
+                                          bit_rate=OpenAIAudioAPI.upload_bit_rate)
+                futures[future] = (job, "extract", time.time())
+            else:
+                future, stage = submit_summary(job, job.path)
+                futures[future] = (job, stage, time.time())
+
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                job, stage, submitted = futures.pop(future)
+                try:
+                    stage_started, error = future.result()
+                except Exception as pool_error:
+                    # The worker itself failed, e.g. a process of the pool was killed
+                    stage_started, error = time.time(), pool_error
+                if job.started is None:
+                    job.started = stage_started
+                job.wait_time += max(0.0, stage_started - submitted)
+                job.stage_times[stage] = time.time() - stage_started
+                if error is not None:
+                    job.status, job.error, job.finished = "failed", "{}: {}".format(stage, error), time.time()
+                    continue
+                if stage == "extract":
+                    audio_path = os.path.join("projects", project, "audios", job.name + ".ogg")
+                    next_future, next_stage = submit_summary(job, audio_path)
+                    futures[next_future] = (job, next_stage, time.time())
+                else:
+                    job.status, job.finished = "done", time.time()
+
+    return jobs
+
+
+def format_batch_report(jobs: List[BatchJob], wall_time: float) -> str:
+    """
+    Formats the per-file and aggregate results of a batch run.
+
+    Parameters
+    ----------
+    jobs : List[BatchJob]
+        The jobs returned by run_batch.
+    wall_time : float
+        The duration of the whole run in seconds.
+
+    Returns
+    -------
+    str
+        The report.
+    """
+    lines = ["{:<40} {:<6} {:<7} {:>9} {:>10} {:>10} {:>10}".format("file", "from", "status", "size MB", "wait s",
+                                                                    "time s", "MB/min")]
+    for job in jobs:
+        throughput = job.size / 1e6 / (job.duration / 60) if job.duration else 0.0
+        lines.append("{:<40} {:<6} {:<7} {:>9.1f} {:>10.1f} {:>10.1f} {:>10.2f}".format(
+            job.name[:40], job.kind, job.status, job.size / 1e6, job.wait_time, job.duration, throughput))
+        if job.error:
+            lines.append("    error: {}".format(job.error))
+
+    failed = [job for job in jobs if job.status == "failed"]
+    total_size = sum(job.size for job in jobs if job.status == "done")
+    lines.append("")
+    lines.append("{} files, {} done, {} failed in {:.1f} s ({:.1f} files/hour, {:.2f} MB/min)".format(
+        len(jobs), len(jobs) - len(failed), len(failed), wall_time,
+        (len(jobs) - len(failed)) * 3600 / wall_time if wall_time else 0.0,
+        total_size / 1e6 / (wall_time / 60) if wall_time else 0.0))
+    return "\n".join(lines)
@@ -1 +1 @@
-from .generate_meeting_summary import generate_meeting_summary
+from .generate_meeting_summary import generate_meeting_summary, merge_summaries
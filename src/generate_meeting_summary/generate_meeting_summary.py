@@ -1,16 +1,32 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional
+
 import openai
 
-from meeting_summarizer.utils import create_messages_from_transcripts
-from openai_api_interaction import OpenAICompletionAPI
+from meeting_summarizer.utils import TOKEN_LIMIT_PER_MODEL, count_tokens, split_text_by_tokens
+from openai_api_interaction import OpenAICompletionAPI, create_chat_completion, get_openai_client
+from tracing import Span, propagate, span
+
+PROMPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompts")
+
+# Tokens used by the chat format and the system message around a prompt
+PROMPT_OVERHEAD_TOKENS = 20
 
 
 def generate_meeting_summary(
         summary: str,
         config: OpenAICompletionAPI,
         prompt_template: str,
+        on_token: Optional[Callable[[str], None]] = None,
 ) -> str:
     """
     Generates a meeting summary using OpenAI's Completion API.
+
+    The text is split into chunks that fill the context of the model, which are summarized
+    concurrently (map) and then merged by merge_summaries (reduce). Only the request that
+    produces the final summary is streamed to on_token.
+
     Parameters
     ----------
     summary : str
@@ -18,112 +34,211 @@ def generate_meeting_summary(
     config : OpenAICompletionAPI
         The configuration for the OpenAI Completion API.
     prompt_template : str
-        The template for creating the summary prompt.
+        The template for creating the summary prompt. Each chunk replaces its <<<CHUNK>>>
+        placeholder, or is appended to it if it has none.
+    on_token : Callable[[str], None], optional
+        A function called with the final summary text as it is generated, by default None.
+        The completion is streamed if ``config.stream`` is set.
 
     Returns
     -------
     str
         The generated meeting summary.
     """
-    openai.api_key = config.api_key
-
-    # Create the messages
-    messages = create_messages_from_transcripts(
-        transcriptions=summary,
-        model=config.model,
-        num_token_completion=config.max_tokens
-    )
-
-    if len(messages) == 1:
-        response = openai.ChatCompletion.create(
-            model=config.model,
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant."},
-                {"role": "user", "content": messages[0]["content"]}
-            ],
-            max_tokens=config.max_tokens,
-            temperature=config.temperature,
-            top_p=config.top_p,
-            n=config.n,
-            presence_penalty=config.presence_penalty,
-            frequency_penalty=config.frequency_penalty,
-        )
-        summary = response.choices[0]["message"]["content"].strip()
-        return summary
-
-    elif len(messages) < 20:
-        response = openai.ChatCompletion.create(
-            model=config.model,
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant."},
-                {"role": "user", "content": "\n".join([msg["content"] for msg in messages])}
-            ],
-            max_tokens=config.max_tokens,
-            temperature=config.temperature,
-            top_p=config.top_p,
-            n=config.n,
-            presence_penalty=config.presence_penalty,
-            frequency_penalty=config.frequency_penalty,
-        )
-        summary = [choice["message"]["content"].strip() for choice in response.choices]
-        summary = merge_summaries(summary, config)
-        return summary
-
-    else:
-        responses = []
-        for i in range(0, len(messages), 20):
-            response = openai.ChatCompletion.create(
-                model=config.model,
-                messages=[
-                    {"role": "system", "content": "You are a helpful assistant."},
-                    {"role": "user", "content": "\n".join([msg["content"] for msg in messages[i:i + 20]])}
-                ],
-                max_tokens=config.max_tokens,
-                temperature=config.temperature,
-                top_p=config.top_p,
-                n=config.n,
-                stream=config.stream,
-                presence_penalty=config.presence_penalty,
-                frequency_penalty=config.frequency_penalty,
-            )
-            summary = [choice["message"]["content"].strip() for choice in response.choices]
-            responses += summary
-        summary = merge_summaries(responses, config)
-        return summary
-
-
-def merge_summaries(summaries: list, config: OpenAICompletionAPI) -> str:
+    # Get the shared OpenAI API client
+    client = get_openai_client(config)
+
+    # Split the text into chunks that fit in the context with the prompt and the completion
+    token_budget = (TOKEN_LIMIT_PER_MODEL[config.model] - config.max_tokens
+                    - count_tokens(prompt_template, config.model) - PROMPT_OVERHEAD_TOKENS)
+    chunks = split_text_by_tokens(summary, config.model, token_budget)
+
+    prompts = []
+    for chunk in chunks:
+        if "<<<CHUNK>>>" in prompt_template:
+            prompts.append(prompt_template.replace("<<<CHUNK>>>", chunk))
+        else:
+            prompts.append(prompt_template + "\n" + chunk)
+
+    if len(prompts) == 1:
+        return map_prompts(prompts, config, client, on_token)[0]
+
+    partial_summaries = map_prompts(prompts, config, client)
+    summary = merge_summaries(partial_summaries, config, client, on_token)
+    return summary
+
+
+def map_prompts(
+        prompts: List[str],
+        config: OpenAICompletionAPI,
+        client: Optional[openai.OpenAI] = None,
+        on_token: Optional[Callable[[str], None]] = None,
+) -> List[str]:
+    """
+    Sends the prompts concurrently, with up to ``config.max_workers`` requests in flight.
+
+    Parameters
+    ----------
+    prompts : List[str]
+        The prompts to send.
+    config : OpenAICompletionAPI
+        The configuration for the OpenAI Completion API.
+    client : openai.OpenAI, optional
+        The OpenAI API client, by default the shared client of the configuration.
+    on_token : Callable[[str], None], optional
+        A function called with the completion text as it is generated, by default None.
+        Only allowed with a single prompt, since concurrent completions would interleave.
+
+    Returns
+    -------
+    List[str]
+        The completion of each prompt, in the order of the prompts.
+    """
+    if on_token is not None and len(prompts) > 1:
+        raise ValueError("Only a single completion can be streamed, got {} prompts".format(len(prompts)))
+    if client is None:
+        client = get_openai_client(config)
+
+    def complete(prompt: str) -> str:
+        return create_chat_completion(client, config, [
+            {"role": "system", "content": "You are a helpful assistant."},
+            {"role": "user", "content": prompt}
+        ], on_token)[0]
+
+    with ThreadPoolExecutor(max_workers=max(1, config.max_workers)) as executor:
+        return list(executor.map(propagate(complete), prompts))
+
+
+def group_summaries(
+        summaries: List[str],
+        model: str,
+        token_budget: int,
+        fan_in: int,
+) -> List[List[str]]:
+    """
+    Groups consecutive summaries so that each group fits in the token budget.
+
+    Parameters
+    ----------
+    summaries : List[str]
+        The summaries to group.
+    model : str
+        The model from OpenAI to use.
+    token_budget : int
+        The maximum number of tokens of the summaries of a group.
+    fan_in : int
+        The maximum number of summaries in a group.
+
+    Returns
+    -------
+    List[List[str]]
+        The groups, in order. A group holds at least two summaries, except possibly the last
+        one, so every round of merging reduces the number of summaries.
+    """
+    groups = []
+    group: List[str] = []
+    group_tokens = 0
+    for summary in summaries:
+        summary_tokens = count_tokens(summary, model)
+        if len(group) >= 2 and (len(group) == fan_in or group_tokens + summary_tokens > token_budget):
+            groups.append(group)
+            group, group_tokens = [], 0
+        group.append(summary)
+        group_tokens += summary_tokens
+    if group:
+        groups.append(group)
+    return groups
+
+
+def merge_summaries(
+        summaries: list,
+        config: OpenAICompletionAPI,
+        client: Optional[openai.OpenAI] = None,
+        on_token: Optional[Callable[[str], None]] = None,
+) -> str:
     """
     Merges a list of summaries into a single summary.
+
+    The summaries are merged in groups of at most ``config.merge_fan_in`` that fit in the
+    context of the model, concurrently, and the merged summaries are merged again until one
+    remains. The number of rounds grows with the logarithm of the number of summaries.
+
     Parameters
     ----------
     summaries : list
         A list of summaries.
     config : OpenAICompletionAPI
         The configuration for the OpenAI Completion API.
+    client : openai.OpenAI, optional
+        The OpenAI API client, by default the shared client of the configuration.
+    on_token : Callable[[str], None], optional
+        A function called with the text of the last merge as it is generated, by default
+        None. The completion is streamed if ``config.stream`` is set.
 
     Returns
     -------
     str
         The merged summary.
     """
-    prompt_merging = open("prompts/merge_summaries.txt", "r", encoding='utf-8').read()
-    summaries_to_merge = ""
-    for i, summary in enumerate(summaries):
-        summaries_to_merge += "MEETING SUMMARY {} :".format(str(i+1)) + "\n" + summary + "\n"
-    prompt = prompt_merging.replace("<<<MEETING SUMMARY>>>", summaries_to_merge)
-    response = openai.ChatCompletion.create(
-        model=config.model,
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant."},
-            {"role": "user", "content": prompt}
-        ],
-        max_tokens=config.max_tokens,
-        temperature=config.temperature,
-        top_p=config.top_p,
-        n=config.n,
-        presence_penalty=config.presence_penalty,
-        frequency_penalty=config.frequency_penalty,
-    )
-    merged_summary = response.choices[0]["message"]["content"].strip()
+    prompt_merging = open(os.path.join(PROMPTS_DIR, "merge_summaries.txt"), "r", encoding='utf-8').read()
+    token_budget = (TOKEN_LIMIT_PER_MODEL[config.model] - config.max_tokens
+                    - count_tokens(prompt_merging, config.model) - PROMPT_OVERHEAD_TOKENS)
+
+    if len(summaries) == 1 and on_token is not None:
+        on_token(summaries[0])
+
+    with span("merge", summaries=len(summaries)) as merge_span:
+        while len(summaries) > 1:
+            merge_span.add("rounds")
+            if config.dedup_threshold is not None:
+                summaries = deduplicate_summaries(summaries, config, merge_span)
+            groups = group_summaries(summaries, config.model, token_budget, max(2, config.merge_fan_in))
+            prompts = []
+            for group in groups:
+                summaries_to_merge = ""
+                for i, summary in enumerate(group):
+                    summaries_to_merge += "MEETING SUMMARY {} :".format(str(i + 1)) + "\n" + summary + "\n"
+                prompts.append(prompt_merging.replace("<<<MEETING SUMMARY>>>", summaries_to_merge))
+
+            # A summary left alone in the last group is carried over to the next round as is
+            # The last round merges a single group, whose completion is the final summary
+            merged_summaries = map_prompts([prompt for prompt, group in zip(prompts, groups) if len(group) > 1],
+                                           config, client, on_token if len(groups) == 1 else None)
+            if len(groups[-1]) == 1:
+                merged_summaries.append(groups[-1][0])
+            summaries = merged_summaries
+
+    merged_summary = summaries[0]
     return merged_summary
+
+
+def deduplicate_summaries(summaries: List[str], config: OpenAICompletionAPI, merge_span: Span) -> List[str]:
+    """
+    Removes the lines of the summaries that nearly repeat an earlier line before they are
+    merged, and adds the lines and tokens removed to the merge span.
+
+    Parameters
+    ----------
+    summaries : List[str]
+        The summaries to merge.
+    config : OpenAICompletionAPI
+        The configuration for the OpenAI Completion API, whose ``dedup_threshold`` and
+        ``dedup_shingle_size`` are used.
+    merge_span : Span
+        The span of the merge.
+
+    Returns
+    -------
+    List[str]
+        The summaries without the repeated lines.
+    """
+    # numpy is only loaded by the runs that deduplicate their summaries
+    from meeting_summarizer.dedup import deduplicate_summaries as deduplicate
+
+    summaries, stats = deduplicate(summaries, lambda line: count_tokens(line, config.model),
+                                   config.dedup_threshold, config.dedup_shingle_size)
+    merge_span.add("dedup_lines_removed", stats["passages_removed"])
+    merge_span.add("dedup_tokens_removed", stats["tokens_removed"])
+    print("Deduplication: removed {} repeated summary lines, {} tokens".format(
+        stats["passages_removed"], stats["tokens_removed"]))
+    return summaries
@@ -0,0 +1 @@
+from .media_tools import AudioStreamInfo, get_ffmpeg_binary, iter_pcm_blocks, probe_audio, run_ffmpeg
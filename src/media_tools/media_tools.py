@@ -0,0 +1,183 @@
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+from dataclasses import dataclass
+from typing import Iterator, List
+
+import numpy as np
+
+CHANNEL_LAYOUTS = {"mono": 1, "stereo": 2, "2.1": 3, "quad": 4, "5.0": 5, "5.1": 6, "6.1": 7, "7.1": 8}
+
+
+@dataclass
+class AudioStreamInfo:
+    """
+    A dataclass to store the properties of the first audio stream of a media file.
+
+    Parameters
+    ----------
+    duration : float
+        The duration of the media file in seconds.
+    codec : str
+        The name of the audio codec, e.g. "mp3", "aac" or "pcm_s16le".
+    sample_rate : int
+        The sample rate of the audio stream in Hz.
+    channels : int
+        The number of audio channels.
+    bit_rate : int
+        The bit rate of the audio stream in bits per second. Falls back to the bit rate of
+        the whole file when the stream does not report one.
+    """
+    duration: float
+    codec: str
+    sample_rate: int
+    channels: int
+    bit_rate: int
+
+
+def get_ffmpeg_binary() -> str:
+    """
+    Returns the path of the ffmpeg executable.
+
+    The ffmpeg found on the PATH is preferred; otherwise the binary bundled with
+    imageio-ffmpeg (installed alongside moviepy) is used.
+
+    Returns
+    -------
+    str
+        The path of the ffmpeg executable.
+    """
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is not None:
+        return ffmpeg
+
+    import imageio_ffmpeg
+    return imageio_ffmpeg.get_ffmpeg_exe()
+
+
+def run_ffmpeg(args: List[str]) -> None:
+    """
+    Runs ffmpeg with the given arguments and raises if it fails.
+
+    Parameters
+    ----------
+    args : List[str]
+        The command line arguments, without the executable.
+
+    Raises
+    ------
+    RuntimeError
+        If ffmpeg exits with a non-zero status.
+    """
+    command = [get_ffmpeg_binary(), "-hide_banner", "-loglevel", "error", "-y"] + args
+    result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise RuntimeError("ffmpeg failed: {}".format(result.stderr.decode("utf-8", "replace").strip()))
+
+
+def probe_audio(media_path: str) -> AudioStreamInfo:
+    """
+    Reads the duration and audio stream properties of a media file without decoding it.
+
+    Parameters
+    ----------
+    media_path : str
+        The path to the audio or video file.
+
+    Returns
+    -------
+    AudioStreamInfo
+        The properties of the first audio stream.
+
+    Raises
+    ------
+    ValueError
+        If the file has no audio stream or its duration cannot be read.
+    """
+    result = subprocess.run([get_ffmpeg_binary(), "-hide_banner", "-i", media_path],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    output = result.stderr.decode("utf-8", "replace")
+
+    duration_match = re.search(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)", output)
+    stream_match = re.search(r"Stream #\d+:\d+.*?: Audio: (\w+)[^,\n]*, (\d+) Hz, ([^,\n]+)(.*)", output)
+    if duration_match is None or stream_match is None:
+        raise ValueError("No audio stream found in {}".format(media_path))
+
+    hours, minutes, seconds = duration_match.groups()
+    duration = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+    codec, sample_rate, layout, rest = stream_match.groups()
+    channel_count = re.match(r"(\d+) channels", layout)
+    if channel_count is not None:
+        channels = int(channel_count.group(1))
+    else:
+        channels = CHANNEL_LAYOUTS.get(layout.split("(")[0].strip(), 2)
+
+    stream_bit_rate = re.search(r"(\d+) kb/s", rest)
+    file_bit_rate = re.search(r"bitrate: (\d+) kb/s", output)
+    if stream_bit_rate is not None:
+        bit_rate = int(stream_bit_rate.group(1)) * 1000
+    elif file_bit_rate is not None:
+        bit_rate = int(file_bit_rate.group(1)) * 1000
+    else:
+        bit_rate = int(os.path.getsize(media_path) * 8 / max(duration, 1e-3))
+
+    return AudioStreamInfo(duration=duration,
+                           codec=codec,
+                           sample_rate=int(sample_rate),
+                           channels=channels,
+                           bit_rate=bit_rate)
+
+
+def iter_pcm_blocks(
+        media_path: str,
+        sample_rate: int = 16000,
+        block_duration: float = 60.0,
+) -> Iterator[np.ndarray]:
+    """
+    Decodes the audio of a media file to mono 16-bit PCM and yields it block by block.
+
+    The decoding runs in an ffmpeg subprocess, so only one block is held in memory at a time.
+
+    Parameters
+    ----------
+    media_path : str
+        The path to the audio or video file.
+    sample_rate : int, optional
+        The sample rate of the decoded audio in Hz, by default 16000.
+    block_duration : float, optional
+        The duration of each block in seconds, by default 60.0.
+
+    Yields
+    ------
+    np.ndarray
+        The int16 samples of the next block; the last block may be shorter.
+    """
+    command = [get_ffmpeg_binary(), "-hide_banner", "-loglevel", "error", "-i", media_path,
+               "-vn", "-ac", "1", "-ar", str(sample_rate), "-f", "s16le", "-"]
+    block_size = int(sample_rate * block_duration) * 2
+    # The decoder messages go to a file: a pipe read only once the samples are drained could
+    # fill up first, e.g. with the warnings of a damaged file, and block both processes
+    stderr_file = tempfile.TemporaryFile()
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=stderr_file)
+    data = b""
+    try:
+        while True:
+            data = process.stdout.read(block_size)
+            if not data:
+                break
+            yield np.frombuffer(data[:len(data) - len(data) % 2], dtype=np.int16)
+    finally:
+        # Stop ffmpeg if the consumer did not read the whole stream
+        if process.poll() is None and not process.stdout.closed and data:
+            process.kill()
+        process.stdout.close()
+        return_code = process.wait()
+        stderr_file.seek(0)
+        stderr = stderr_file.read()
+        stderr_file.close()
+
+    if return_code != 0:
+        raise RuntimeError("ffmpeg failed: {}".format(stderr.decode("utf-8", "replace").strip()))
@@ -1,2 +1,2 @@
 from .meeting_summarizer import summarize_transcription
-from .utils import create_messages_from_transcripts, count_tokens
+from .utils import create_messages_from_pieces, create_messages_from_segments, create_messages_from_transcripts, count_tokens, get_encoding, split_text_by_tokens
@@ -0,0 +1,207 @@
+import re
+import zlib
+from typing import Callable, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+WORD_PATTERN = re.compile(r"\w+")
+
+NUM_PERMUTATIONS = 128
+# A prime above the 32-bit shingle hashes
+HASH_PRIME = 4294967311
+# Shorter passages, e.g. "Yes.", are never removed
+MIN_PASSAGE_WORDS = 3
+# Number of permutations hashed at once, which bounds the memory used
+PERMUTATION_BLOCK = 16
+
+# The permutations are (a * x + b) mod HASH_PRIME. With a below 2^31 and the hashes below
+# 2^32, a * x + b stays below 2^64, so the uint64 arithmetic does not wrap around
+_random = np.random.RandomState(20240611)
+PERMUTATION_A = _random.randint(1, 2 ** 31, size=NUM_PERMUTATIONS, dtype=np.uint64)
+PERMUTATION_B = _random.randint(0, 2 ** 32, size=NUM_PERMUTATIONS, dtype=np.uint64)
+
+
+def shingle_hashes(passage: str, shingle_size: int) -> List[int]:
+    """
+    Returns the hashes of the word shingles of a passage, or an empty list if it is too short
+    to be compared.
+
+    Parameters
+    ----------
+    passage : str
+        The passage.
+    shingle_size : int
+        The number of consecutive words of a shingle. A passage shorter than that is a single
+        shingle.
+
+    Returns
+    -------
+    List[int]
+        The distinct 32-bit hashes of the shingles.
+    """
+    words = WORD_PATTERN.findall(passage.lower())
+    if len(words) < MIN_PASSAGE_WORDS:
+        return []
+    shingles = {" ".join(words[i:i + shingle_size]) for i in range(max(1, len(words) - shingle_size + 1))}
+    return [zlib.crc32(shingle.encode("utf-8")) for shingle in shingles]
+
+
+def minhash_signatures(passages: Sequence[str], shingle_size: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Computes the MinHash signatures of the passages.
+
+    Parameters
+    ----------
+    passages : Sequence[str]
+        The passages.
+    shingle_size : int
+        The number of consecutive words of a shingle.
+
+    Returns
+    -------
+    Tuple[np.ndarray, np.ndarray]
+        The indices of the passages long enough to be compared, and their signatures, with
+        one row of NUM_PERMUTATIONS minimum hashes per passage.
+    """
+    hashes = [shingle_hashes(passage, shingle_size) for passage in passages]
+    indices = np.array([i for i, passage_hashes in enumerate(hashes) if passage_hashes], dtype=np.int64)
+    if not len(indices):
+        return indices, np.zeros((0, NUM_PERMUTATIONS), dtype=np.uint64)
+
+    values = np.array([value for i in indices for value in hashes[i]], dtype=np.uint64)
+    lengths = np.array([len(hashes[i]) for i in indices], dtype=np.int64)
+    starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    signatures = np.empty((len(indices), NUM_PERMUTATIONS), dtype=np.uint64)
+    for first in range(0, NUM_PERMUTATIONS, PERMUTATION_BLOCK):
+        block = slice(first, first + PERMUTATION_BLOCK)
+        permuted = (PERMUTATION_A[block, None] * values[None, :] + PERMUTATION_B[block, None]) % np.uint64(HASH_PRIME)
+        signatures[:, block] = np.minimum.reduceat(permuted, starts, axis=1).T
+    return indices, signatures
+
+
+def lsh_bands(threshold: float) -> int:
+    """
+    Returns the number of LSH bands of the signatures, so that pairs about as similar as the
+    threshold share a band with a high probability.
+    """
+    bands = [b for b in range(1, NUM_PERMUTATIONS + 1) if NUM_PERMUTATIONS % b == 0]
+    # The similarity at which a pair shares a band with probability about 1/2 is (1/b)^(1/r)
+    below = [b for b in bands if (1 / b) ** (b / NUM_PERMUTATIONS) <= threshold]
+    return min(below) if below else NUM_PERMUTATIONS
+
+
+def find_near_duplicates(
+        passages: Sequence[str],
+        threshold: float = 0.8,
+        shingle_size: int = 3,
+) -> np.ndarray:
+    """
+    Finds the passages that nearly repeat an earlier passage.
+
+    The Jaccard similarity of the word shingles of two passages is estimated from their
+    MinHash signatures, and only the pairs sharing an LSH band are compared, so the cost is
+    about linear in the number of passages.
+
+    Parameters
+    ----------
+    passages : Sequence[str]
+        The passages, in order.
+    threshold : float, optional
+        The estimated Jaccard similarity above which a passage is a duplicate, by default 0.8.
+    shingle_size : int, optional
+        The number of consecutive words of a shingle, by default 3.
+
+    Returns
+    -------
+    np.ndarray
+        Whether each passage is a near duplicate of an earlier one that was kept.
+    """
+    if not 0 < threshold <= 1:
+        raise ValueError("The similarity threshold must be in (0, 1], got {}".format(threshold))
+
+    duplicates = np.zeros(len(passages), dtype=bool)
+    indices, signatures = minhash_signatures(passages, shingle_size)
+    num_bands = lsh_bands(threshold)
+    rows = NUM_PERMUTATIONS // num_bands
+    buckets: Dict[Tuple[int, bytes], List[int]] = {}
+    for row, signature in enumerate(signatures):
+        keys = [(band, signature[band * rows:(band + 1) * rows].tobytes()) for band in range(num_bands)]
+        candidates = {kept for key in keys for kept in buckets.get(key, [])}
+        if candidates:
+            candidates = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+            if np.mean(signatures[candidates] == signature, axis=1).max() >= threshold:
+                duplicates[indices[row]] = True
+                continue
+        for key in keys:
+            buckets.setdefault(key, []).append(row)
+    return duplicates
+
+
+def deduplicate_passages(
+        passages: Sequence[str],
+        token_counts: Sequence[int],
+        threshold: float = 0.8,
+        shingle_size: int = 3,
+) -> Tuple[List[int], Dict[str, int]]:
+    """
+    Drops the passages that nearly repeat an earlier one.
+
+    Parameters
+    ----------
+    passages : Sequence[str]
+        The passages, in order.
+    token_counts : Sequence[int]
+        The number of tokens of each passage.
+    threshold : float, optional
+        The estimated Jaccard similarity above which a passage is a duplicate, by default 0.8.
+    shingle_size : int, optional
+        The number of consecutive words of a shingle, by default 3.
+
+    Returns
+    -------
+    Tuple[List[int], Dict[str, int]]
+        The indices of the kept passages, and the number of passages and tokens removed.
+    """
+    duplicates = find_near_duplicates(passages, threshold, shingle_size)
+    token_counts = np.asarray(token_counts, dtype=np.int64)
+    return np.flatnonzero(~duplicates).tolist(), {"passages_removed": int(duplicates.sum()),
+                                                  "tokens_removed": int(token_counts[duplicates].sum())}
+
+
+def deduplicate_summaries(
+        summaries: Sequence[str],
+        count_tokens: Callable[[str], int],
+        threshold: float = 0.8,
+        shingle_size: int = 3,
+) -> Tuple[List[str], Dict[str, int]]:
+    """
+    Removes the lines of the partial summaries that nearly repeat a line of an earlier
+    summary or of the same one, e.g. the same agenda item summarized from every chunk.
+
+    Parameters
+    ----------
+    summaries : Sequence[str]
+        The partial summaries, in order.
+    count_tokens : Callable[[str], int]
+        The function counting the tokens of a line.
+    threshold : float, optional
+        The estimated Jaccard similarity above which a line is a duplicate, by default 0.8.
+    shingle_size : int, optional
+        The number of consecutive words of a shingle, by default 3.
+
+    Returns
+    -------
+    Tuple[List[str], Dict[str, int]]
+        The summaries without the repeated lines, and the number of lines and tokens removed.
+    """
+    lines = [(i, line) for i, summary in enumerate(summaries) for line in summary.split("\n")]
+    duplicates = find_near_duplicates([line for _, line in lines], threshold, shingle_size)
+    kept: List[List[str]] = [[] for _ in summaries]
+    tokens_removed = 0
+    for (i, line), duplicate in zip(lines, duplicates):
+        if duplicate:
+            tokens_removed += count_tokens(line)
+        else:
+            kept[i].append(line)
+    return ["\n".join(summary_lines) for summary_lines in kept], {"passages_removed": int(duplicates.sum()),
+                                                                  "tokens_removed": tokens_removed}
@@ -0,0 +1,165 @@
+import re
+from typing import Callable, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from transcript_store.transcript_store import SEGMENT_PATTERN
+
+WORD_PATTERN = re.compile(r"\w+")
+
+# Sentences with fewer distinct words, e.g. "Yeah, okay.", are scored down proportionally
+MIN_CONTENT_WORDS = 5
+
+
+def split_sentences(text: str) -> List[str]:
+    """
+    Splits a transcript into sentences and speaker turns.
+
+    Each sentence runs up to the next one, white space included, so the sentences
+    concatenated give back the text.
+
+    Parameters
+    ----------
+    text : str
+        The transcript.
+
+    Returns
+    -------
+    List[str]
+        The sentences, in order.
+    """
+    boundaries = [match.start() for match in SEGMENT_PATTERN.finditer(text) if match.group().strip()]
+    if not boundaries:
+        return [text] if text else []
+    boundaries[0] = 0
+    boundaries.append(len(text))
+    return [text[start:end] for start, end in zip(boundaries, boundaries[1:])]
+
+
+def score_sentences(sentences: Sequence[str]) -> np.ndarray:
+    """
+    Scores the sentences by their TF-IDF centrality: the mean cosine similarity of a sentence
+    to the other sentences of the transcript.
+
+    The TF-IDF matrix is kept as sparse coordinates, and the similarities to every other
+    sentence are summed through the centroid of the rows, so the cost is linear in the length
+    of the transcript. A repeated sentence only scores once, at its first occurrence.
+
+    Parameters
+    ----------
+    sentences : Sequence[str]
+        The sentences of the transcript.
+
+    Returns
+    -------
+    np.ndarray
+        The score of each sentence, as float64; -inf for the sentences without words and the
+        repetitions.
+    """
+    num_sentences = len(sentences)
+    words = [WORD_PATTERN.findall(sentence.lower()) for sentence in sentences]
+    lengths = np.array([len(sentence_words) for sentence_words in words], dtype=np.int64)
+    scores = np.full(num_sentences, -np.inf)
+    if not lengths.sum():
+        return scores
+
+    vocabulary, columns = np.unique(np.array([word for sentence_words in words for word in sentence_words]),
+                                    return_inverse=True)
+    rows = np.repeat(np.arange(num_sentences), lengths)
+    # One entry per (sentence, word), with the number of occurrences
+    pairs, term_counts = np.unique(rows * len(vocabulary) + columns.ravel(), return_counts=True)
+    rows, columns = pairs // len(vocabulary), pairs % len(vocabulary)
+
+    document_frequency = np.bincount(columns, minlength=len(vocabulary))
+    idf = np.log((1 + num_sentences) / (1 + document_frequency)) + 1
+    weights = (1 + np.log(term_counts)) * idf[columns]
+    norms = np.sqrt(np.bincount(rows, weights=weights * weights, minlength=num_sentences))
+    weights /= norms[rows]
+
+    # Row i of X.X^T summed over the columns is x_i.sum_j(x_j), minus 1 for x_i.x_i
+    centroid = np.bincount(columns, weights=weights, minlength=len(vocabulary))
+    similarity = np.bincount(rows, weights=weights * centroid[columns], minlength=num_sentences) - 1
+    distinct_words = np.bincount(rows, minlength=num_sentences)
+    centrality = similarity / max(num_sentences - 1, 1) * np.minimum(1.0, distinct_words / MIN_CONTENT_WORDS)
+
+    seen = set()
+    for i, sentence_words in enumerate(words):
+        key = " ".join(sentence_words)
+        if key and key not in seen:
+            scores[i] = centrality[i]
+            seen.add(key)
+    return scores
+
+
+def reduce_sentences(
+        sentences: Sequence[str],
+        token_counts: Sequence[int],
+        compression_ratio: float,
+) -> Tuple[List[int], Dict[str, int]]:
+    """
+    Keeps the most central sentences of a transcript that fit in a fraction of its tokens.
+
+    Parameters
+    ----------
+    sentences : Sequence[str]
+        The sentences of the transcript, see split_sentences.
+    token_counts : Sequence[int]
+        The number of tokens of each sentence.
+    compression_ratio : float
+        The fraction of the tokens to keep, between 0 and 1.
+
+    Returns
+    -------
+    Tuple[List[int], Dict[str, int]]
+        The indices of the kept sentences in transcript order, and the number of tokens and
+        sentences before and after the reduction, and the tokens saved.
+    """
+    if not 0 < compression_ratio <= 1:
+        raise ValueError("The compression ratio must be in (0, 1], got {}".format(compression_ratio))
+
+    token_counts = np.asarray(token_counts, dtype=np.int64)
+    total_tokens = int(token_counts.sum())
+    if compression_ratio == 1 or not len(sentences):
+        kept = np.arange(len(sentences))
+    else:
+        scores = score_sentences(sentences)
+        # Best first, the sentences without words and the repetitions last
+        order = np.argsort(-scores, kind="stable")
+        order = order[np.isfinite(scores[order])]
+        fits = np.cumsum(token_counts[order]) <= compression_ratio * total_tokens
+        kept = np.sort(order[fits] if fits.any() else order[:1])
+
+    tokens_after = int(token_counts[kept].sum())
+    return kept.tolist(), {"tokens_before": total_tokens,
+                           "tokens_after": tokens_after,
+                           "tokens_saved": total_tokens - tokens_after,
+                           "sentences_before": len(sentences),
+                           "sentences_after": len(kept)}
+
+
+def reduce_transcript(
+        text: str,
+        compression_ratio: float,
+        count_tokens: Callable[[str], int],
+) -> Tuple[str, Dict[str, int]]:
+    """
+    Removes the least informative sentences of a transcript before it is summarized, e.g.
+    filler, repetitions and small talk.
+
+    Parameters
+    ----------
+    text : str
+        The transcript.
+    compression_ratio : float
+        The fraction of the tokens to keep, between 0 and 1.
+    count_tokens : Callable[[str], int]
+        The function counting the tokens of a sentence.
+
+    Returns
+    -------
+    Tuple[str, Dict[str, int]]
+        The reduced transcript and its statistics, see reduce_sentences.
+    """
+    sentences = split_sentences(text)
+    kept, stats = reduce_sentences(sentences, [count_tokens(sentence) for sentence in sentences], compression_ratio)
+    return "".join(sentences[i] for i in kept), stats
@@ -1,69 +1,146 @@
-import openai
-from typing import Optional, List, Dict
+from typing import TYPE_CHECKING, Callable, Optional, List, Dict, Tuple
 
-from meeting_summarizer.utils import create_messages_from_transcripts
-from openai_api_interaction import OpenAICompletionAPI
+from meeting_summarizer.utils import (count_tokens, create_messages_from_pieces, create_messages_from_segments,
+                                      create_messages_from_transcripts)
+from openai_api_interaction import OpenAICompletionAPI, create_chat_completion, get_openai_client
+from run_manifest import RunManifest
+from tracing import span
+
+if TYPE_CHECKING:
+    from transcript_store import TranscriptSegments
 
 
 def summarize_transcription(
         transcriptions: str,
         config: OpenAICompletionAPI,
+        manifest: Optional[RunManifest] = None,
+        on_token: Optional[Callable[[str], None]] = None,
+        segments: Optional["TranscriptSegments"] = None,
 ) -> str:
     """
     Summarizes the meeting transcription using OpenAI's GPT-4o model.
 
+    With ``config.compression_ratio`` or ``config.dedup_threshold`` set, the transcription is
+    reduced before it is summarized, see reduce_transcription, and the kept segments are
+    chunked from their cached token counts.
+
     Parameters
     ----------
     transcriptions : str
         The meeting transcription.
     config : OpenAICompletionAPI
         The configuration for the OpenAI Completion API.
+    manifest : RunManifest, optional
+        The checkpoint manifest of the run, by default None. Chunks summarized by an
+        interrupted run are not summarized again.
+    on_token : Callable[[str], None], optional
+        A function called with the summary text as it is generated, by default None. The
+        completions are streamed if ``config.stream`` is set.
+    segments : TranscriptSegments, optional
+        The structured transcript of the transcription, by default None. When its tokens were
+        counted for ``config.model``, the transcription is chunked from its cached token
+        counts instead of being tokenized again.
 
     Returns
     -------
     str
         The generated meeting summary.
     """
-    # Set up the OpenAI API client
-    client = openai.OpenAI(api_key=config.api_key)
+    # Get the shared OpenAI API client
+    client = get_openai_client(config)
 
     # Create the messages
-    messages = create_messages_from_transcripts(
-        transcriptions=transcriptions,
-        model=config.model,
-        num_token_completion=config.max_tokens
-    )
-
-    if len(messages) < 20:
-        response = client.chat.completions.create(
+    if config.compression_ratio is not None or config.dedup_threshold is not None:
+        # The kept sentences are chunked from the token counts of the reduction
+        sentences, token_counts = reduce_transcription(transcriptions, config, segments)
+        messages = create_messages_from_pieces(sentences, token_counts, config.model,
+                                               num_token_completion=config.max_tokens)
+    elif segments is not None and len(segments) and segments.model == config.model:
+        messages = create_messages_from_segments(segments, num_token_completion=config.max_tokens)
+    else:
+        messages = create_messages_from_transcripts(
+            transcriptions=transcriptions,
             model=config.model,
-            messages=messages,
-            max_tokens=config.max_tokens,
-            temperature=config.temperature,
-            top_p=config.top_p,
-            n=config.n,
-            presence_penalty=config.presence_penalty,
-            frequency_penalty=config.frequency_penalty,
+            num_token_completion=config.max_tokens
         )
-        summary = [choice["message"]["content"].strip() for choice in response.choices]
-        summary = "".join(summary)
-        return summary
 
+    # Each chunk fills the context of the model, so it is summarized in its own request
+    system_message, chunk_messages = messages[0], messages[1:]
+    # The chunks of a reduced transcription differ with the reduction
+    reduction = (config.compression_ratio, config.dedup_threshold)
+    stage = "summary" if reduction == (None, None) else "summary_{}_{}".format(*reduction)
+    responses = []
+    for i, message in enumerate(chunk_messages):
+        if on_token is not None and i > 0:
+            on_token("\n")
+        summary = manifest.chunk_result(stage, i) if manifest is not None else None
+        if summary is None:
+            summary = "".join(create_chat_completion(client, config, [system_message, message], on_token))
+            if manifest is not None:
+                manifest.save_chunk_result(stage, i, summary)
+        elif on_token is not None:
+            on_token(summary)
+        responses.append(summary)
+    summary = "\n".join(responses)
+    return summary
+
+
+def reduce_transcription(
+        transcriptions: str,
+        config: OpenAICompletionAPI,
+        segments: Optional["TranscriptSegments"] = None,
+) -> Tuple[List[str], List[int]]:
+    """
+    Removes the sentences of the transcription that nearly repeat an earlier one, with
+    ``config.dedup_threshold`` set, and keeps the most central of the others within
+    ``config.compression_ratio`` of its tokens, with it set. The tokens saved are printed.
+
+    Parameters
+    ----------
+    transcriptions : str
+        The meeting transcription.
+    config : OpenAICompletionAPI
+        The configuration for the OpenAI Completion API.
+    segments : TranscriptSegments, optional
+        The structured transcript of the transcription, by default None. When its tokens were
+        counted for ``config.model``, its segments and token counts are used instead of
+        splitting and tokenizing the transcription again.
+
+    Returns
+    -------
+    Tuple[List[str], List[int]]
+        The kept sentences, which concatenated give the reduced transcription, and their
+        number of tokens.
+    """
+    # numpy is only loaded by the runs that reduce their transcripts
+    from meeting_summarizer.dedup import deduplicate_passages
+    from meeting_summarizer.extractive import reduce_sentences, split_sentences
+
+    if segments is not None and len(segments) and segments.model == config.model:
+        sentences = [segments.segment_text(i, i + 1) for i in range(len(segments))]
+        token_counts = segments.tokens.tolist()
     else:
-        responses = []
-        for i in range(0, len(messages), 20):
-            response = client.chat.completions.create(
-                model=config.model,
-                messages=messages[i:i + 20],
-                max_tokens=config.max_tokens,
-                temperature=config.temperature,
-                top_p=config.top_p,
-                n=config.n,
-                stop=config.stop,
-                presence_penalty=config.presence_penalty,
-                frequency_penalty=config.frequency_penalty,
-            )
-            summary = [choice["message"]["content"].strip() for choice in response.choices]
-            responses += summary
-        summary = "".join(responses)
-        return summary
+        sentences = split_sentences(transcriptions)
+        token_counts = [count_tokens(sentence, config.model) for sentence in sentences]
+
+    if config.dedup_threshold is not None:
+        with span("dedup", threshold=config.dedup_threshold) as dedup_span:
+            kept, stats = deduplicate_passages(sentences, token_counts, config.dedup_threshold,
+                                               config.dedup_shingle_size)
+            for key, value in stats.items():
+                dedup_span.set(key, value)
+        print("Deduplication: removed {} repeated sentences, {} tokens".format(
+            stats["passages_removed"], stats["tokens_removed"]))
+        sentences = [sentences[i] for i in kept]
+        token_counts = [token_counts[i] for i in kept]
+
+    if config.compression_ratio is None:
+        return sentences, token_counts
+    with span("extractive", compression_ratio=config.compression_ratio) as extractive_span:
+        kept, stats = reduce_sentences(sentences, token_counts, config.compression_ratio)
+        for key, value in stats.items():
+            extractive_span.set(key, value)
+    print("Extractive reduction: {} -> {} tokens ({} saved, {:.0%}), {} -> {} sentences".format(
+        stats["tokens_before"], stats["tokens_after"], stats["tokens_saved"],
+        stats["tokens_saved"] / max(stats["tokens_before"], 1), stats["sentences_before"], stats["sentences_after"]))
+    return [sentences[i] for i in kept], [token_counts[i] for i in kept]
@@ -1,6 +1,61 @@
-from typing import List, Dict
+import bisect
+import functools
+import re
+from typing import TYPE_CHECKING, List, Dict
 
-import tiktoken
+if TYPE_CHECKING:
+    import tiktoken
+
+    from transcript_store import TranscriptSegments
+
+TOKEN_LIMIT_PER_MODEL = {"text-davinci-003": 4000,
+                         "text-davinci-002": 4000,
+                         "davinci": 2000,
+                         "text-curie-001": 2000,
+                         "curie": 2000,
+                         "text-babbage-001": 2000,
+                         "babbage": 2000,
+                         "text-ada-001": 2000,
+                         "ada": 2000,
+                         "gpt-4o": 128000,
+                         }
+
+SYSTEM_PROMPT = "You are a helpful assistant. Please summarize the following meeting points:"
+
+# Tokens added by the chat format around each message
+TOKENS_PER_MESSAGE = 4
+
+# Chunks are cut after a sentence or before a new line (speaker turn), when one falls in the
+# last part of the token budget
+BOUNDARY_PATTERN = re.compile(rb"[.!?][\"')\]]*(?=\s)|\n+")
+MIN_CHUNK_FILL = 0.5
+
+
+@functools.lru_cache(maxsize=None)
+def get_encoding(model: str) -> "tiktoken.Encoding":
+    """
+    Returns the tokenizer of a model, loaded once per model on first use.
+
+    Parameters
+    ----------
+    model : str
+        The model to use.
+
+    Returns
+    -------
+    tiktoken.Encoding
+        The tokenizer.
+    """
+    import tiktoken
+
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        # Models newer than the installed tiktoken
+        try:
+            return tiktoken.get_encoding("o200k_base")
+        except ValueError:
+            return tiktoken.get_encoding("cl100k_base")
 
 
 def count_tokens(text: str,
@@ -19,16 +74,82 @@ def count_tokens(text: str,
     int
         The number of tokens.
     """
-    # Load an encoder for the model
-    encoding = tiktoken.encoding_for_model(model)
-
     # turn the text into a list of tokens
-    tokens = encoding.encode(text)
+    tokens = get_encoding(model).encode_ordinary(text)
     num_tokens = len(tokens)
 
     return num_tokens
 
 
+def split_text_by_tokens(
+        text: str,
+        model: str,
+        max_tokens: int,
+) -> List[str]:
+    """
+    Splits a text into chunks of at most max_tokens tokens, encoding it only once.
+
+    Each chunk is cut at the last sentence end or speaker turn that fits in the budget, as long
+    as the chunk is at least half full; otherwise it is cut at the token limit.
+
+    Parameters
+    ----------
+    text : str
+        The text to split.
+    model : str
+        The model from OpenAI to use.
+    max_tokens : int
+        The maximum number of tokens of a chunk.
+
+    Returns
+    -------
+    List[str]
+        The chunks, which concatenated give back the text.
+    """
+    if max_tokens < 1:
+        raise ValueError("The token budget of a chunk must be positive, got {}".format(max_tokens))
+
+    encoding = get_encoding(model)
+    text_bytes = text.encode("utf-8")
+    tokens = encoding.encode_ordinary(text)
+
+    # byte offset at which each token starts, plus the end of the text
+    token_offsets = [0]
+    for token_bytes in encoding.decode_tokens_bytes(tokens):
+        token_offsets.append(token_offsets[-1] + len(token_bytes))
+
+    # token index right after each boundary
+    boundaries = sorted({bisect.bisect_left(token_offsets, match.end())
+                         for match in BOUNDARY_PATTERN.finditer(text_bytes)})
+
+    chunks = []
+    start = 0
+    while start < len(tokens):
+        end = min(start + max_tokens, len(tokens))
+        if end < len(tokens):
+            boundary = bisect.bisect_right(boundaries, end) - 1
+            if boundary >= 0 and boundaries[boundary] >= start + max_tokens * MIN_CHUNK_FILL:
+                end = boundaries[boundary]
+        start_byte, end_byte = token_offsets[start], token_offsets[end]
+        # a token can end inside a multi-byte character, move the cut to the character start
+        while end < len(tokens) and end_byte > start_byte and text_bytes[end_byte] & 0xC0 == 0x80:
+            end_byte -= 1
+        chunks.append(text_bytes[start_byte:end_byte].decode("utf-8"))
+        start = end
+        token_offsets[start] = end_byte
+
+    return chunks or [text]
+
+
+def transcript_token_budget(model: str, num_token_completion: int) -> int:
+    """
+    Returns the number of transcript tokens of a chunk: the context of the model, minus the
+    completion, the system prompt and the chat format.
+    """
+    return (TOKEN_LIMIT_PER_MODEL[model] - num_token_completion - count_tokens(SYSTEM_PROMPT, model)
+            - 2 * TOKENS_PER_MESSAGE)
+
+
 def create_messages_from_transcripts(
         transcriptions: str,
         model: str,
@@ -36,6 +157,9 @@ def create_messages_from_transcripts(
 ) -> List[Dict[str, str]]:
     """
     Adds chunks of the meeting transcription to the GPT-4 messages.
+
+    Each chunk fills the context of the model, minus the completion and the system prompt.
+
     Parameters
     ----------
     transcriptions : str
@@ -50,31 +174,105 @@ def create_messages_from_transcripts(
     List[Dict[str, str]]
         The GPT-4 messages.
     """
-    token_limit_per_model = {"text-davinci-003": 4000,
-                             "text-davinci-002": 4000,
-                             "davinci": 2000,
-                             "text-curie-001": 2000,
-                             "curie": 2000,
-                             "text-babbage-001": 2000,
-                             "babbage": 2000,
-                             "text-ada-001": 2000,
-                             "ada": 2000,
-                             "gpt-4o": 128000,
-                             }
-
-    token_limit = token_limit_per_model[model]
-    num_tokens_in_transcriptions = count_tokens(text=transcriptions, model=model)
-    num_tokens_without_transcription = num_token_completion
-    num_token_left = token_limit - num_tokens_without_transcription
-    number_of_chunks = num_tokens_in_transcriptions // num_token_left + 1
-
-    list_of_messages = [{"role": "system", "content": "You are a helpful assistant. Please summarize the following meeting points:"}]
-
-    for i in range(number_of_chunks):
-        start = i * num_token_left
-        end = (i + 1) * num_token_left
-        chunk = transcriptions[start:end]
+    num_token_left = transcript_token_budget(model, num_token_completion)
+
+    list_of_messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+
+    for chunk in split_text_by_tokens(transcriptions, model, num_token_left):
         message = {"role": "user", "content": chunk}
         list_of_messages.append(message)
 
     return list_of_messages
+
+
+def create_messages_from_segments(
+        segments: "TranscriptSegments",
+        num_token_completion: int,
+) -> List[Dict[str, str]]:
+    """
+    Adds chunks of a structured transcript to the GPT-4 messages, like
+    create_messages_from_transcripts.
+
+    The chunks are cut between segments from their cached token counts, so the transcript is
+    not tokenized again; only a segment longer than a chunk is.
+
+    Parameters
+    ----------
+    segments : TranscriptSegments
+        The structured transcript, whose tokens were counted for the model.
+    num_token_completion : int
+        The number of tokens to use for the completion.
+
+    Returns
+    -------
+    List[Dict[str, str]]
+        The GPT-4 messages.
+    """
+    model = segments.model
+    num_token_left = transcript_token_budget(model, num_token_completion)
+
+    list_of_messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+
+    for first, last in segments.token_windows(num_token_left):
+        chunk = segments.segment_text(first, last)
+        if segments.token_offsets[last] - segments.token_offsets[first] > num_token_left:
+            chunks = split_text_by_tokens(chunk, model, num_token_left)
+        else:
+            chunks = [chunk]
+        for chunk in chunks:
+            list_of_messages.append({"role": "user", "content": chunk})
+
+    return list_of_messages
+
+
+def create_messages_from_pieces(
+        pieces: List[str],
+        token_counts: List[int],
+        model: str,
+        num_token_completion: int,
+) -> List[Dict[str, str]]:
+    """
+    Adds chunks of consecutive pieces of a transcript, e.g. the sentences kept by
+    reduce_transcription, to the GPT-4 messages, like create_messages_from_transcripts.
+
+    The chunks are cut between pieces from their token counts, so the pieces are not tokenized
+    again; only a piece longer than a chunk is.
+
+    Parameters
+    ----------
+    pieces : List[str]
+        The pieces of the transcript, in order.
+    token_counts : List[int]
+        The number of tokens of each piece for the model.
+    model : str
+        The model from OpenAI to use.
+    num_token_completion : int
+        The number of tokens to use for the completion.
+
+    Returns
+    -------
+    List[Dict[str, str]]
+        The GPT-4 messages.
+    """
+    num_token_left = transcript_token_budget(model, num_token_completion)
+
+    list_of_messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+
+    def add_chunk(chunk_pieces: List[str], chunk_tokens: int) -> None:
+        chunk = "".join(chunk_pieces)
+        chunks = split_text_by_tokens(chunk, model, num_token_left) if chunk_tokens > num_token_left else [chunk]
+        for chunk in chunks:
+            list_of_messages.append({"role": "user", "content": chunk})
+
+    chunk_pieces: List[str] = []
+    chunk_tokens = 0
+    for piece, piece_tokens in zip(pieces, token_counts):
+        if chunk_pieces and chunk_tokens + piece_tokens > num_token_left:
+            add_chunk(chunk_pieces, chunk_tokens)
+            chunk_pieces, chunk_tokens = [], 0
+        chunk_pieces.append(piece)
+        chunk_tokens += int(piece_tokens)
+    if chunk_pieces:
+        add_chunk(chunk_pieces, chunk_tokens)
+
+    return list_of_messages
@@ -1,2 +1,4 @@
 from .openai_api_interaction import OpenAIAudioAPI
 from .openai_api_interaction import OpenAICompletionAPI
+from .chat_completion import create_chat_completion
+from .client import get_openai_client
@@ -0,0 +1,162 @@
+import hashlib
+import json
+from typing import Callable, Dict, List, Optional
+
+import openai
+
+from openai_api_interaction.openai_api_interaction import OpenAICompletionAPI
+from rate_limiter import get_rate_limiter
+from response_cache import get_cache
+from tracing import span
+
+
+def completion_cache_key(
+        config: OpenAICompletionAPI,
+        messages: List[Dict[str, str]],
+) -> str:
+    """
+    Returns the cache key of a chat completion request.
+
+    Parameters
+    ----------
+    config : OpenAICompletionAPI
+        The configuration for the OpenAI Completion API.
+    messages : List[Dict[str, str]]
+        The messages sent to the model.
+
+    Returns
+    -------
+    str
+        The cache key.
+    """
+    request = json.dumps({
+        "model": config.model,
+        "messages": messages,
+        "max_tokens": config.max_tokens,
+        "temperature": config.temperature,
+        "top_p": config.top_p,
+        "n": config.n,
+        "presence_penalty": config.presence_penalty,
+        "frequency_penalty": config.frequency_penalty,
+    }, sort_keys=True, ensure_ascii=False)
+    return "completion:" + hashlib.sha256(request.encode("utf-8")).hexdigest()
+
+
+def estimate_request_tokens(
+        config: OpenAICompletionAPI,
+        messages: List[Dict[str, str]],
+) -> int:
+    """
+    Estimates the number of tokens a chat completion request counts against the token quota:
+    the tokens of the messages plus the maximum number of tokens of the completions.
+
+    Parameters
+    ----------
+    config : OpenAICompletionAPI
+        The configuration for the OpenAI Completion API.
+    messages : List[Dict[str, str]]
+        The messages sent to the model.
+
+    Returns
+    -------
+    int
+        The estimated number of tokens.
+    """
+    # Imported here since meeting_summarizer depends on this package
+    from meeting_summarizer.utils import TOKENS_PER_MESSAGE, count_tokens
+
+    prompt_tokens = sum(count_tokens(message["content"], config.model) + TOKENS_PER_MESSAGE
+                        for message in messages)
+    return prompt_tokens + config.max_tokens * (config.n or 1)
+
+
+def create_chat_completion(
+        client: openai.OpenAI,
+        config: OpenAICompletionAPI,
+        messages: List[Dict[str, str]],
+        on_token: Optional[Callable[[str], None]] = None,
+) -> List[str]:
+    """
+    Sends a chat completion request and returns the content of each choice.
+
+    If ``config.cache_dir`` is set, the response of an identical earlier request is served
+    from the cache instead. The request waits for the rate limiter of the model and is
+    retried on transient errors. If ``config.stream`` is set and on_token is given, the text of
+    the first choice is passed to on_token piece by piece as the model generates it;
+    otherwise on_token receives the whole text at once.
+
+    Parameters
+    ----------
+    client : openai.OpenAI
+        The OpenAI API client.
+    config : OpenAICompletionAPI
+        The configuration for the OpenAI Completion API.
+    messages : List[Dict[str, str]]
+        The messages sent to the model.
+    on_token : Callable[[str], None], optional
+        A function called with the generated text as it arrives, by default None.
+
+    Returns
+    -------
+    List[str]
+        The stripped content of each choice.
+    """
+    with span("completion", model=config.model, stream=bool(config.stream and on_token is not None)) as completion_span:
+        cache = None
+        if config.cache_dir is not None:
+            cache = get_cache(config.cache_dir, config.cache_max_size)
+            cache_key = completion_cache_key(config, messages)
+            cached = cache.get(cache_key)
+            if cached is not None:
+                completion_span.set("cache_hits", 1)
+                contents = json.loads(cached)
+                if on_token is not None:
+                    on_token(contents[0])
+                return contents
+
+        parameters = dict(
+            model=config.model,
+            messages=messages,
+            max_tokens=config.max_tokens,
+            temperature=config.temperature,
+            top_p=config.top_p,
+            n=config.n,
+            presence_penalty=config.presence_penalty,
+            frequency_penalty=config.frequency_penalty,
+        )
+        limiter = get_rate_limiter(config.model, config.requests_per_minute, config.tokens_per_minute)
+        tokens = estimate_request_tokens(config, messages) if config.tokens_per_minute else 0
+        if config.stream and on_token is not None and config.n == 1:
+            parts = []
+            usage = None
+            # The usage of a streamed completion comes in a last chunk without choices
+            stream = limiter.call(lambda: client.chat.completions.create(
+                stream=True, stream_options={"include_usage": True}, **parameters), tokens, config.max_retries)
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    parts.append(chunk.choices[0].delta.content)
+                    on_token(parts[-1])
+                if isinstance(getattr(getattr(chunk, "usage", None), "completion_tokens", None), int):
+                    usage = chunk.usage
+            contents = ["".join(parts).strip()]
+            if usage is not None:
+                completion_span.set("prompt_tokens", usage.prompt_tokens)
+                completion_span.set("completion_tokens", usage.completion_tokens)
+            else:
+                # APIs compatible with OpenAI may not report the usage of a stream
+                from meeting_summarizer.utils import count_tokens
+
+                completion_span.set("completion_tokens", count_tokens("".join(parts), config.model))
+        else:
+            response = limiter.call(lambda: client.chat.completions.create(**parameters), tokens, config.max_retries)
+            contents = [choice.message.content.strip() for choice in response.choices]
+            usage = getattr(response, "usage", None)
+            if isinstance(getattr(usage, "prompt_tokens", None), int):
+                completion_span.set("prompt_tokens", usage.prompt_tokens)
+                completion_span.set("completion_tokens", usage.completion_tokens)
+            if on_token is not None:
+                on_token(contents[0])
+
+        if cache is not None:
+            cache.set(cache_key, json.dumps(contents, ensure_ascii=False), ttl=config.cache_ttl)
+        return contents
@@ -0,0 +1,48 @@
+import threading
+from typing import Dict, Optional, Tuple, Union
+
+import httpx
+import openai
+
+from openai_api_interaction.openai_api_interaction import OpenAIAudioAPI, OpenAICompletionAPI
+
+# Connections kept open per client, enough for the concurrent transcriptions and completions
+MAX_CONNECTIONS = 32
+KEEPALIVE_EXPIRY = 60.0
+
+_clients: Dict[Tuple[str, Optional[str], Optional[float]], openai.OpenAI] = {}
+_clients_lock = threading.Lock()
+
+
+def get_openai_client(config: Union[OpenAIAudioAPI, OpenAICompletionAPI]) -> openai.OpenAI:
+    """
+    Returns the OpenAI API client of a configuration, shared by every caller in the process.
+
+    The client keeps its HTTP connections alive in a pool, so the TLS handshake is done once
+    per connection rather than once per request. Retries are left to the rate limiter.
+
+    Parameters
+    ----------
+    config : Union[OpenAIAudioAPI, OpenAICompletionAPI]
+        The configuration of the API, whose api_key, base_url and timeout select the client.
+
+    Returns
+    -------
+    openai.OpenAI
+        The OpenAI API client.
+    """
+    key = (config.api_key, config.base_url, config.timeout)
+    with _clients_lock:
+        if key not in _clients:
+            http_client = httpx.Client(
+                timeout=config.timeout,
+                limits=httpx.Limits(max_connections=MAX_CONNECTIONS,
+                                    max_keepalive_connections=MAX_CONNECTIONS,
+                                    keepalive_expiry=KEEPALIVE_EXPIRY),
+            )
+            _clients[key] = openai.OpenAI(api_key=config.api_key,
+                                          base_url=config.base_url,
+                                          timeout=config.timeout,
+                                          max_retries=0,
+                                          http_client=http_client)
+        return _clients[key]
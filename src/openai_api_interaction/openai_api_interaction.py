@@ -25,6 +25,53 @@ class OpenAIAudioAPI:
         The temperature to use for transcription, by default 0.0
     language : Optional[str], optional
         The language to use for transcription, by default "en"
+    max_workers : Optional[int], optional
+        The maximum number of audio chunks transcribed concurrently, by default 4
+    max_retries : Optional[int], optional
+        The number of times a failed chunk is retried before giving up, by default 3
+    silence_aligned : Optional[bool], optional
+        Whether to cut long audio files in pauses rather than at fixed sizes, by default False
+    chunk_overlap : Optional[float], optional
+        The overlap in seconds between silence-aligned chunks, by default 0.0
+    cache_dir : Optional[str], optional
+        The folder of the transcription cache, by default None (no caching)
+    cache_max_size : Optional[int], optional
+        The maximum size of the transcription cache in bytes, by default 512MB
+    requests_per_minute : Optional[float], optional
+        The request quota of the model, by default None (unlimited)
+    base_url : Optional[str], optional
+        The URL of the API, by default None (the OpenAI API)
+    timeout : Optional[float], optional
+        The timeout of a request in seconds, by default 600.0
+    backend : Optional[str], optional
+        The transcription backend: "openai" (the hosted API), "local" (faster-whisper on the
+        CPU) or "auto" (the one with the best measured throughput), by default "openai"
+    local_model : Optional[str], optional
+        The Whisper model of the local backend, by default "small"
+    local_compute_type : Optional[str], optional
+        The weight quantization of the local backend, by default "int8"
+    local_workers : Optional[int], optional
+        The number of chunks transcribed concurrently by the local backend, by default None
+        (a quarter of the CPUs)
+    upload_codec : Optional[str], optional
+        The codec the audio is encoded to before it is uploaded: "opus", "mp3" or None to
+        upload it as is, by default "opus"
+    upload_bit_rate : Optional[int], optional
+        The bit rate of the encoded audio in bits per second, by default 24000
+    upload_sample_rate : Optional[int], optional
+        The sample rate of the encoded audio in Hz, by default 16000
+    trim_silence : Optional[bool], optional
+        Whether to remove the long pauses of the audio before uploading it, by default False
+    min_silence : Optional[float], optional
+        The shortest pause removed in seconds, by default 2.0
+    timestamp_map_path : Optional[str], optional
+        The path of a JSON file mapping the positions in the trimmed audio to the original
+        recording, by default None (not written)
+    segments_path : Optional[str], optional
+        The folder of the structured transcript, with the times, chunks and token counts of
+        its segments, by default None (not written)
+    token_model : Optional[str], optional
+        The model whose tokenizer counts the tokens of the segments, by default "gpt-4o"
     """
     api_key: str
     file_path: str
@@ -34,6 +81,27 @@ class OpenAIAudioAPI:
     response_format: Optional[str] = "text"
     temperature: Optional[float] = 0.0
     language: Optional[str] = "en"
+    max_workers: Optional[int] = 4
+    max_retries: Optional[int] = 3
+    silence_aligned: Optional[bool] = False
+    chunk_overlap: Optional[float] = 0.0
+    cache_dir: Optional[str] = None
+    cache_max_size: Optional[int] = 512 * 1024 * 1024
+    requests_per_minute: Optional[float] = None
+    base_url: Optional[str] = None
+    timeout: Optional[float] = 600.0
+    backend: Optional[str] = "openai"
+    local_model: Optional[str] = "small"
+    local_compute_type: Optional[str] = "int8"
+    local_workers: Optional[int] = None
+    upload_codec: Optional[str] = "opus"
+    upload_bit_rate: Optional[int] = 24000
+    upload_sample_rate: Optional[int] = 16000
+    trim_silence: Optional[bool] = False
+    min_silence: Optional[float] = 2.0
+    timestamp_map_path: Optional[str] = None
+    segments_path: Optional[str] = None
+    token_model: Optional[str] = "gpt-4o"
 
 
 @dataclass
@@ -65,6 +133,36 @@ class OpenAICompletionAPI:
         The presence penalty to use for completion, by default 0.0
     frequency_penalty : Optional[float], optional
         The frequency penalty to use for completion, by default 0.0
+    cache_dir : Optional[str], optional
+        The folder of the completion cache, by default None (no caching)
+    cache_max_size : Optional[int], optional
+        The maximum size of the completion cache in bytes, by default 512MB
+    cache_ttl : Optional[float], optional
+        The time in seconds after which a cached completion expires, by default None (never)
+    max_workers : Optional[int], optional
+        The maximum number of completion requests sent concurrently, by default 4
+    merge_fan_in : Optional[int], optional
+        The maximum number of summaries merged by a single request, by default 8
+    max_retries : Optional[int], optional
+        The number of times a failed request is retried before giving up, by default 3
+    requests_per_minute : Optional[float], optional
+        The request quota of the model, by default None (unlimited)
+    tokens_per_minute : Optional[float], optional
+        The token quota of the model, by default None (unlimited)
+    base_url : Optional[str], optional
+        The URL of the API, by default None (the OpenAI API)
+    timeout : Optional[float], optional
+        The timeout of a request in seconds, by default 600.0
+    compression_ratio : Optional[float], optional
+        The fraction of the transcript tokens kept by the extractive reduction before the
+        transcript is summarized, by default None (no reduction)
+    dedup_threshold : Optional[float], optional
+        The estimated Jaccard similarity above which a transcript sentence or a line of a
+        partial summary that repeats an earlier one is removed before it is sent, by default
+        None (no deduplication)
+    dedup_shingle_size : Optional[int], optional
+        The number of consecutive words of the shingles compared by the deduplication, by
+        default 3
 
     Returns
     -------
@@ -82,3 +180,16 @@ class OpenAICompletionAPI:
     logprobs: Optional[int] = None
     presence_penalty: Optional[float] = 0.0
     frequency_penalty: Optional[float] = 0.0
+    cache_dir: Optional[str] = None
+    cache_max_size: Optional[int] = 512 * 1024 * 1024
+    cache_ttl: Optional[float] = None
+    max_workers: Optional[int] = 4
+    merge_fan_in: Optional[int] = 8
+    max_retries: Optional[int] = 3
+    requests_per_minute: Optional[float] = None
+    tokens_per_minute: Optional[float] = None
+    base_url: Optional[str] = None
+    timeout: Optional[float] = 600.0
+    compression_ratio: Optional[float] = None
+    dedup_threshold: Optional[float] = None
+    dedup_shingle_size: Optional[int] = 3
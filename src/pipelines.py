@@ -1,23 +1,136 @@
-from audio_extractor import extract_audio_from_video
+import asyncio
+import contextlib
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional
+
 from generate_meeting_summary import generate_meeting_summary
-from meeting_summarizer import summarize_transcription
+from meeting_summarizer import count_tokens, summarize_transcription
 from openai_api_interaction import OpenAIAudioAPI, OpenAICompletionAPI
-from speech_transcriber import transcribe_audio
+from rate_limiter import rate_limiter_stats
+from response_cache import get_cache
+from run_manifest import RunManifest, file_signature, open_run_manifest, text_signature
+from search_index import index_artifact
+from tracing import current_span, span, trace
 
 
 def save_text(text, output_path):
-    with open(output_path, "w", encoding='utf-8') as transcription_file:
-        transcription_file.write(text)
+    with span("write", path=output_path, bytes=len(text.encode("utf-8"))):
+        with open(output_path, "w", encoding='utf-8') as transcription_file:
+            transcription_file.write(text)
+    with span("index", path=output_path):
+        try:
+            index_artifact(output_path, text)
+        except sqlite3.Error as error:
+            # The artifact is written; the next search indexes it from the file
+            print(f"Warning: could not add {output_path} to the search index: {error}")
+
+
+def trace_run(project: str, name: str, metrics: bool = False):
+    """
+    Records the spans of a run to projects/<project>/traces/<name>_<time>.jsonl.
+
+    Parameters
+    ----------
+    project : str
+        The name of the project.
+    name : str
+        The name of the meeting.
+    metrics : bool, optional
+        Whether to also write the metrics of the run to a Prometheus text file next to the
+        trace, by default False.
+    """
+    trace_path = "projects/{}/traces/{}_{}.jsonl".format(project, name, time.strftime("%Y%m%d-%H%M%S"))
+    metrics_path = os.path.splitext(trace_path)[0] + ".prom" if metrics else None
+    return trace(trace_path, metrics_path)
+
+
+def segments_path(project: str, name: str) -> str:
+    """
+    Returns the folder of the structured transcript of a meeting.
+    """
+    return "projects/{}/transcriptions/transcription_{}.segments".format(project, name)
+
+
+def completion_cache_dir(project: str, cache_completions: bool) -> Optional[str]:
+    """
+    Returns the folder of the completion cache of a project, or None if completions are not
+    cached. Sampled completions are only reused when asked, since a cached one is served
+    forever instead of a new sample.
+    """
+    return "projects/{}/cache".format(project) if cache_completions else None
+
+
+@contextlib.contextmanager
+def stream_text(output_path: str, echo: bool = False) -> Iterator[Callable[[str], None]]:
+    """
+    Opens a text file to which generated text is written as it arrives, and optionally echoed
+    to stdout.
+
+    The time to the first token is recorded as the ``first_token_seconds`` attribute of the
+    enclosing span, and printed when the stream ends with echo.
+
+    Parameters
+    ----------
+    output_path : str
+        The path of the output file.
+    echo : bool, optional
+        Whether to also write the text to stdout, by default False. Runs sharing stdout, e.g.
+        in batch mode, would interleave their text.
+
+    Yields
+    ------
+    Callable[[str], None]
+        The function to call with each piece of text.
+    """
+    start = time.perf_counter()
+    first_token_time = None
+    # The tokens may arrive on another thread, where the span is not the current one
+    enclosing_span = current_span()
+    with open(output_path, "w", encoding='utf-8') as output_file:
+        def write(text: str) -> None:
+            nonlocal first_token_time
+            if first_token_time is None:
+                first_token_time = time.perf_counter() - start
+                if enclosing_span is not None:
+                    enclosing_span.set("first_token_seconds", first_token_time)
+            output_file.write(text)
+            output_file.flush()
+            if echo:
+                sys.stdout.write(text)
+                sys.stdout.flush()
+
+        yield write
+    if echo and first_token_time is not None:
+        print("\nTime to first token: {:.2f}s".format(first_token_time))
 
 
 def video_to_summary(
         project: str,
         video_name: str,
         api_key: str,
+        metrics: bool = False,
+        compression_ratio: Optional[float] = None,
+        echo: bool = False,
+        dedup_threshold: Optional[float] = None,
+        dedup_shingle_size: int = 3,
+        trim_silence: bool = False,
+        cache_completions: bool = False,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        transcription_backend: str = "openai",
 ) -> None:
     """
     Extracts audio from a video, transcribes the audio, and summarizes the meeting.
 
+    The progress is checkpointed in projects/<project>/manifests, so a run that was
+    interrupted resumes where it stopped. The stages are traced in projects/<project>/traces.
+
     Parameters
     ----------
     project : str
@@ -26,23 +139,75 @@ def video_to_summary(
         The name of the input video file.
     api_key : str
         The OpenAI API key.
+    metrics : bool, optional
+        Whether to write a Prometheus text file of the run metrics, by default False.
+    compression_ratio : float, optional
+        The fraction of the transcript tokens kept by the extractive reduction before
+        summarizing, by default None (the whole transcript is summarized).
+    echo : bool, optional
+        Whether to echo the summaries to stdout as they are generated, by default False.
+    dedup_threshold : float, optional
+        The similarity above which a transcript sentence or a summary line repeating an earlier
+        one is not sent, by default None (no deduplication).
+    dedup_shingle_size : int, optional
+        The number of consecutive words compared by the deduplication, by default 3.
+    trim_silence : bool, optional
+        Whether to remove the long pauses of the audio before transcribing it, by default
+        False.
+    cache_completions : bool, optional
+        Whether to serve identical completion requests from projects/<project>/cache, by
+        default False.
+    requests_per_minute : float, optional
+        The request quota of each model, by default None (unlimited).
+    tokens_per_minute : float, optional
+        The token quota of the completion model, by default None (unlimited).
+    transcription_backend : str, optional
+        The transcription backend: "openai", "local" (faster-whisper on the CPU) or "auto"
+        (the fastest one measured), by default "openai".
     """
-    # Step 1: Extract audio from the video
+    with trace_run(project, video_name.split(".")[0], metrics):
+        video_path = "projects/{}/videos/{}".format(project, video_name)
+        # The audio is extracted straight to the compact encoding it is uploaded in
+        audio_output_path = "projects/{}/audios/{}.ogg".format(project, video_name.split(".")[0])
+        manifest = open_run_manifest(project, video_name.split(".")[0], file_signature(video_path))
 
-    print(f"Extracting audio from: {video_name} ...")
-    video_path = "projects/{}/videos/{}".format(project, video_name)
-    audio_output_path = "projects/{}/audios/{}.wav".format(project, video_name.split(".")[0])
-    extract_audio_from_video(video_path, audio_output_path)
-    print(f"Audio extracted and saved to: {audio_output_path}")
+        # Step 1: Extract audio from the video
+        if manifest.stage_done("extraction") and os.path.exists(audio_output_path):
+            print(f"Resuming: audio already extracted to {audio_output_path}")
+        else:
+            # moviepy and the media tools are only loaded by the runs that start from a video
+            from audio_extractor import extract_audio_from_video
 
-    # Step 2: Transcribe the audio and summarize the meeting
-    audio_to_summary(project, audio_output_path, api_key)
+            print(f"Extracting audio from: {video_name} ...")
+            with span("extraction", video=video_name) as extraction_span:
+                extract_audio_from_video(video_path, audio_output_path, bit_rate=OpenAIAudioAPI.upload_bit_rate)
+                extraction_span.set("bytes", os.path.getsize(audio_output_path))
+            manifest.complete_stage("extraction", audio_path=audio_output_path)
+            print(f"Audio extracted and saved to: {audio_output_path}")
+
+        # Step 2: Transcribe the audio and summarize the meeting
+        audio_to_summary(project, audio_output_path, api_key, manifest, compression_ratio=compression_ratio,
+                         echo=echo, dedup_threshold=dedup_threshold, dedup_shingle_size=dedup_shingle_size,
+                         trim_silence=trim_silence, cache_completions=cache_completions,
+                         requests_per_minute=requests_per_minute, tokens_per_minute=tokens_per_minute,
+                         transcription_backend=transcription_backend)
 
 
 def audio_to_summary(
         project: str,
         audio_path: str,
         api_key: str,
+        manifest: Optional[RunManifest] = None,
+        metrics: bool = False,
+        compression_ratio: Optional[float] = None,
+        echo: bool = False,
+        dedup_threshold: Optional[float] = None,
+        dedup_shingle_size: int = 3,
+        trim_silence: bool = False,
+        cache_completions: bool = False,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        transcription_backend: str = "openai",
 ) -> None:
     """
     Transcribes the audio and summarizes the meeting.
@@ -55,18 +220,68 @@ def audio_to_summary(
         The path to the input audio file.
     api_key : str
         The OpenAI API key.
+    manifest : RunManifest, optional
+        The checkpoint manifest of the run, by default the manifest of the audio file.
+    metrics : bool, optional
+        Whether to write a Prometheus text file of the run metrics, by default False.
+    compression_ratio : float, optional
+        The fraction of the transcript tokens kept by the extractive reduction before
+        summarizing, by default None (the whole transcript is summarized).
+    echo : bool, optional
+        Whether to echo the summaries to stdout as they are generated, by default False.
+    dedup_threshold : float, optional
+        The similarity above which a transcript sentence or a summary line repeating an earlier
+        one is not sent, by default None (no deduplication).
+    dedup_shingle_size : int, optional
+        The number of consecutive words compared by the deduplication, by default 3.
+    trim_silence : bool, optional
+        Whether to remove the long pauses of the audio before transcribing it, by default
+        False.
+    cache_completions : bool, optional
+        Whether to serve identical completion requests from projects/<project>/cache, by
+        default False.
+    requests_per_minute : float, optional
+        The request quota of each model, by default None (unlimited).
+    tokens_per_minute : float, optional
+        The token quota of the completion model, by default None (unlimited).
+    transcription_backend : str, optional
+        The transcription backend: "openai", "local" (faster-whisper on the CPU) or "auto"
+        (the fastest one measured), by default "openai".
     """
-    # Step 1: Transcribe the audio
-    print("Transcribing the audio file...")
-    configAudio = OpenAIAudioAPI(api_key=api_key, file_path=audio_path)
-    transcription = transcribe_audio(configAudio)
-    audio_name = audio_path.split("/")[-1].split(".")[0]
-    output_transcription_path = "projects/{}/transcriptions/transcription_{}.txt".format(project, audio_name)
-    save_text(transcription, output_transcription_path)
-    print("Transcription from the audio completed.")
+    with trace_run(project, audio_path.split("/")[-1].split(".")[0], metrics):
+        audio_name = audio_path.split("/")[-1].split(".")[0]
+        output_transcription_path = "projects/{}/transcriptions/transcription_{}.txt".format(project, audio_name)
+        if manifest is None:
+            manifest = open_run_manifest(project, audio_name, file_signature(audio_path))
+
+        # Step 1: Transcribe the audio
+        if manifest.stage_done("transcription") and os.path.exists(output_transcription_path):
+            print(f"Resuming: audio already transcribed to {output_transcription_path}")
+            transcription = open(output_transcription_path, "r", encoding='utf-8').read()
+        else:
+            print("Transcribing the audio file...")
+            from speech_transcriber import transcribe_audio
 
-    # Step 2: Summarize the meeting transcription
-    text_to_summary(project, transcription, audio_name, api_key)
+            configAudio = OpenAIAudioAPI(api_key=api_key,
+                                         file_path=audio_path,
+                                         cache_dir="projects/{}/cache".format(project),
+                                         trim_silence=trim_silence,
+                                         timestamp_map_path="projects/{}/transcriptions/timestamps_{}.json".format(
+                                             project, audio_name),
+                                         segments_path=segments_path(project, audio_name),
+                                         requests_per_minute=requests_per_minute,
+                                         backend=transcription_backend)
+            with span("transcribe_audio", bytes=os.path.getsize(audio_path)):
+                transcription = transcribe_audio(configAudio, manifest)
+            save_text(transcription, output_transcription_path)
+            manifest.complete_stage("transcription", transcription_path=output_transcription_path)
+            print("Transcription from the audio completed.")
+
+        # Step 2: Summarize the meeting transcription
+        text_to_summary(project, transcription, audio_name, api_key, manifest, compression_ratio=compression_ratio,
+                        echo=echo, dedup_threshold=dedup_threshold, dedup_shingle_size=dedup_shingle_size,
+                        cache_completions=cache_completions, requests_per_minute=requests_per_minute,
+                        tokens_per_minute=tokens_per_minute)
 
 
 def text_to_summary(
@@ -74,6 +289,15 @@ def text_to_summary(
         transcription: str,
         name: str,
         api_key: str,
+        manifest: Optional[RunManifest] = None,
+        metrics: bool = False,
+        compression_ratio: Optional[float] = None,
+        echo: bool = False,
+        dedup_threshold: Optional[float] = None,
+        dedup_shingle_size: int = 3,
+        cache_completions: bool = False,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
 ) -> None:
     """
     Summarizes the meeting transcription.
@@ -88,38 +312,368 @@ def text_to_summary(
         The name of the input text file.
     api_key : str
         The OpenAI API key.
+    manifest : RunManifest, optional
+        The checkpoint manifest of the run, by default the manifest of the transcription.
+    metrics : bool, optional
+        Whether to write a Prometheus text file of the run metrics, by default False.
+    compression_ratio : float, optional
+        The fraction of the transcript tokens kept by the extractive reduction before
+        summarizing, by default None (the whole transcript is summarized).
+    echo : bool, optional
+        Whether to echo the summaries to stdout as they are generated, by default False.
+    dedup_threshold : float, optional
+        The similarity above which a transcript sentence or a summary line repeating an earlier
+        one is not sent, by default None (no deduplication).
+    dedup_shingle_size : int, optional
+        The number of consecutive words compared by the deduplication, by default 3.
+    cache_completions : bool, optional
+        Whether to serve identical completion requests from projects/<project>/cache, by
+        default False.
+    requests_per_minute : float, optional
+        The request quota of each model, by default None (unlimited).
+    tokens_per_minute : float, optional
+        The token quota of the completion model, by default None (unlimited).
     """
-    # Step 1: Summarize the meeting transcription
-    prompt_template_summarize = open("meeting_summarizer/prompts/summarize_transcript.txt",
-                                     "r", encoding='utf-8').read()
-    print("Summarizing the meeting transcription...")
-    configSummary = OpenAICompletionAPI(api_key=api_key,
-                                        max_tokens=777,
-                                        temperature=0.5,
-                                        presence_penalty=0.7,
-                                        frequency_penalty=0.4,
-                                        messages=[{"role": "system", "content": "You are a helpful assistant."},
-                                                  {"role": "user", "content": transcription}])
-    summary = summarize_transcription(transcriptions=transcription,
-                                      config=configSummary)
-    text_name = name
-    output_summary_path = "projects/{}/summaries/summary_{}.txt".format(project, text_name)
-    save_text(summary, output_summary_path)
-    print("Summary of transcriptions completed.")
-    print(f"Transcriptions summary saved to: {output_summary_path}")
+    with trace_run(project, name, metrics):
+        if manifest is None:
+            manifest = open_run_manifest(project, name, text_signature(transcription))
+
+        # Step 1: Summarize the meeting transcription
+        prompt_template_summarize = open("meeting_summarizer/prompts/summarize_transcript.txt",
+                                         "r", encoding='utf-8').read()
+        print("Summarizing the meeting transcription...")
+        configSummary = OpenAICompletionAPI(api_key=api_key,
+                                            max_tokens=777,
+                                            temperature=0.5,
+                                            presence_penalty=0.7,
+                                            frequency_penalty=0.4,
+                                            stream=True,
+                                            cache_dir=completion_cache_dir(project, cache_completions),
+                                            requests_per_minute=requests_per_minute,
+                                            tokens_per_minute=tokens_per_minute,
+                                            compression_ratio=compression_ratio,
+                                            dedup_threshold=dedup_threshold,
+                                            dedup_shingle_size=dedup_shingle_size,
+                                            messages=[{"role": "system", "content": "You are a helpful assistant."},
+                                                      {"role": "user", "content": transcription}])
+        text_name = name
+        output_summary_path = "projects/{}/summaries/summary_{}.txt".format(project, text_name)
+        segments = None
+        if os.path.exists(segments_path(project, name)):
+            # numpy is only loaded by the runs that have a structured transcript
+            from transcript_store import load_transcript_segments
+
+            # The structured transcript written with the transcription, unless the text was edited since
+            segments = load_transcript_segments(segments_path(project, name), transcription)
+        with span("summarize", segments=segments is not None), stream_text(output_summary_path, echo) as on_token:
+            try:
+                summary = summarize_transcription(transcriptions=transcription,
+                                                  config=configSummary,
+                                                  manifest=manifest,
+                                                  on_token=on_token,
+                                                  segments=segments)
+            finally:
+                if segments is not None:
+                    segments.close()
+        save_text(summary, output_summary_path)
+        print("Summary of transcriptions completed.")
+        print(f"Transcriptions summary saved to: {output_summary_path}")
+
+        # Step 2: Generate the meeting summary
+        summary_to_meeting_summary(project, summary, text_name, api_key, echo, dedup_threshold, dedup_shingle_size,
+                                   cache_completions, requests_per_minute, tokens_per_minute)
+        manifest.complete()
 
-    # Step 2: Generate the meeting summary
+
+def summary_to_meeting_summary(
+        project: str,
+        summary: str,
+        name: str,
+        api_key: str,
+        echo: bool = False,
+        dedup_threshold: Optional[float] = None,
+        dedup_shingle_size: int = 3,
+        cache_completions: bool = False,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+) -> None:
+    """
+    Generates the structured meeting summary from the summary of the transcription.
+
+    Parameters
+    ----------
+    project : str
+        The name of the project.
+    summary : str
+        The summary of the meeting transcription.
+    name : str
+        The name of the input file.
+    api_key : str
+        The OpenAI API key.
+    echo : bool, optional
+        Whether to echo the meeting summary to stdout as it is generated, by default False.
+    dedup_threshold : float, optional
+        The similarity above which a transcript sentence or a summary line repeating an earlier
+        one is not sent, by default None (no deduplication).
+    dedup_shingle_size : int, optional
+        The number of consecutive words compared by the deduplication, by default 3.
+    cache_completions : bool, optional
+        Whether to serve identical completion requests from projects/<project>/cache, by
+        default False.
+    requests_per_minute : float, optional
+        The request quota of each model, by default None (unlimited).
+    tokens_per_minute : float, optional
+        The token quota of the completion model, by default None (unlimited).
+    """
     prompt_template_meeting_summary = open("generate_meeting_summary/prompts/summary_structure_2.txt",
                                            "r", encoding='utf-8').read()
     print("Generating the meeting summary...")
     configMeetingSummary = OpenAICompletionAPI(api_key=api_key,
                                                max_tokens=2000,
+                                               stream=True,
+                                               cache_dir=completion_cache_dir(project, cache_completions),
+                                               requests_per_minute=requests_per_minute,
+                                               tokens_per_minute=tokens_per_minute,
+                                               dedup_threshold=dedup_threshold,
+                                               dedup_shingle_size=dedup_shingle_size,
                                                messages=[{"role": "system", "content": "You are a helpful assistant."},
                                                          {"role": "user", "content": summary}])
-    meeting_summary = generate_meeting_summary(summary=summary,
-                                               config=configMeetingSummary,
-                                               prompt_template=prompt_template_meeting_summary)
-    output_meeting_summary_path = "projects/{}/summaries/meeting_summary_{}.txt".format(project, text_name)
+    output_meeting_summary_path = "projects/{}/summaries/meeting_summary_{}.txt".format(project, name)
+    with span("meeting_summary"), stream_text(output_meeting_summary_path, echo) as on_token:
+        meeting_summary = generate_meeting_summary(summary=summary,
+                                                   config=configMeetingSummary,
+                                                   prompt_template=prompt_template_meeting_summary,
+                                                   on_token=on_token)
     save_text(meeting_summary, output_meeting_summary_path)
     print("Meeting summary completed.")
     print(f"Meeting summary saved to: {output_meeting_summary_path}")
+    if configMeetingSummary.cache_dir is not None:
+        cache_stats = get_cache(configMeetingSummary.cache_dir).stats()
+        print("Cache: {} hits, {} misses.".format(cache_stats["hits"], cache_stats["misses"]))
+    limiter_stats = rate_limiter_stats(configMeetingSummary.model)
+    if limiter_stats is not None:
+        print("Rate limiter: {} requests, {} retries, {:.1f}s waited, max queue depth {}.".format(
+            limiter_stats["requests"], limiter_stats["retries"], limiter_stats["total_wait"],
+            limiter_stats["max_queue_depth"]))
+
+
+def video_to_summary_pipelined(
+        project: str,
+        video_name: str,
+        api_key: str,
+        segment_duration: float = 600.0,
+        overlap: float = 2.0,
+        extract_workers: Optional[int] = None,
+        transcribe_workers: int = 4,
+        map_tokens: int = 16000,
+        queue_size: int = 4,
+        metrics: bool = False,
+        cache_completions: bool = False,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        transcription_backend: str = "openai",
+) -> None:
+    """
+    Extracts, transcribes and summarizes a video with the stages running concurrently.
+
+    The audio is extracted in segments; each segment is transcribed as soon as it is extracted,
+    and the transcript is summarized as soon as ``map_tokens`` tokens have accumulated. Bounded
+    queues between the stages keep a fast stage from running far ahead of a slow one, so the
+    end-to-end latency approaches that of the slowest stage.
+
+    Each segment starts ``overlap`` seconds before the end of the previous one, so a word cut
+    at a boundary is heard whole by one of them, and the words transcribed twice are removed,
+    see remove_overlaps. The transcription of each segment and each partial summary are
+    checkpointed in projects/<project>/manifests, so a run that was interrupted resumes where
+    it stopped.
+
+    Parameters
+    ----------
+    project : str
+        The name of the project.
+    video_name : str
+        The name of the input video file.
+    api_key : str
+        The OpenAI API key.
+    segment_duration : float, optional
+        The duration of the extracted audio segments in seconds, by default 600.0.
+    overlap : float, optional
+        The audio shared by consecutive segments in seconds, by default 2.0.
+    extract_workers : int, optional
+        The number of processes extracting segments, by default the number of CPUs.
+    transcribe_workers : int, optional
+        The number of segments transcribed concurrently, by default 4.
+    map_tokens : int, optional
+        The number of transcript tokens summarized by each map request, by default 16000.
+    queue_size : int, optional
+        The capacity of the queues between the stages, by default 4.
+    metrics : bool, optional
+        Whether to write a Prometheus text file of the run metrics, by default False.
+    cache_completions : bool, optional
+        Whether to serve identical completion requests from projects/<project>/cache, by
+        default False.
+    requests_per_minute : float, optional
+        The request quota of each model, by default None (unlimited).
+    tokens_per_minute : float, optional
+        The token quota of the completion model, by default None (unlimited).
+    transcription_backend : str, optional
+        The transcription backend: "openai", "local" (faster-whisper on the CPU) or "auto"
+        (the fastest one measured), by default "openai".
+    """
+    with trace_run(project, video_name.split(".")[0], metrics):
+        asyncio.run(_video_to_summary_async(project, video_name, api_key, segment_duration, overlap, extract_workers,
+                                            transcribe_workers, map_tokens, queue_size, cache_completions,
+                                            requests_per_minute, tokens_per_minute, transcription_backend))
+
+
+async def _video_to_summary_async(
+        project: str,
+        video_name: str,
+        api_key: str,
+        segment_duration: float,
+        overlap: float,
+        extract_workers: Optional[int],
+        transcribe_workers: int,
+        map_tokens: int,
+        queue_size: int,
+        cache_completions: bool,
+        requests_per_minute: Optional[float],
+        tokens_per_minute: Optional[float],
+        transcription_backend: str,
+) -> None:
+    from audio_extractor.audio_extractor import extract_audio_single_pass
+    from media_tools import probe_audio
+    from speech_transcriber import transcribe_audio_chunks
+    from speech_transcriber.speech_transcriber import remove_overlaps
+
+    loop = asyncio.get_running_loop()
+    video_path = "projects/{}/videos/{}".format(project, video_name)
+    name = video_name.split(".")[0]
+    duration = probe_audio(video_path).duration
+    num_segments = max(1, int(-(-duration // segment_duration)))
+    # The segments are only reused by a run cutting the video the same way
+    manifest = open_run_manifest(project, name, "{}:segments:{}:{}".format(
+        file_signature(video_path), segment_duration, overlap))
+    transcriptions: Dict[int, str] = {}
+    for i in range(num_segments):
+        if manifest.chunk_result("segment_transcription", i) is not None:
+            transcriptions[i] = manifest.chunk_result("segment_transcription", i)
+    if transcriptions:
+        print("Resuming: {} of {} segments already transcribed".format(len(transcriptions), num_segments))
+    segment_dir = tempfile.mkdtemp(prefix="audio_segments_")
+
+    configAudio = OpenAIAudioAPI(api_key=api_key,
+                                 file_path=video_path,
+                                 max_workers=1,
+                                 cache_dir="projects/{}/cache".format(project),
+                                 requests_per_minute=requests_per_minute,
+                                 backend=transcription_backend)
+    configSummary = OpenAICompletionAPI(api_key=api_key,
+                                        max_tokens=777,
+                                        temperature=0.5,
+                                        presence_penalty=0.7,
+                                        frequency_penalty=0.4,
+                                        cache_dir=completion_cache_dir(project, cache_completions),
+                                        requests_per_minute=requests_per_minute,
+                                        tokens_per_minute=tokens_per_minute)
+
+    audio_queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+    text_queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+
+    async def extract() -> None:
+        # Keep up to extract_workers segments in flight, hand them over in playback order
+        workers = extract_workers or os.cpu_count() or 1
+        with span("extraction", video=video_name, segments=num_segments), \
+                ProcessPoolExecutor(max_workers=workers) as executor:
+            pending = []
+            missing = [i for i in range(num_segments) if i not in transcriptions]
+            for i in missing:
+                segment_path = os.path.join(segment_dir, "{}_segment_{:04d}.ogg".format(name, i))
+                start_time = max(0.0, i * segment_duration - overlap)
+                end_time = min(duration, (i + 1) * segment_duration)
+                pending.append((i, segment_path, loop.run_in_executor(
+                    executor, extract_audio_single_pass, video_path, segment_path, "ogg", start_time, end_time,
+                    configAudio.upload_sample_rate, configAudio.upload_bit_rate)))
+                while pending and (len(pending) >= workers or i == missing[-1]):
+                    index, path, future = pending.pop(0)
+                    await future
+                    await audio_queue.put((index, path))
+        for _ in range(transcribe_workers):
+            await audio_queue.put(None)
+
+    # The transcriptions without the words of the previous segment, in playback order
+    stitched: List[str] = []
+    order_lock = asyncio.Lock()
+
+    async def forward() -> None:
+        # Forward the transcriptions to the summarizer in playback order
+        async with order_lock:
+            while len(stitched) in transcriptions:
+                index = len(stitched)
+                previous = transcriptions[index - 1] if index > 0 else ""
+                stitched.append(remove_overlaps([previous, transcriptions[index]])[1])
+                if stitched[-1]:
+                    await text_queue.put(stitched[-1])
+
+    async def transcribe() -> None:
+        while True:
+            item = await audio_queue.get()
+            if item is None:
+                break
+            index, segment_path = item
+            transcription = (await asyncio.to_thread(transcribe_audio_chunks, [segment_path], configAudio))[0]
+            os.remove(segment_path)
+            transcriptions[index] = transcription
+            manifest.save_chunk_result("segment_transcription", index, transcription)
+            print("progress:", len(transcriptions) / num_segments)
+            await forward()
+
+    def summarize_batch(batch_index: int, text: str) -> str:
+        partial_summary = summarize_transcription(text, configSummary)
+        manifest.save_chunk_result("segment_summary", batch_index, partial_summary)
+        return partial_summary
+
+    async def summarize() -> List[str]:
+        map_tasks = []
+        batch: List[str] = []
+        batch_tokens = 0
+        while True:
+            text = await text_queue.get()
+            if text is not None:
+                batch.append(text)
+                batch_tokens += count_tokens(text, configSummary.model)
+            if batch and (text is None or batch_tokens >= map_tokens):
+                # The batches are cut the same way by every run, so a summary of an interrupted run is reused
+                partial_summary = manifest.chunk_result("segment_summary", len(map_tasks))
+                if partial_summary is None:
+                    map_tasks.append(asyncio.create_task(
+                        asyncio.to_thread(summarize_batch, len(map_tasks), "\n".join(batch))))
+                else:
+                    map_tasks.append(asyncio.create_task(asyncio.sleep(0, partial_summary)))
+                batch, batch_tokens = [], 0
+            if text is None:
+                return list(await asyncio.gather(*map_tasks))
+
+    try:
+        print(f"Extracting, transcribing and summarizing: {video_name} ...")
+        summarizer = asyncio.create_task(summarize())
+        await asyncio.gather(forward(), extract(), *[transcribe() for _ in range(transcribe_workers)])
+        await text_queue.put(None)
+        partial_summaries = await summarizer
+    finally:
+        shutil.rmtree(segment_dir, ignore_errors=True)
+
+    transcription = "\n".join(text for text in stitched if text)
+    output_transcription_path = "projects/{}/transcriptions/transcription_{}.txt".format(project, name)
+    save_text(transcription, output_transcription_path)
+    print("Transcription from the video completed.")
+
+    summary = "\n".join(partial_summaries)
+    output_summary_path = "projects/{}/summaries/summary_{}.txt".format(project, name)
+    save_text(summary, output_summary_path)
+    print(f"Transcriptions summary saved to: {output_summary_path}")
+
+    await asyncio.to_thread(summary_to_meeting_summary, project, summary, name, api_key,
+                            cache_completions=cache_completions, requests_per_minute=requests_per_minute,
+                            tokens_per_minute=tokens_per_minute)
+    manifest.complete()
@@ -0,0 +1 @@
+from .rate_limiter import RateLimiter, TokenBucket, get_rate_limiter, rate_limiter_stats
@@ -0,0 +1,301 @@
+import threading
+import time
+from typing import Callable, Dict, Optional, TypeVar
+
+import openai
+
+from tracing import current_span
+
+T = TypeVar("T")
+
+# Errors after which a request is sent again
+RETRYABLE_ERRORS = (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)
+
+
+class TokenBucket:
+    """
+    A token bucket refilled continuously at a rate given per minute.
+
+    Parameters
+    ----------
+    rate_per_minute : float
+        The number of units added to the bucket per minute, which is also its capacity.
+    """
+
+    def __init__(self, rate_per_minute: float):
+        self.capacity = float(rate_per_minute)
+        self.rate = rate_per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount: float, now: float) -> float:
+        """
+        Returns the time in seconds until the bucket holds the amount.
+
+        An amount larger than the capacity only waits for a full bucket, so it does not block
+        forever.
+        """
+        self._refill(now)
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing / self.rate)
+
+    def consume(self, amount: float, now: float) -> None:
+        self._refill(now)
+        self.level -= min(amount, self.capacity)
+
+
+class RateLimiter:
+    """
+    Schedules API requests under a requests per minute and a tokens per minute quota.
+
+    The callers block until both token buckets allow their request, and requests failing
+    with a transient error are retried with exponential backoff. A rate limit error pauses
+    every caller of the limiter for the delay given by the Retry-After header of the response.
+
+    Parameters
+    ----------
+    requests_per_minute : float, optional
+        The maximum number of requests per minute, by default None (unlimited).
+    tokens_per_minute : float, optional
+        The maximum number of tokens per minute, by default None (unlimited).
+    max_retries : int, optional
+        The number of times a failed request is retried before giving up, by default 3.
+    backoff : float, optional
+        The delay in seconds before the first retry, doubled at each retry, by default 1.0.
+    """
+
+    def __init__(self,
+                 requests_per_minute: Optional[float] = None,
+                 tokens_per_minute: Optional[float] = None,
+                 max_retries: int = 3,
+                 backoff: float = 1.0):
+        self.request_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.requests = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._paused_until = 0.0
+        self._condition = threading.Condition()
+
+    def acquire(self, tokens: int = 0) -> float:
+        """
+        Blocks until a request of the given number of tokens fits in the quotas.
+
+        Parameters
+        ----------
+        tokens : int, optional
+            The estimated number of tokens of the request, by default 0.
+
+        Returns
+        -------
+        float
+            The time waited in seconds.
+        """
+        start = time.monotonic()
+        with self._condition:
+            self.queue_depth += 1
+            self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+            try:
+                while True:
+                    now = time.monotonic()
+                    delay = self._paused_until - now
+                    if self.request_bucket is not None:
+                        delay = max(delay, self.request_bucket.delay(1, now))
+                    if self.token_bucket is not None:
+                        delay = max(delay, self.token_bucket.delay(tokens, now))
+                    if delay <= 0:
+                        break
+                    self._condition.wait(delay)
+                if self.request_bucket is not None:
+                    self.request_bucket.consume(1, now)
+                if self.token_bucket is not None:
+                    self.token_bucket.consume(tokens, now)
+            finally:
+                self.queue_depth -= 1
+            waited = time.monotonic() - start
+            self.requests += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+        return waited
+
+    def pause(self, delay: float) -> None:
+        """
+        Holds back every request of the limiter for the given delay in seconds.
+        """
+        with self._condition:
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+            self._condition.notify_all()
+
+    def set_quotas(self, requests_per_minute: Optional[float] = None,
+                   tokens_per_minute: Optional[float] = None) -> None:
+        """
+        Adds the quotas the limiter does not have yet.
+
+        Raises
+        ------
+        ValueError
+            If a quota differs from the one the limiter already has.
+        """
+        with self._condition:
+            buckets = {"request_bucket": requests_per_minute, "token_bucket": tokens_per_minute}
+            for attribute, rate_per_minute in buckets.items():
+                bucket = getattr(self, attribute)
+                if bucket is not None and rate_per_minute and bucket.capacity != float(rate_per_minute):
+                    raise ValueError("Conflicting {} quotas of {:g} and {:g} per minute".format(
+                        attribute.split("_")[0], bucket.capacity, rate_per_minute))
+            for attribute, rate_per_minute in buckets.items():
+                if getattr(self, attribute) is None and rate_per_minute:
+                    setattr(self, attribute, TokenBucket(rate_per_minute))
+            self._condition.notify_all()
+
+    def call(self, function: Callable[[], T], tokens: int = 0, max_retries: Optional[int] = None) -> T:
+        """
+        Calls a function sending an API request once the quotas allow it, retrying it on
+        transient errors. The retries and the time waited are added to the current span.
+
+        Parameters
+        ----------
+        function : Callable[[], T]
+            The function sending the request.
+        tokens : int, optional
+            The estimated number of tokens of the request, by default 0.
+        max_retries : int, optional
+            The number of times the request is retried before giving up, by default
+            ``max_retries`` of the limiter.
+
+        Returns
+        -------
+        T
+            The return value of the function.
+        """
+        if max_retries is None:
+            max_retries = self.max_retries
+        span = current_span()
+        for attempt in range(max_retries + 1):
+            waited = self.acquire(tokens)
+            if span is not None:
+                span.add("queue_wait", waited)
+            try:
+                return function()
+            except RETRYABLE_ERRORS as error:
+                if attempt == max_retries:
+                    raise
+                delay = retry_after(error)
+                with self._condition:
+                    self.retries += 1
+                    self.rate_limited += isinstance(error, openai.RateLimitError)
+                if span is not None:
+                    span.add("retries")
+                if delay is None:
+                    time.sleep(self.backoff * 2 ** attempt)
+                else:
+                    # Every caller shares the quota, so all of them wait as the server asked
+                    self.pause(delay)
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Returns the number of requests, retries and rate limit errors, the current and
+        maximum queue depth, and the total and maximum time waited in seconds.
+        """
+        with self._condition:
+            return {"requests": self.requests,
+                    "retries": self.retries,
+                    "rate_limited": self.rate_limited,
+                    "queue_depth": self.queue_depth,
+                    "max_queue_depth": self.max_queue_depth,
+                    "total_wait": self.total_wait,
+                    "max_wait": self.max_wait}
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """
+    Returns the delay in seconds asked by the Retry-After headers of an error response, or
+    None if it has none.
+
+    Parameters
+    ----------
+    error : Exception
+        The error raised by the OpenAI client.
+
+    Returns
+    -------
+    Optional[float]
+        The delay in seconds.
+    """
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if headers.get("retry-after-ms") is not None:
+            return float(headers["retry-after-ms"]) / 1000.0
+        if headers.get("retry-after") is not None:
+            return float(headers["retry-after"])
+    except ValueError:
+        # An HTTP date, fall back to the exponential backoff
+        return None
+    return None
+
+
+_limiters: Dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(
+        name: str,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+) -> RateLimiter:
+    """
+    Returns the rate limiter of a quota, shared by every caller in the process.
+
+    A quota given by a caller is added to the limiter if it does not have one yet, so the
+    callers may give only the quotas they know of.
+
+    Parameters
+    ----------
+    name : str
+        The name of the quota, e.g. the model.
+    requests_per_minute : float, optional
+        The maximum number of requests per minute, by default None (unlimited, or the quota
+        given by an earlier caller).
+    tokens_per_minute : float, optional
+        The maximum number of tokens per minute, by default None (unlimited, or the quota
+        given by an earlier caller).
+
+    Returns
+    -------
+    RateLimiter
+        The rate limiter.
+
+    Raises
+    ------
+    ValueError
+        If a quota differs from the one given by an earlier caller.
+    """
+    with _limiters_lock:
+        if name not in _limiters:
+            _limiters[name] = RateLimiter(requests_per_minute, tokens_per_minute)
+        limiter = _limiters[name]
+    limiter.set_quotas(requests_per_minute, tokens_per_minute)
+    return limiter
+
+
+def rate_limiter_stats(name: str) -> Optional[Dict[str, float]]:
+    """
+    Returns the stats of the rate limiter of a quota, see RateLimiter.stats, or None if no
+    request was scheduled under it.
+    """
+    with _limiters_lock:
+        limiter = _limiters.get(name)
+    return limiter.stats() if limiter is not None else None
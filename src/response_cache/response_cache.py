@@ -0,0 +1,151 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+
+class ResponseCache:
+    """
+    A persistent key-value cache of API responses, stored in a SQLite file.
+
+    When the total size of the stored values exceeds ``max_size``, the least recently used
+    entries are evicted. Entries stored with a time to live expire after it. The cache can be
+    shared between threads, and counts its hits and misses.
+
+    Parameters
+    ----------
+    cache_dir : str
+        The folder in which the cache file is stored.
+    max_size : int, optional
+        The maximum total size of the cached values in bytes, by default 512MB.
+    ttl : float, optional
+        The default time to live of the entries in seconds, by default None (no expiry).
+    """
+
+    def __init__(self, cache_dir: str, max_size: int = 512 * 1024 * 1024, ttl: Optional[float] = None):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(os.path.join(cache_dir, "cache.sqlite3"), check_same_thread=False)
+        with self._connection:
+            self._connection.execute("CREATE TABLE IF NOT EXISTS entries ("
+                                     "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                                     "accessed REAL NOT NULL, expires REAL)")
+            columns = [row[1] for row in self._connection.execute("PRAGMA table_info(entries)")]
+            if "expires" not in columns:
+                # A cache written before the entries could expire
+                self._connection.execute("ALTER TABLE entries ADD COLUMN expires REAL")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Returns the cached value of a key, or None if it is not cached.
+
+        Parameters
+        ----------
+        key : str
+            The cache key.
+
+        Returns
+        -------
+        Optional[str]
+            The cached value.
+        """
+        now = time.time()
+        with self._lock, self._connection:
+            row = self._connection.execute("SELECT value, expires FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is not None and row[1] is not None and row[1] <= now:
+                self._connection.execute("DELETE FROM entries WHERE key = ?", (key,))
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._connection.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return row[0]
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        """
+        Stores a value, evicting the least recently used entries if the cache is full.
+
+        Parameters
+        ----------
+        key : str
+            The cache key.
+        value : str
+            The value to store.
+        ttl : float, optional
+            The time to live of the entry in seconds, by default the ttl of the cache.
+        """
+        size = len(value.encode("utf-8"))
+        now = time.time()
+        ttl = ttl if ttl is not None else self.ttl
+        expires = now + ttl if ttl is not None else None
+        with self._lock, self._connection:
+            self._connection.execute("INSERT OR REPLACE INTO entries (key, value, size, accessed, expires) "
+                                     "VALUES (?, ?, ?, ?, ?)", (key, value, size, now, expires))
+            self._evict()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns the number of hits, misses and entries of the cache.
+
+        Returns
+        -------
+        Dict[str, int]
+            The "hits", "misses" and "entries" counters.
+        """
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self)}
+
+    def _evict(self) -> None:
+        self._connection.execute("DELETE FROM entries WHERE expires IS NOT NULL AND expires <= ?", (time.time(),))
+        total_size = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total_size <= self.max_size:
+            return
+        rows = self._connection.execute("SELECT key, size FROM entries ORDER BY accessed").fetchall()
+        evicted = []
+        for key, size in rows:
+            if total_size <= self.max_size:
+                break
+            evicted.append((key,))
+            total_size -= size
+        self._connection.executemany("DELETE FROM entries WHERE key = ?", evicted)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+
+_caches: Dict[str, ResponseCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(cache_dir: str, max_size: Optional[int] = None) -> ResponseCache:
+    """
+    Returns the cache stored in a folder, shared by every caller in the process.
+
+    Parameters
+    ----------
+    cache_dir : str
+        The folder in which the cache file is stored.
+    max_size : int, optional
+        The maximum total size of the cached values in bytes, by default the size set by an
+        earlier caller, or 512MB.
+
+    Returns
+    -------
+    ResponseCache
+        The cache.
+    """
+    with _caches_lock:
+        key = os.path.abspath(cache_dir)
+        if key not in _caches:
+            _caches[key] = ResponseCache(cache_dir)
+        if max_size is not None:
+            _caches[key].max_size = max_size
+        return _caches[key]
@@ -0,0 +1 @@
+from .run_manifest import RunManifest, file_signature, open_run_manifest, text_signature
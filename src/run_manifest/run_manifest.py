@@ -0,0 +1,195 @@
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Dict, Optional
+
+
+class RunManifest:
+    """
+    A checkpoint file recording the completed stages and chunk results of a pipeline run.
+
+    Every update is written to disk immediately, so a run that crashes can be resumed by
+    opening the manifest again. The manifest starts over if the input changed (its signature
+    differs) or if the previous run completed.
+
+    Parameters
+    ----------
+    path : str
+        The path of the manifest file.
+    signature : str
+        A signature of the input of the run, see file_signature and text_signature.
+    """
+
+    def __init__(self, path: str, signature: str):
+        self.path = path
+        self.work_dir = os.path.splitext(path)[0] + "_work"
+        self._lock = threading.Lock()
+
+        data = None
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as manifest_file:
+                data = json.load(manifest_file)
+        if data is None or data.get("signature") != signature or data.get("complete"):
+            data = {"signature": signature, "complete": False, "stages": {}, "chunks": {}}
+        self._data = data
+
+    @property
+    def resumed(self) -> bool:
+        """
+        Whether the manifest holds results of a previous, unfinished run.
+        """
+        return bool(self._data["stages"] or self._data["chunks"])
+
+    def stage_done(self, stage: str) -> bool:
+        """
+        Returns whether a stage was completed.
+
+        Parameters
+        ----------
+        stage : str
+            The name of the stage.
+
+        Returns
+        -------
+        bool
+            Whether the stage was completed.
+        """
+        return stage in self._data["stages"]
+
+    def stage_info(self, stage: str) -> Optional[Dict[str, Any]]:
+        """
+        Returns the information recorded when a stage was completed, or None.
+
+        Parameters
+        ----------
+        stage : str
+            The name of the stage.
+
+        Returns
+        -------
+        Optional[Dict[str, Any]]
+            The information recorded with complete_stage.
+        """
+        return self._data["stages"].get(stage)
+
+    def complete_stage(self, stage: str, **info: Any) -> None:
+        """
+        Records that a stage was completed.
+
+        Parameters
+        ----------
+        stage : str
+            The name of the stage.
+        **info
+            JSON-serializable information to keep about the stage.
+        """
+        with self._lock:
+            self._data["stages"][stage] = info
+            self._write()
+
+    def chunk_result(self, stage: str, index: int) -> Optional[str]:
+        """
+        Returns the result of a chunk of a stage, or None if it was not recorded.
+
+        Parameters
+        ----------
+        stage : str
+            The name of the stage.
+        index : int
+            The index of the chunk.
+
+        Returns
+        -------
+        Optional[str]
+            The result of the chunk.
+        """
+        return self._data["chunks"].get(stage, {}).get(str(index))
+
+    def save_chunk_result(self, stage: str, index: int, result: str) -> None:
+        """
+        Records the result of a chunk of a stage.
+
+        Parameters
+        ----------
+        stage : str
+            The name of the stage.
+        index : int
+            The index of the chunk.
+        result : str
+            The result of the chunk.
+        """
+        with self._lock:
+            self._data["chunks"].setdefault(stage, {})[str(index)] = result
+            self._write()
+
+    def complete(self) -> None:
+        """
+        Records that the whole run completed; the next run will start over.
+        """
+        with self._lock:
+            self._data["complete"] = True
+            self._write()
+
+    def _write(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as manifest_file:
+            json.dump(self._data, manifest_file, ensure_ascii=False)
+        os.replace(temp_path, self.path)
+
+
+def file_signature(path: str) -> str:
+    """
+    Returns a signature of a file that changes when the file is modified.
+
+    Parameters
+    ----------
+    path : str
+        The path of the file.
+
+    Returns
+    -------
+    str
+        The signature.
+    """
+    stat = os.stat(path)
+    return "file:{}:{}:{}".format(os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+
+
+def text_signature(text: str) -> str:
+    """
+    Returns a signature of a text.
+
+    Parameters
+    ----------
+    text : str
+        The text.
+
+    Returns
+    -------
+    str
+        The signature.
+    """
+    return "text:" + hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def open_run_manifest(project: str, name: str, signature: str) -> RunManifest:
+    """
+    Opens the manifest of the run processing a meeting of a project.
+
+    Parameters
+    ----------
+    project : str
+        The name of the project.
+    name : str
+        The name of the meeting.
+    signature : str
+        A signature of the input of the run.
+
+    Returns
+    -------
+    RunManifest
+        The manifest, stored in projects/<project>/manifests/<name>.json.
+    """
+    return RunManifest(os.path.join("projects", project, "manifests", name + ".json"), signature)
@@ -0,0 +1 @@
+from .search_index import SearchIndex, SearchResult, describe_artifact, get_search_index, index_artifact
@@ -0,0 +1,273 @@
+import os
+import sqlite3
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+INDEX_FILE = "search.sqlite3"
+
+# File name prefix -> kind of artifact, the longest prefixes first
+ARTIFACT_PREFIXES = [("meeting_summary_", "meeting_summary"), ("summary_", "summary"),
+                     ("transcription_", "transcription")]
+INDEXED_FOLDERS = ["transcriptions", "summaries"]
+
+
+@dataclass
+class SearchResult:
+    """
+    A dataclass to store a meeting matching a search, with the artifacts that matched.
+
+    Parameters
+    ----------
+    project : str
+        The name of the project.
+    meeting : str
+        The name of the meeting.
+    score : float
+        The relevance of the best matching artifact; higher is better.
+    snippets : List[Tuple[str, str]]
+        The kind of each matching artifact ("transcription", "summary" or
+        "meeting_summary") and an excerpt around the matched terms.
+    paths : List[str]
+        The paths of the matching artifacts.
+    """
+    project: str
+    meeting: str
+    score: float
+    snippets: List[Tuple[str, str]] = field(default_factory=list)
+    paths: List[str] = field(default_factory=list)
+
+
+def describe_artifact(path: str) -> Optional[Tuple[str, str, str]]:
+    """
+    Returns the project, the meeting and the kind of a text artifact of a project, or None if
+    the path is not one, e.g. projects/<project>/summaries/meeting_summary_<meeting>.txt.
+    """
+    folder_path, file_name = os.path.split(os.path.normpath(path))
+    project_path, folder = os.path.split(folder_path)
+    name, extension = os.path.splitext(file_name)
+    if folder not in INDEXED_FOLDERS or extension != ".txt":
+        return None
+    for prefix, kind in ARTIFACT_PREFIXES:
+        if name.startswith(prefix):
+            return os.path.basename(project_path), name[len(prefix):], kind
+    # Transcripts added by hand, which are summarized from option 3
+    return os.path.basename(project_path), name, "transcription"
+
+
+def quote_query(query: str) -> str:
+    """
+    Turns free text into an FTS5 query matching the documents that contain every word.
+    """
+    return " ".join('"{}"'.format(word.replace('"', '""')) for word in query.split())
+
+
+class SearchIndex:
+    """
+    A full-text index of the transcriptions and summaries of the projects, stored in a SQLite
+    FTS5 table.
+
+    The index is updated file by file: each artifact is indexed when it is written, and
+    update_directory only reads the files whose size or modification time changed. The index
+    can be shared between threads, see get_search_index.
+
+    Parameters
+    ----------
+    projects_dir : str, optional
+        The folder of the projects, in which the index file is stored, by default "projects".
+    """
+
+    def __init__(self, projects_dir: str = "projects"):
+        os.makedirs(projects_dir, exist_ok=True)
+        self.projects_dir = projects_dir
+        # update_directory adds the files it reads while holding the lock
+        self._lock = threading.RLock()
+        self._connection = sqlite3.connect(os.path.join(projects_dir, INDEX_FILE), timeout=30,
+                                           check_same_thread=False)
+        with self._connection:
+            # Concurrent runs write artifacts at the same time
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("CREATE VIRTUAL TABLE IF NOT EXISTS documents USING fts5("
+                                     "content, tokenize='porter unicode61')")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS files ("
+                                     "path TEXT PRIMARY KEY, doc_id INTEGER NOT NULL, project TEXT NOT NULL, "
+                                     "meeting TEXT NOT NULL, kind TEXT NOT NULL, size INTEGER, mtime REAL)")
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def __enter__(self) -> "SearchIndex":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _key(self, path: str) -> str:
+        return os.path.relpath(path, self.projects_dir)
+
+    def add(self, path: str, text: str) -> bool:
+        """
+        Indexes the text of an artifact, replacing its previous version.
+
+        Parameters
+        ----------
+        path : str
+            The path of the artifact, e.g. projects/<project>/transcriptions/transcription_<meeting>.txt.
+        text : str
+            The text of the artifact.
+
+        Returns
+        -------
+        bool
+            Whether the file is an artifact, and was indexed.
+        """
+        description = describe_artifact(path)
+        if description is None:
+            return False
+        project, meeting, kind = description
+        stat = os.stat(path) if os.path.exists(path) else None
+        with self._lock, self._connection:
+            self._remove(self._key(path))
+            doc_id = self._connection.execute("INSERT INTO documents (content) VALUES (?)", (text,)).lastrowid
+            self._connection.execute("INSERT INTO files VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                     (self._key(path), doc_id, project, meeting, kind,
+                                      stat.st_size if stat else None, stat.st_mtime if stat else None))
+        return True
+
+    def _remove(self, key: str) -> None:
+        row = self._connection.execute("SELECT doc_id FROM files WHERE path = ?", (key,)).fetchone()
+        if row is not None:
+            self._connection.execute("DELETE FROM documents WHERE rowid = ?", (row[0],))
+            self._connection.execute("DELETE FROM files WHERE path = ?", (key,))
+
+    def update_directory(self) -> Dict[str, int]:
+        """
+        Brings the index up to date with the artifacts of every project, reading only the
+        files added or changed since they were indexed.
+
+        Returns
+        -------
+        Dict[str, int]
+            The number of files indexed, unchanged and removed.
+        """
+        with self._lock:
+            return self._update_directory()
+
+    def _update_directory(self) -> Dict[str, int]:
+        indexed = {path: (size, mtime) for path, size, mtime in
+                   self._connection.execute("SELECT path, size, mtime FROM files")}
+        counts = {"indexed": 0, "unchanged": 0, "removed": 0}
+        for project in sorted(os.listdir(self.projects_dir)):
+            for folder in INDEXED_FOLDERS:
+                folder_path = os.path.join(self.projects_dir, project, folder)
+                if not os.path.isdir(folder_path):
+                    continue
+                for file_name in os.listdir(folder_path):
+                    path = os.path.join(folder_path, file_name)
+                    # e.g. the structured transcripts and the timestamp maps
+                    if describe_artifact(path) is None or not os.path.isfile(path):
+                        continue
+                    stat = os.stat(path)
+                    if indexed.pop(self._key(path), None) == (stat.st_size, stat.st_mtime):
+                        counts["unchanged"] += 1
+                        continue
+                    with open(path, "r", encoding="utf-8", errors="replace") as artifact:
+                        counts["indexed"] += self.add(path, artifact.read())
+        with self._connection:
+            for key in indexed:
+                self._remove(key)
+                counts["removed"] += 1
+        return counts
+
+    def search(self, query: str, limit: int = 10, project: Optional[str] = None) -> List[SearchResult]:
+        """
+        Returns the meetings whose artifacts contain every word of the query, best first.
+
+        Parameters
+        ----------
+        query : str
+            The words to search for. Words are matched with their inflections, e.g. "budgets"
+            matches "budget".
+        limit : int, optional
+            The maximum number of meetings, by default 10.
+        project : str, optional
+            The project to search, by default all of them.
+
+        Returns
+        -------
+        List[SearchResult]
+            The matching meetings, ranked by BM25.
+        """
+        if not query.split():
+            return []
+        sql = ("SELECT files.path, files.project, files.meeting, files.kind, bm25(documents), "
+               "snippet(documents, 0, '[', ']', '...', 16) "
+               "FROM documents JOIN files ON files.doc_id = documents.rowid WHERE documents MATCH ?")
+        parameters: list = [quote_query(query)]
+        if project is not None:
+            sql += " AND files.project = ?"
+            parameters.append(project)
+        # A meeting has up to three artifacts
+        sql += " ORDER BY bm25(documents) LIMIT ?"
+        parameters.append(limit * len(ARTIFACT_PREFIXES))
+
+        results: Dict[Tuple[str, str], SearchResult] = {}
+        with self._lock:
+            rows = self._connection.execute(sql, parameters).fetchall()
+        for path, project_name, meeting, kind, rank, snippet in rows:
+            result = results.get((project_name, meeting))
+            if result is None:
+                # bm25 is lower for better matches
+                result = results[(project_name, meeting)] = SearchResult(project_name, meeting, -rank)
+            result.snippets.append((kind, snippet))
+            result.paths.append(os.path.join(self.projects_dir, path))
+        return list(results.values())[:limit]
+
+
+_indexes: Dict[str, SearchIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_search_index(projects_dir: str = "projects") -> SearchIndex:
+    """
+    Returns the index of a projects folder, shared by every caller in the process, so that
+    writing an artifact does not open a connection to the index.
+
+    Parameters
+    ----------
+    projects_dir : str, optional
+        The folder of the projects, by default "projects".
+
+    Returns
+    -------
+    SearchIndex
+        The index, which stays open.
+    """
+    with _indexes_lock:
+        key = os.path.abspath(projects_dir)
+        if key not in _indexes:
+            _indexes[key] = SearchIndex(projects_dir)
+        return _indexes[key]
+
+
+def index_artifact(path: str, text: str) -> bool:
+    """
+    Indexes an artifact written to projects/<project>/<folder>/ in the index of the projects
+    folder, see get_search_index.
+
+    Parameters
+    ----------
+    path : str
+        The path of the artifact.
+    text : str
+        The text of the artifact.
+
+    Returns
+    -------
+    bool
+        Whether the file is an artifact, and was indexed.
+    """
+    if describe_artifact(path) is None:
+        return False
+    projects_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.normpath(path))))
+    return get_search_index(projects_dir or ".").add(path, text)
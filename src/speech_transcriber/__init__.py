@@ -1 +1,3 @@
-from .speech_transcriber import transcribe_audio
+from .speech_transcriber import transcribe_audio, transcribe_audio_chunks
+from .backends import TranscriptionBackend, get_backend, select_backend
+from .vad import TimestampMap
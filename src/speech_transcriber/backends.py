@@ -0,0 +1,339 @@
+import importlib.util
+import json
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import openai
+
+from media_tools import probe_audio
+from openai_api_interaction import OpenAIAudioAPI, get_openai_client
+from rate_limiter import get_rate_limiter
+from tracing import span
+
+# Weight of the latest measurement in the throughput estimate of a backend
+THROUGHPUT_SMOOTHING = 0.5
+THROUGHPUT_FILE = "backend_throughput.json"
+# The response format of the hosted endpoint with the times of the segments
+TIMED_RESPONSE_FORMAT = "verbose_json"
+
+
+class TranscriptionBackend:
+    """
+    An engine transcribing audio chunks.
+
+    Subclasses implement transcribe_chunk and transcribe_chunk_segments;
+    transcribe_audio_chunks takes care of the concurrency, the cache and the manifest.
+    """
+    name = ""
+    # Whether the chunks must stay below the upload limit of the hosted endpoint
+    has_upload_limit = True
+
+    def available(self) -> bool:
+        """
+        Returns whether the backend can be used in this environment.
+        """
+        return True
+
+    def model_name(self, config: OpenAIAudioAPI) -> str:
+        """
+        Returns the name of the model transcribing the chunks, which is part of the cache key.
+        """
+        raise NotImplementedError
+
+    def max_workers(self, config: OpenAIAudioAPI) -> int:
+        """
+        Returns the number of chunks transcribed concurrently.
+        """
+        raise NotImplementedError
+
+    def transcribe_chunk(self, chunk_path: str, config: OpenAIAudioAPI) -> str:
+        """
+        Returns the transcription of an audio chunk.
+        """
+        raise NotImplementedError
+
+    def transcribe_chunk_segments(self, chunk_path: str, config: OpenAIAudioAPI) -> List[Tuple[float, float, str]]:
+        """
+        Returns the segments of the transcription of an audio chunk, with the start and end
+        the model gave each of them, in seconds from the start of the chunk.
+        """
+        raise NotImplementedError
+
+
+def request_transcription(
+        client: openai.OpenAI,
+        chunk_path: str,
+        config: OpenAIAudioAPI,
+        response_format: Optional[str] = None,
+) -> object:
+    """
+    Uploads a single audio chunk once the rate limiter of the model allows it, retrying it on
+    transient API errors.
+
+    Parameters
+    ----------
+    client : openai.OpenAI
+        The OpenAI API client.
+    chunk_path : str
+        The path to the audio chunk.
+    config : OpenAIAudioAPI
+        The configuration for the OpenAI Audio API.
+    response_format : str, optional
+        The format of the response, by default ``config.response_format``.
+
+    Returns
+    -------
+    object
+        The response of the endpoint: a string for the text formats, a Transcription otherwise.
+    """
+    def send() -> object:
+        with open(chunk_path, "rb") as audio_file:
+            return client.audio.transcriptions.create(
+                model=config.model,
+                file=audio_file,
+                prompt=config.prompt or openai.NOT_GIVEN,
+                response_format=response_format or config.response_format,
+                temperature=config.temperature,
+                language=config.language,
+            )
+
+    limiter = get_rate_limiter(config.model, config.requests_per_minute)
+    with span("transcription", chunk=os.path.basename(chunk_path), bytes=os.path.getsize(chunk_path)):
+        return limiter.call(send, max_retries=config.max_retries)
+
+
+def transcribe_chunk(
+        client: openai.OpenAI,
+        chunk_path: str,
+        config: OpenAIAudioAPI,
+) -> str:
+    """
+    Transcribes a single audio chunk, see request_transcription.
+
+    Parameters
+    ----------
+    client : openai.OpenAI
+        The OpenAI API client.
+    chunk_path : str
+        The path to the audio chunk.
+    config : OpenAIAudioAPI
+        The configuration for the OpenAI Audio API.
+
+    Returns
+    -------
+    str
+        The transcription of the chunk.
+    """
+    response = request_transcription(client, chunk_path, config)
+    if isinstance(response, str):
+        return response.strip()
+    return response.text.strip()
+
+
+def transcribe_chunk_segments(
+        client: openai.OpenAI,
+        chunk_path: str,
+        config: OpenAIAudioAPI,
+) -> List[Tuple[float, float, str]]:
+    """
+    Transcribes a single audio chunk in the verbose JSON format, which dates its segments.
+
+    Parameters
+    ----------
+    client : openai.OpenAI
+        The OpenAI API client.
+    chunk_path : str
+        The path to the audio chunk.
+    config : OpenAIAudioAPI
+        The configuration for the OpenAI Audio API.
+
+    Returns
+    -------
+    List[Tuple[float, float, str]]
+        The start and end in seconds from the start of the chunk, and the text, of each
+        segment.
+    """
+    response = request_transcription(client, chunk_path, config, TIMED_RESPONSE_FORMAT)
+    segments = []
+    # The segments are kept as dicts by the openai versions whose Transcription only has a text
+    for segment in getattr(response, "segments", None) or []:
+        if not isinstance(segment, dict):
+            segment = {"start": segment.start, "end": segment.end, "text": segment.text}
+        if segment["text"].strip():
+            segments.append((float(segment["start"]), float(segment["end"]), segment["text"].strip()))
+    if not segments and response.text.strip():
+        # A server without segments, e.g. a proxy of the API: the text spans the whole chunk
+        segments.append((0.0, probe_audio(chunk_path).duration, response.text.strip()))
+    return segments
+
+
+class OpenAIBackend(TranscriptionBackend):
+    """
+    Uploads the chunks to the hosted transcription endpoint.
+    """
+    name = "openai"
+
+    def model_name(self, config: OpenAIAudioAPI) -> str:
+        return config.model
+
+    def max_workers(self, config: OpenAIAudioAPI) -> int:
+        return max(1, config.max_workers)
+
+    def transcribe_chunk(self, chunk_path: str, config: OpenAIAudioAPI) -> str:
+        return transcribe_chunk(get_openai_client(config), chunk_path, config)
+
+    def transcribe_chunk_segments(self, chunk_path: str, config: OpenAIAudioAPI) -> List[Tuple[float, float, str]]:
+        return transcribe_chunk_segments(get_openai_client(config), chunk_path, config)
+
+
+class LocalWhisperBackend(TranscriptionBackend):
+    """
+    Transcribes the chunks on the CPU with faster-whisper (CTranslate2), an optional
+    dependency.
+
+    One model is loaded per configuration and shared by the worker threads: each thread runs
+    its chunk on one of the model workers, and the CPUs are divided between the workers.
+    """
+    name = "local"
+    has_upload_limit = False
+
+    def __init__(self):
+        self._models: Dict[Tuple[str, str, int], object] = {}
+        self._lock = threading.Lock()
+
+    def available(self) -> bool:
+        return importlib.util.find_spec("faster_whisper") is not None
+
+    def model_name(self, config: OpenAIAudioAPI) -> str:
+        return "faster-whisper-{}-{}".format(config.local_model, config.local_compute_type)
+
+    def max_workers(self, config: OpenAIAudioAPI) -> int:
+        return config.local_workers or max(1, (os.cpu_count() or 1) // 4)
+
+    def _get_model(self, config: OpenAIAudioAPI) -> object:
+        workers = self.max_workers(config)
+        key = (config.local_model, config.local_compute_type, workers)
+        with self._lock:
+            if key not in self._models:
+                try:
+                    from faster_whisper import WhisperModel
+                except ImportError:
+                    raise ImportError("The local transcription backend needs faster-whisper: "
+                                      "pip install faster-whisper") from None
+                self._models[key] = WhisperModel(config.local_model,
+                                                 device="cpu",
+                                                 compute_type=config.local_compute_type,
+                                                 cpu_threads=max(1, (os.cpu_count() or 1) // workers),
+                                                 num_workers=workers)
+            return self._models[key]
+
+    def transcribe_chunk(self, chunk_path: str, config: OpenAIAudioAPI) -> str:
+        return " ".join(text for _, _, text in self.transcribe_chunk_segments(chunk_path, config)).strip()
+
+    def transcribe_chunk_segments(self, chunk_path: str, config: OpenAIAudioAPI) -> List[Tuple[float, float, str]]:
+        model = self._get_model(config)
+        with span("transcription", chunk=os.path.basename(chunk_path), backend=self.name):
+            segments, _ = model.transcribe(chunk_path,
+                                           language=config.language,
+                                           initial_prompt=config.prompt,
+                                           temperature=config.temperature)
+            # The segments are generated lazily, as the audio is decoded
+            return [(float(segment.start), float(segment.end), segment.text.strip())
+                    for segment in segments if segment.text.strip()]
+
+
+BACKENDS: Dict[str, TranscriptionBackend] = {backend.name: backend
+                                             for backend in [OpenAIBackend(), LocalWhisperBackend()]}
+
+_throughputs: Dict[str, float] = {}
+_throughputs_lock = threading.Lock()
+
+
+def get_backend(name: str) -> TranscriptionBackend:
+    """
+    Returns the transcription backend of a name.
+
+    Parameters
+    ----------
+    name : str
+        "openai" or "local".
+
+    Returns
+    -------
+    TranscriptionBackend
+        The backend.
+    """
+    if name not in BACKENDS:
+        raise ValueError("Unknown transcription backend {!r}, expected one of {} or 'auto'".format(
+            name, ", ".join(repr(backend) for backend in BACKENDS)))
+    return BACKENDS[name]
+
+
+def _load_throughputs(cache_dir: Optional[str]) -> Dict[str, float]:
+    if cache_dir is None or not os.path.exists(os.path.join(cache_dir, THROUGHPUT_FILE)):
+        return dict(_throughputs)
+    with open(os.path.join(cache_dir, THROUGHPUT_FILE), "r", encoding="utf-8") as throughput_file:
+        return json.load(throughput_file)
+
+
+def record_throughput(config: OpenAIAudioAPI, backend: TranscriptionBackend, audio_seconds: float,
+                      wall_seconds: float) -> None:
+    """
+    Updates the throughput estimate of a backend, in seconds of audio per second, with a run.
+
+    The estimates are kept in the cache folder when the configuration has one, so later runs
+    select from them, and otherwise in memory.
+
+    Parameters
+    ----------
+    config : OpenAIAudioAPI
+        The configuration for the OpenAI Audio API.
+    backend : TranscriptionBackend
+        The backend that transcribed the audio.
+    audio_seconds : float
+        The duration of the transcribed audio in seconds.
+    wall_seconds : float
+        The time the transcription took in seconds.
+    """
+    throughput = audio_seconds / max(wall_seconds, 1e-6)
+    with _throughputs_lock:
+        throughputs = _load_throughputs(config.cache_dir)
+        if backend.name in throughputs:
+            throughput = (THROUGHPUT_SMOOTHING * throughput
+                          + (1 - THROUGHPUT_SMOOTHING) * throughputs[backend.name])
+        throughputs[backend.name] = throughput
+        _throughputs[backend.name] = throughput
+        if config.cache_dir is not None:
+            os.makedirs(config.cache_dir, exist_ok=True)
+            with open(os.path.join(config.cache_dir, THROUGHPUT_FILE), "w", encoding="utf-8") as throughput_file:
+                json.dump(throughputs, throughput_file)
+
+
+def select_backend(config: OpenAIAudioAPI) -> TranscriptionBackend:
+    """
+    Returns the backend of a configuration.
+
+    With ``config.backend`` set to "auto", each available backend is tried once, and then the
+    one with the best measured throughput is used.
+
+    Parameters
+    ----------
+    config : OpenAIAudioAPI
+        The configuration for the OpenAI Audio API.
+
+    Returns
+    -------
+    TranscriptionBackend
+        The backend.
+    """
+    if config.backend != "auto":
+        return get_backend(config.backend)
+
+    candidates = [backend for backend in BACKENDS.values() if backend.available()]
+    with _throughputs_lock:
+        throughputs = _load_throughputs(config.cache_dir)
+    for backend in candidates:
+        if backend.name not in throughputs:
+            return backend
+    return max(candidates, key=lambda backend: throughputs[backend.name])
@@ -1,9 +1,52 @@
+import difflib
+import glob
+import hashlib
+import json
+import math
 import os
+import re
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-import openai
-from typing import List
+import numpy as np
+from typing import Dict, List, Optional, Tuple, Union
+from media_tools import iter_pcm_blocks, probe_audio, run_ffmpeg
 from openai_api_interaction import OpenAIAudioAPI
-from pydub import AudioSegment
+from response_cache import get_cache
+from run_manifest import RunManifest
+from speech_transcriber.backends import (
+    TIMED_RESPONSE_FORMAT,
+    TranscriptionBackend,
+    record_throughput,
+    select_backend,
+    transcribe_chunk,
+)
+from speech_transcriber.vad import (
+    TimestampMap,
+    compute_frame_features,
+    copy_speech_segments,
+    find_speech_segments,
+    write_speech_segments,
+)
+from tracing import propagate, span
+from transcript_store import build_segments, write_transcript_segments
+
+# The upload limit of the transcription endpoint is 25MB, keep a margin below it
+MAX_CHUNK_SIZE = 24 * 1024 * 1024
+
+# Formats accepted by the transcription endpoint, which can be segmented without re-encoding
+UPLOAD_FORMATS = ["flac", "m4a", "mp3", "mp4", "mpeg", "mpga", "oga", "ogg", "wav", "webm"]
+
+# The frame length of the voice activity detection in seconds
+VAD_FRAME_DURATION = 0.03
+
+# Upload codec -> (file extension, ffmpeg encoder and options)
+UPLOAD_CODECS = {
+    "opus": ("ogg", ["-c:a", "libopus", "-application", "voip", "-vbr", "constrained"]),
+    "mp3": ("mp3", ["-c:a", "libmp3lame"]),
+}
 
 
 def split_audio_file(audio_path: str, chunk_duration: int = 100000) -> List[str]:
@@ -22,6 +65,8 @@ def split_audio_file(audio_path: str, chunk_duration: int = 100000) -> List[str]
     List[str]
         A list of file paths for the generated audio chunks.
     """
+    from pydub import AudioSegment
+
     # load the audio file
     audio = AudioSegment.from_file(audio_path)
     audio_chunks = []
@@ -38,51 +83,823 @@ def split_audio_file(audio_path: str, chunk_duration: int = 100000) -> List[str]
     return audio_chunks
 
 
+def _chunk_encoding(audio_path: str) -> Tuple[str, List[str], int]:
+    """
+    Returns the extension, the ffmpeg codec arguments and the bit rate of the chunks of a file.
+    """
+    extension = os.path.splitext(audio_path)[1].lstrip(".").lower()
+    if extension in UPLOAD_FORMATS:
+        return extension, ["-c:a", "copy"], probe_audio(audio_path).bit_rate
+    return "mp3", ["-c:a", "libmp3lame", "-b:a", "128k"], 128000
+
+
+def encode_for_upload(
+        audio_path: str,
+        output_dir: str,
+        codec: str = "opus",
+        bit_rate: int = 24000,
+        sample_rate: int = 16000,
+) -> str:
+    """
+    Downmixes the audio to mono, resamples it and encodes it to a compact speech codec.
+
+    Speech does not need more than a 16 kHz mono stream: encoded to Opus at 24 kbit/s, an
+    hour of audio takes about 11MB instead of 600MB of stereo 44.1 kHz PCM, so most meetings
+    are uploaded in a single request. The encoding is bit-exact, so encoding the same audio
+    again gives the same file, and the same transcription cache key.
+
+    Parameters
+    ----------
+    audio_path : str
+        The path to the audio file.
+    output_dir : str
+        The folder in which to write the encoded file.
+    codec : str, optional
+        The codec, one of the keys of UPLOAD_CODECS, by default "opus".
+    bit_rate : int, optional
+        The bit rate of the encoded audio in bits per second, by default 24000.
+    sample_rate : int, optional
+        The sample rate of the encoded audio in Hz, by default 16000.
+
+    Returns
+    -------
+    str
+        The path of the encoded file, or audio_path if the file is already a mono stream of
+        an uploadable format at that bit rate or below.
+    """
+    if codec not in UPLOAD_CODECS:
+        raise ValueError("Unknown upload codec {!r}, expected one of {}".format(
+            codec, ", ".join(repr(name) for name in UPLOAD_CODECS)))
+
+    if is_compact_upload(audio_path, bit_rate):
+        return audio_path
+
+    upload_extension, codec_args = _upload_encoding(codec, bit_rate)
+    os.makedirs(output_dir, exist_ok=True)
+    prefix = os.path.splitext(os.path.basename(audio_path))[0]
+    output_path = os.path.join(output_dir, "{}_upload.{}".format(prefix, upload_extension))
+    run_ffmpeg(["-i", audio_path, "-map", "0:a:0", "-vn", "-ac", "1", "-ar", str(sample_rate)] + codec_args +
+               [output_path])
+    return output_path
+
+
+def is_compact_upload(audio_path: str, bit_rate: int) -> bool:
+    """
+    Returns whether a file is already a mono stream of an uploadable format at about the
+    upload bit rate or below, which encoding again would degrade without saving much.
+    """
+    info = probe_audio(audio_path)
+    extension = os.path.splitext(audio_path)[1].lstrip(".").lower()
+    return extension in UPLOAD_FORMATS and info.channels == 1 and info.bit_rate <= bit_rate * 1.25
+
+
+def _upload_encoding(codec: str, bit_rate: int) -> Tuple[str, List[str]]:
+    """
+    Returns the extension and the bit-exact ffmpeg encoder arguments of an upload codec.
+    """
+    extension, codec_args = UPLOAD_CODECS[codec]
+    return extension, codec_args + ["-b:a", str(bit_rate), "-fflags", "+bitexact", "-flags:a", "+bitexact"]
+
+
+def trim_silence(
+        audio_path: str,
+        output_dir: str,
+        config: OpenAIAudioAPI,
+        encode: bool = True,
+) -> Tuple[str, TimestampMap]:
+    """
+    Removes the pauses longer than ``config.min_silence`` from the audio.
+
+    The speech is detected from the energy and the zero-crossing rate of 30ms frames, see
+    find_speech_segments, and written back to back to a mono file, encoded for upload
+    when ``encode`` is set. Audio already encoded for upload, e.g. the Opus track extracted
+    from a video, is not encoded again: its speech packets are copied, see
+    copy_speech_segments.
+
+    Parameters
+    ----------
+    audio_path : str
+        The path to the audio file.
+    output_dir : str
+        The folder in which to write the trimmed file.
+    config : OpenAIAudioAPI
+        The configuration for the OpenAI Audio API.
+    encode : bool, optional
+        Whether to encode the trimmed audio with ``config.upload_codec`` rather than to
+        16-bit PCM, by default True.
+
+    Returns
+    -------
+    Tuple[str, TimestampMap]
+        The path of the trimmed file, which is not written if no speech was found, and the
+        map of its positions to the original recording.
+    """
+    energy, zero_crossing_rate = compute_frame_features(audio_path, VAD_FRAME_DURATION, config.upload_sample_rate)
+    segments = find_speech_segments(energy, zero_crossing_rate, VAD_FRAME_DURATION, config.min_silence)
+
+    copy = encode and is_compact_upload(audio_path, config.upload_bit_rate)
+    extension, codec_args = "wav", None
+    if copy:
+        extension = os.path.splitext(audio_path)[1].lstrip(".").lower()
+    elif encode:
+        extension, codec_args = _upload_encoding(config.upload_codec, config.upload_bit_rate)
+    os.makedirs(output_dir, exist_ok=True)
+    prefix = os.path.splitext(os.path.basename(audio_path))[0]
+    output_path = os.path.join(output_dir, "{}_speech.{}".format(prefix, extension))
+    if segments and copy:
+        copy_speech_segments(audio_path, output_path, segments)
+    elif segments:
+        write_speech_segments(audio_path, output_path, segments, codec_args, config.upload_sample_rate)
+    return output_path, TimestampMap(segments)
+
+
+def upload_savings(
+        original_path: str,
+        upload_path: str,
+        max_chunk_size: int = MAX_CHUNK_SIZE,
+) -> Dict[str, float]:
+    """
+    Compares the bytes per minute and the number of upload chunks of an audio file before
+    and after encode_for_upload.
+
+    Parameters
+    ----------
+    original_path : str
+        The path to the original audio file.
+    upload_path : str
+        The path to the encoded audio file.
+    max_chunk_size : int, optional
+        The maximum size of a chunk in bytes, by default 24MB.
+
+    Returns
+    -------
+    Dict[str, float]
+        bytes_per_minute_before, bytes_per_minute_after, chunks_before and chunks_after.
+    """
+    size_before = os.path.getsize(original_path)
+    size_after = os.path.getsize(upload_path)
+    return {"bytes_per_minute_before": size_before / max(probe_audio(original_path).duration / 60, 1e-5),
+            "bytes_per_minute_after": size_after / max(probe_audio(upload_path).duration / 60, 1e-5),
+            "chunks_before": max(1, math.ceil(size_before / max_chunk_size)),
+            "chunks_after": max(1, math.ceil(size_after / max_chunk_size))}
+
+
+def split_audio_file_by_size(
+        audio_path: str,
+        max_chunk_size: int = MAX_CHUNK_SIZE,
+        output_dir: Optional[str] = None,
+) -> List[str]:
+    """
+    Splits the audio file into as few chunks as possible, each smaller than max_chunk_size.
+
+    The file is segmented by ffmpeg, which streams through the input, so memory usage does
+    not depend on the length of the recording. Formats accepted by the transcription
+    endpoint are cut without re-encoding; other formats are converted to mp3.
+
+    Parameters
+    ----------
+    audio_path : str
+        The path to the audio file.
+    max_chunk_size : int, optional
+        The maximum size of a chunk in bytes, by default 24MB.
+    output_dir : str, optional
+        The folder in which to write the chunks, by default a new temporary folder.
+
+    Returns
+    -------
+    List[str]
+        A list of file paths for the generated audio chunks, in playback order.
+    """
+    if output_dir is None:
+        output_dir = tempfile.mkdtemp(prefix="audio_chunks_")
+    os.makedirs(output_dir, exist_ok=True)
+
+    extension, codec_args, bit_rate = _chunk_encoding(audio_path)
+
+    # Aim slightly below the limit, the container overhead is not part of the bit rate
+    segment_time = max(1, math.floor(max_chunk_size * 0.95 * 8 / bit_rate))
+    prefix = os.path.splitext(os.path.basename(audio_path))[0]
+    pattern = os.path.join(output_dir, "{}_chunk_%04d.{}".format(prefix, extension))
+    run_ffmpeg(["-i", audio_path, "-map", "0:a:0", "-vn"] + codec_args +
+               ["-f", "segment", "-segment_time", str(segment_time), "-reset_timestamps", "1", pattern])
+
+    audio_chunks = []
+    for chunk_path in sorted(glob.glob(pattern.replace("%04d", "[0-9]" * 4))):
+        if os.path.getsize(chunk_path) > max_chunk_size and segment_time > 1:
+            # Variable bit rate streams can overshoot the estimate, split those chunks again
+            sub_dir = tempfile.mkdtemp(prefix="audio_subchunks_", dir=output_dir)
+            for sub_chunk in split_audio_file_by_size(chunk_path, max_chunk_size // 2, sub_dir):
+                audio_chunks.append(sub_chunk)
+            os.remove(chunk_path)
+        else:
+            audio_chunks.append(chunk_path)
+
+    return audio_chunks
+
+
+def compute_frame_energy(
+        audio_path: str,
+        frame_duration: float = 0.05,
+        sample_rate: int = 16000,
+) -> np.ndarray:
+    """
+    Computes the RMS energy of consecutive frames of the audio, streaming through the file.
+
+    Parameters
+    ----------
+    audio_path : str
+        The path to the audio file.
+    frame_duration : float, optional
+        The duration of a frame in seconds, by default 0.05.
+    sample_rate : int, optional
+        The sample rate used to decode the audio, by default 16000.
+
+    Returns
+    -------
+    np.ndarray
+        The RMS energy of each frame, as float32.
+    """
+    frame_size = max(1, int(round(frame_duration * sample_rate)))
+    energies = []
+    remainder = np.zeros(0, dtype=np.int16)
+
+    for block in iter_pcm_blocks(audio_path, sample_rate=sample_rate):
+        samples = np.concatenate([remainder, block])
+        num_frames = len(samples) // frame_size
+        frames = samples[:num_frames * frame_size].astype(np.float32).reshape(num_frames, frame_size)
+        energies.append(np.sqrt(np.mean(frames * frames, axis=1)))
+        remainder = samples[num_frames * frame_size:]
+
+    if len(remainder):
+        tail = remainder.astype(np.float32)
+        energies.append(np.sqrt(np.mean(tail * tail, keepdims=True)))
+
+    if not energies:
+        return np.zeros(0, dtype=np.float32)
+    return np.concatenate(energies).astype(np.float32)
+
+
+def find_silence_cut_points(
+        energy: np.ndarray,
+        frame_duration: float,
+        chunk_duration: float,
+        search_window: float = 10.0,
+        smoothing: float = 0.3,
+) -> List[float]:
+    """
+    Places chunk boundaries in the quietest stretch before each target boundary.
+
+    Each boundary is searched in the ``search_window`` seconds preceding the target, which is
+    ``chunk_duration`` seconds after the previous boundary, so no chunk exceeds chunk_duration.
+
+    Parameters
+    ----------
+    energy : np.ndarray
+        The RMS energy of each frame, see compute_frame_energy.
+    frame_duration : float
+        The duration of a frame in seconds.
+    chunk_duration : float
+        The maximum duration of a chunk in seconds.
+    search_window : float, optional
+        How far before the target boundary to look for silence, in seconds, by default 10.0.
+    smoothing : float, optional
+        The length of the moving average applied to the energy, in seconds, by default 0.3.
+
+    Returns
+    -------
+    List[float]
+        The boundaries in seconds, excluding the start and the end of the audio.
+    """
+    num_frames = len(energy)
+    chunk_frames = max(1, int(chunk_duration / frame_duration))
+    window_frames = min(chunk_frames - 1, max(1, int(search_window / frame_duration)))
+    smoothing_frames = max(1, int(smoothing / frame_duration))
+    smoothed = np.convolve(energy, np.ones(smoothing_frames) / smoothing_frames, mode="same")
+
+    cut_points = []
+    position = 0
+    while num_frames - position > chunk_frames:
+        target = position + chunk_frames
+        window_start = max(position + 1, target - window_frames)
+        window = smoothed[window_start:target]
+        # Cut in the middle of the longest stretch at the minimum energy
+        quiet = np.concatenate([[0], (window <= window.min() * 1.1 + 1.0).astype(np.int8), [0]])
+        edges = np.flatnonzero(np.diff(quiet))
+        run_starts, run_ends = edges[::2], edges[1::2]
+        longest = int(np.argmax(run_ends - run_starts))
+        cut = window_start + (run_starts[longest] + run_ends[longest]) // 2
+        cut_points.append(float(cut * frame_duration))
+        position = cut
+
+    return cut_points
+
+
+def split_audio_file_on_silence(
+        audio_path: str,
+        max_chunk_size: int = MAX_CHUNK_SIZE,
+        overlap: float = 0.0,
+        search_window: float = 10.0,
+        output_dir: Optional[str] = None,
+) -> List[str]:
+    """
+    Splits the audio file into chunks below max_chunk_size, cutting at low-energy points.
+
+    Cutting in pauses keeps words intact on both sides of a boundary. Each chunk after the
+    first also starts ``overlap`` seconds before its boundary; the words transcribed twice are
+    removed when the transcriptions are joined, see merge_overlapping_transcripts.
+
+    Parameters
+    ----------
+    audio_path : str
+        The path to the audio file.
+    max_chunk_size : int, optional
+        The maximum size of a chunk in bytes, by default 24MB.
+    overlap : float, optional
+        The overlap between consecutive chunks in seconds, by default 0.0.
+    search_window : float, optional
+        How far before each target boundary to look for silence, in seconds, by default 10.0.
+    output_dir : str, optional
+        The folder in which to write the chunks, by default a new temporary folder.
+
+    Returns
+    -------
+    List[str]
+        A list of file paths for the generated audio chunks, in playback order.
+    """
+    if output_dir is None:
+        output_dir = tempfile.mkdtemp(prefix="audio_chunks_")
+    os.makedirs(output_dir, exist_ok=True)
+
+    extension, codec_args, bit_rate = _chunk_encoding(audio_path)
+
+    frame_duration = 0.05
+    chunk_duration = max(1.0, max_chunk_size * 0.95 * 8 / bit_rate - overlap)
+    energy = compute_frame_energy(audio_path, frame_duration=frame_duration)
+    boundaries = [0.0] + find_silence_cut_points(energy, frame_duration, chunk_duration, search_window)
+
+    prefix = os.path.splitext(os.path.basename(audio_path))[0]
+    audio_chunks = []
+    for i, start in enumerate(boundaries):
+        chunk_start = max(0.0, start - overlap) if i > 0 else 0.0
+        chunk_path = os.path.join(output_dir, "{}_chunk_{:04d}.{}".format(prefix, i, extension))
+        duration_args = []
+        if i + 1 < len(boundaries):
+            duration_args = ["-t", "{:.3f}".format(boundaries[i + 1] - chunk_start)]
+        run_ffmpeg(["-ss", "{:.3f}".format(chunk_start), "-i", audio_path] + duration_args +
+                   ["-map", "0:a:0", "-vn"] + codec_args + [chunk_path])
+        audio_chunks.append(chunk_path)
+
+    return audio_chunks
+
+
+def _normalize_words(words: List[str]) -> List[str]:
+    return [re.sub(r"[^\w']", "", word).lower() for word in words]
+
+
+def merge_overlapping_transcripts(
+        transcriptions: List[str],
+        max_overlap_words: int = 40,
+        min_match_words: int = 3,
+) -> str:
+    """
+    Joins the transcriptions of overlapping chunks, dropping the words transcribed twice.
+
+    The end of each transcription is aligned with the beginning of the next one, ignoring case
+    and punctuation; the matched words and anything before them in the next transcription
+    are removed.
+
+    Parameters
+    ----------
+    transcriptions : List[str]
+        The transcriptions of consecutive chunks.
+    max_overlap_words : int, optional
+        The number of words at each side of a boundary searched for the overlap, by default 40.
+    min_match_words : int, optional
+        The minimum number of consecutive matching words to accept an overlap, by default 3.
+
+    Returns
+    -------
+    str
+        The joined transcription.
+    """
+    return "\n".join(text for text in remove_overlaps(transcriptions, max_overlap_words, min_match_words) if text)
+
+
+def remove_overlaps(
+        transcriptions: List[str],
+        max_overlap_words: int = 40,
+        min_match_words: int = 3,
+) -> List[str]:
+    """
+    Removes from the transcription of each chunk the words already in the previous one.
+
+    See merge_overlapping_transcripts, which joins the non-empty results.
+
+    Returns
+    -------
+    List[str]
+        The transcription of each chunk without its overlap, which can be empty.
+    """
+    texts = []
+    previous_words: List[str] = []
+    for transcription in transcriptions:
+        words = transcription.split()
+        tail = _normalize_words(previous_words[-max_overlap_words:])
+        head = _normalize_words(words[:max_overlap_words])
+        match = difflib.SequenceMatcher(None, tail, head, autojunk=False).find_longest_match(
+            0, len(tail), 0, len(head))
+        # The duplicated words must run up to the end of the previous chunk
+        if match.size >= min(min_match_words, len(head)) and match.size > 0 \
+                and len(tail) - (match.a + match.size) <= min_match_words:
+            words = words[match.b + match.size:]
+        texts.append(" ".join(words))
+        previous_words = transcription.split()
+
+    return texts
+
+
+def chunk_time_spans(audio_chunks: List[str], overlap: float = 0.0) -> List[Tuple[float, float]]:
+    """
+    Returns the part of the audio each chunk adds, without the overlap with the previous one.
+
+    Parameters
+    ----------
+    audio_chunks : List[str]
+        The paths of the audio chunks, in playback order.
+    overlap : float, optional
+        The overlap between consecutive chunks in seconds, by default 0.0.
+
+    Returns
+    -------
+    List[Tuple[float, float]]
+        The start and end of each chunk in the audio they were cut from, in seconds.
+    """
+    spans = []
+    boundary = 0.0
+    for i, chunk_path in enumerate(audio_chunks):
+        chunk_overlap = min(overlap, boundary) if i > 0 else 0.0
+        end = boundary - chunk_overlap + probe_audio(chunk_path).duration
+        spans.append((boundary, max(boundary, end)))
+        boundary = max(boundary, end)
+    return spans
+
+
+def date_chunk_segments(
+        chunk_segments: List[List[Tuple[float, float, str]]],
+        chunk_spans: List[Tuple[float, float]],
+        overlap: float = 0.0,
+) -> List[List[Tuple[float, float, str]]]:
+    """
+    Dates the segments of each chunk in the audio the chunks were cut from, and drops the
+    segments transcribed twice in the overlap of two chunks.
+
+    A segment is kept by the chunk whose span, see chunk_time_spans, holds its middle.
+
+    Parameters
+    ----------
+    chunk_segments : List[List[Tuple[float, float, str]]]
+        The segments of each chunk, dated from the start of the chunk.
+    chunk_spans : List[Tuple[float, float]]
+        The part of the audio each chunk adds, see chunk_time_spans.
+    overlap : float, optional
+        The overlap between consecutive chunks in seconds, by default 0.0.
+
+    Returns
+    -------
+    List[List[Tuple[float, float, str]]]
+        The segments of each chunk, dated in the audio.
+    """
+    dated = []
+    for i, (segments, (span_start, _)) in enumerate(zip(chunk_segments, chunk_spans)):
+        # The chunk starts before its span by the overlap with the previous one
+        offset = span_start - min(overlap, span_start) if i > 0 else span_start
+        dated.append([(offset + start, offset + end, text) for start, end, text in segments
+                      if i == 0 or offset + (start + end) / 2 >= span_start])
+    return dated
+
+
+def write_structured_transcript(
+        config: OpenAIAudioAPI,
+        chunk_texts: List[str],
+        chunk_spans: List[Tuple[float, float]],
+        chunk_ids: List[int],
+        timestamp_map: Optional[TimestampMap] = None,
+        chunk_segments: Optional[List[List[Tuple[float, float, str]]]] = None,
+) -> int:
+    """
+    Writes the structured transcript of the chunks to ``config.segments_path``, with the
+    tokens of its segments counted by the tokenizer of ``config.token_model``.
+
+    Parameters
+    ----------
+    config : OpenAIAudioAPI
+        The configuration for the OpenAI Audio API.
+    chunk_texts : List[str]
+        The transcription of each chunk, whose lines joined make the transcript.
+    chunk_spans : List[Tuple[float, float]]
+        The start and end of each chunk in the recording, in seconds.
+    chunk_ids : List[int]
+        The index of each chunk in the split audio.
+    timestamp_map : TimestampMap, optional
+        The map of the chunk times to the original recording, if its silences were removed,
+        by default None.
+    chunk_segments : List[List[Tuple[float, float, str]]], optional
+        The segments of each chunk dated by the model, see date_chunk_segments, by default
+        None (the sentences are dated from their position in the chunk).
+
+    Returns
+    -------
+    int
+        The number of segments.
+    """
+    # The tokenizer is only loaded by the runs writing a structured transcript
+    from meeting_summarizer.utils import count_tokens
+
+    text, starts, ends, chunks, tokens, text_offsets = build_segments(
+        chunk_texts, chunk_spans, lambda piece: count_tokens(piece, config.token_model), chunk_ids, chunk_segments)
+    if timestamp_map is not None:
+        # Date the segments in the original recording rather than in the trimmed audio
+        starts, ends = timestamp_map.to_original(starts), timestamp_map.to_original(ends)
+    write_transcript_segments(config.segments_path, text, starts, ends, chunks, tokens, text_offsets,
+                              config.token_model)
+    return len(tokens)
+
+
+def transcription_cache_key(
+        chunk_path: str,
+        config: OpenAIAudioAPI,
+        model: Optional[str] = None,
+        response_format: Optional[str] = None,
+) -> str:
+    """
+    Returns the cache key of a chunk transcription.
+
+    The key is a hash of the chunk bytes and of the parameters that change the transcription,
+    so a chunk is only transcribed again if its audio or the request changed.
+
+    Parameters
+    ----------
+    chunk_path : str
+        The path to the audio chunk.
+    config : OpenAIAudioAPI
+        The configuration for the OpenAI Audio API.
+    model : str, optional
+        The model transcribing the chunk, by default ``config.model``.
+    response_format : str, optional
+        The format of the transcription, by default ``config.response_format``.
+
+    Returns
+    -------
+    str
+        The cache key.
+    """
+    digest = hashlib.sha256()
+    with open(chunk_path, "rb") as audio_file:
+        for block in iter(lambda: audio_file.read(1024 * 1024), b""):
+            digest.update(block)
+    parameters = json.dumps([model or config.model, config.language, config.prompt, config.temperature,
+                             response_format or config.response_format])
+    digest.update(parameters.encode("utf-8"))
+    return "transcription:" + digest.hexdigest()
+
+
+def transcribe_audio_chunks(
+        audio_chunks: List[str],
+        config: OpenAIAudioAPI,
+        manifest: Optional[RunManifest] = None,
+        backend: Optional[TranscriptionBackend] = None,
+        timed: bool = False,
+) -> Union[List[str], List[List[Tuple[float, float, str]]]]:
+    """
+    Transcribes pre-cut audio chunks, each smaller than the upload limit.
+
+    The chunks are transcribed concurrently by the backend, e.g. uploaded by up to
+    ``config.max_workers`` threads to the hosted endpoint. If
+    ``config.cache_dir`` is set, chunks whose transcription is cached are not uploaded.
+    Chunks recorded in the manifest by an interrupted run are not uploaded either, and
+    each new transcription is recorded in it as soon as it arrives.
+
+    Parameters
+    ----------
+    audio_chunks : List[str]
+        The paths of the audio chunks, in playback order.
+    config : OpenAIAudioAPI
+        The configuration for the OpenAI Audio API.
+    manifest : RunManifest, optional
+        The checkpoint manifest of the run, by default None.
+    backend : TranscriptionBackend, optional
+        The transcription backend, by default the one selected by ``config.backend``.
+    timed : bool, optional
+        Whether to return the segments of each chunk with their times, see
+        TranscriptionBackend.transcribe_chunk_segments, rather than its text, by default False.
+
+    Returns
+    -------
+    Union[List[str], List[List[Tuple[float, float, str]]]]
+        The transcription of each chunk, or its segments, in the order of audio_chunks.
+    """
+    if backend is None:
+        backend = select_backend(config)
+    # The segments are cached and checkpointed as JSON, apart from the plain transcriptions
+    stage = "transcription_segments" if timed else "transcription"
+    response_format = TIMED_RESPONSE_FORMAT if timed else None
+    transcribe = backend.transcribe_chunk_segments if timed else backend.transcribe_chunk
+
+    transcriptions = [None] * len(audio_chunks)
+    if manifest is not None:
+        transcriptions = [manifest.chunk_result(stage, i) for i in range(len(audio_chunks))]
+
+    # Chunks transcribed by a previous run are served from the cache
+    cache = None
+    cache_keys = [None] * len(audio_chunks)
+    if config.cache_dir is not None:
+        cache = get_cache(config.cache_dir, config.cache_max_size)
+        for i, chunk_path in enumerate(audio_chunks):
+            if transcriptions[i] is None:
+                cache_keys[i] = transcription_cache_key(chunk_path, config, backend.model_name(config),
+                                                        response_format)
+                transcriptions[i] = cache.get(cache_keys[i])
+                if transcriptions[i] is not None:
+                    with span("transcription", chunk=os.path.basename(chunk_path), cache_hits=1):
+                        pass
+
+    pending = [i for i, transcription in enumerate(transcriptions) if transcription is None]
+    error = None
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=backend.max_workers(config)) as executor:
+        futures = {
+            executor.submit(propagate(transcribe), audio_chunks[i], config): i
+            for i in pending
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            i = futures[future]
+            try:
+                transcriptions[i] = json.dumps(future.result()) if timed else future.result()
+            except Exception as chunk_error:
+                # Keep collecting the other chunks so that a rerun only redoes the failed ones
+                error = error or chunk_error
+                continue
+            if cache is not None:
+                cache.set(cache_keys[i], transcriptions[i])
+            if manifest is not None:
+                manifest.save_chunk_result(stage, i, transcriptions[i])
+            print("progress:", done / len(pending))
+
+    if error is not None:
+        raise error
+
+    if pending and config.backend == "auto":
+        # Measure the throughput of the backend, to select the fastest one for the next jobs
+        record_throughput(config, backend, sum(probe_audio(audio_chunks[i]).duration for i in pending),
+                          time.perf_counter() - start)
+
+    if timed:
+        return [[tuple(segment) for segment in json.loads(segments)] for segments in transcriptions]
+    return transcriptions
+
+
 def transcribe_audio(
         config: OpenAIAudioAPI,
+        manifest: Optional[RunManifest] = None,
 ) -> str:
     """
-    Transcribes the audio using OpenAI's Whisper model.
+    Transcribes the audio using OpenAI's Whisper model, hosted or run locally depending on
+    ``config.backend``.
+
+    With ``config.trim_silence``, the long pauses are removed first, see trim_silence, and
+    the map of the positions in the trimmed audio to the original recording is written to
+    ``config.timestamp_map_path``. Unless ``config.upload_codec`` is None, the audio is then
+    encoded to a mono speech codec, see encode_for_upload, which usually leaves a single
+    chunk to upload.
+
+    The chunks are uploaded concurrently by up to ``config.max_workers`` threads and
+    joined back in their original order. With a manifest, the chunks are kept in its work
+    folder until every chunk is transcribed, so an interrupted run resumes without splitting
+    the audio again.
+
+    With ``config.segments_path``, the chunks are transcribed with the times of their
+    segments, e.g. in the verbose JSON format of the hosted endpoint, and a structured
+    transcript with the times, chunks and token counts of its sentences is written alongside,
+    see write_structured_transcript.
 
     Parameters
     ----------
     config : OpenAIAudioAPI
         The configuration for the OpenAI Audio API.
+    manifest : RunManifest, optional
+        The checkpoint manifest of the run, by default None.
     Returns
     -------
     str
         The transcription of the audio.
     """
-    # Set up the OpenAI API client
-    openai.api_key = config.api_key
+    backend = select_backend(config)
+    chunk_dir = None
+    encode_dir = None
+    timestamp_map = None
 
-    # if the file is larger than 24MB, split it into chunks
-    audio_size = os.path.getsize(config.file_path)
-    max_size = 24 * 1024 * 1024
+    split_info = manifest.stage_info("split") if manifest is not None else None
 
-    if audio_size > max_size:
-        # split the audio file into chunks
-        audio_chunks = split_audio_file(config.file_path)
-    else:
-        audio_chunks = [config.file_path]
+    try:
+        if split_info is not None and all(os.path.exists(chunk) for chunk in split_info["chunks"]):
+            # reuse the chunks of the interrupted run
+            chunk_dir = manifest.work_dir
+            audio_chunks = split_info["chunks"]
+            if config.trim_silence and config.timestamp_map_path is not None \
+                    and os.path.exists(config.timestamp_map_path):
+                timestamp_map = TimestampMap.load(config.timestamp_map_path)
+        else:
+            audio_path = config.file_path
+            encode = config.upload_codec is not None and backend.has_upload_limit
+            if config.trim_silence or encode:
+                encode_dir = tempfile.mkdtemp(prefix="audio_upload_")
+            if config.trim_silence:
+                with span("vad", bytes=os.path.getsize(audio_path)) as vad_span:
+                    audio_path, timestamp_map = trim_silence(audio_path, encode_dir, config, encode)
+                    original_duration = probe_audio(config.file_path).duration
+                    vad_span.set("removed_seconds", original_duration - timestamp_map.duration)
+                print("Silence trimming: removed {:.1f} of {:.1f} minutes".format(
+                    (original_duration - timestamp_map.duration) / 60, original_duration / 60))
+                if config.timestamp_map_path is not None:
+                    timestamp_map.save(config.timestamp_map_path)
+                if not timestamp_map.segments:
+                    return ""
+            if encode:
+                with span("encode", bytes=os.path.getsize(audio_path), codec=config.upload_codec) as encode_span:
+                    # The trimmed audio is already encoded
+                    if not config.trim_silence:
+                        audio_path = encode_for_upload(audio_path, encode_dir, config.upload_codec,
+                                                       config.upload_bit_rate, config.upload_sample_rate)
+                    savings = upload_savings(config.file_path, audio_path)
+                    for key, value in savings.items():
+                        encode_span.set(key, value)
+                print("Upload encoding: {:.2f}MB/min -> {:.2f}MB/min, {} -> {} chunk(s)".format(
+                    savings["bytes_per_minute_before"] / 2 ** 20, savings["bytes_per_minute_after"] / 2 ** 20,
+                    savings["chunks_before"], savings["chunks_after"]))
 
-    # Generate the transcription
-    transcriptions = []
+            # if the file is larger than 24MB, split it into chunks
+            audio_size = os.path.getsize(audio_path)
+            max_chunk_size = MAX_CHUNK_SIZE
+            if not backend.has_upload_limit:
+                # Cut one chunk per worker instead, so that every worker has audio to transcribe
+                max_chunk_size = min(MAX_CHUNK_SIZE, max(1, math.ceil(audio_size / backend.max_workers(config))))
 
-    i = 0
-    for chunk_path in audio_chunks:
-        with open(chunk_path, "rb") as audio_file:
-            response = openai.Audio.transcribe(model=config.model,
-                                               file=audio_file)
+            if audio_size > max_chunk_size:
+                # split the audio file into chunks
+                if manifest is not None:
+                    chunk_dir = manifest.work_dir
+                    shutil.rmtree(chunk_dir, ignore_errors=True)
+                else:
+                    chunk_dir = tempfile.mkdtemp(prefix="audio_chunks_")
+                with span("split", bytes=audio_size, silence_aligned=bool(config.silence_aligned)) as split_span:
+                    if config.silence_aligned:
+                        audio_chunks = split_audio_file_on_silence(audio_path,
+                                                                   max_chunk_size,
+                                                                   overlap=config.chunk_overlap,
+                                                                   output_dir=chunk_dir)
+                    else:
+                        audio_chunks = split_audio_file_by_size(audio_path, max_chunk_size, output_dir=chunk_dir)
+                    split_span.set("chunks", len(audio_chunks))
+                if manifest is not None:
+                    manifest.complete_stage("split", chunks=audio_chunks)
+            else:
+                audio_chunks = [audio_path]
 
-        print("progress:", i / len(audio_chunks))
-        i += 1
+        # Generate the transcription
+        timed = config.segments_path is not None
+        overlap = config.chunk_overlap if config.silence_aligned else 0.0
+        try:
+            transcriptions = transcribe_audio_chunks(audio_chunks, config, manifest, backend, timed)
+            if timed:
+                chunk_spans = chunk_time_spans(audio_chunks, overlap)
+        except Exception:
+            if chunk_dir is not None and manifest is None:
+                shutil.rmtree(chunk_dir, ignore_errors=True)
+            raise
+        if chunk_dir is not None:
+            shutil.rmtree(chunk_dir, ignore_errors=True)
+    finally:
+        if encode_dir is not None:
+            shutil.rmtree(encode_dir, ignore_errors=True)
 
-        transcription = response.get("text")
-        transcriptions.append(transcription)
+    chunk_segments = None
+    if timed:
+        # The overlaps are removed by the times of the segments rather than by their words
+        chunk_segments = date_chunk_segments(transcriptions, chunk_spans, overlap)
+        transcriptions = [" ".join(text for _, _, text in segments) for segments in chunk_segments]
+    chunk_ids = list(range(len(transcriptions)))
+    if overlap > 0:
+        if not timed:
+            transcriptions = remove_overlaps(transcriptions)
+        chunk_ids = [i for i in chunk_ids if transcriptions[i]]
+        transcriptions = [transcriptions[i] for i in chunk_ids]
 
-        if audio_size > max_size:
-            os.remove(chunk_path)
+    if timed:
+        chunk_spans = [chunk_spans[i] for i in chunk_ids]
+        chunk_segments = [chunk_segments[i] for i in chunk_ids]
+        with span("segments", chunks=len(chunk_ids)) as segments_span:
+            segments_span.set("segments", write_structured_transcript(config, transcriptions, chunk_spans, chunk_ids,
+                                                                      timestamp_map, chunk_segments))
 
     transcriptions = "\n".join(transcriptions)
 
@@ -0,0 +1,289 @@
+import contextlib
+import json
+import os
+import subprocess
+import tempfile
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from media_tools import get_ffmpeg_binary, iter_pcm_blocks, run_ffmpeg
+
+# Full scale of 16-bit PCM, the reference of the dBFS levels
+FULL_SCALE = 32768.0
+
+
+def compute_frame_features(
+        audio_path: str,
+        frame_duration: float = 0.03,
+        sample_rate: int = 16000,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Computes the energy and the zero-crossing rate of consecutive frames of the audio,
+    streaming through the file.
+
+    Parameters
+    ----------
+    audio_path : str
+        The path to the audio file.
+    frame_duration : float, optional
+        The duration of a frame in seconds, by default 0.03.
+    sample_rate : int, optional
+        The sample rate used to decode the audio, by default 16000.
+
+    Returns
+    -------
+    Tuple[np.ndarray, np.ndarray]
+        The energy of each frame in dBFS, and the fraction of its consecutive samples that
+        change sign, both as float32. A trailing partial frame is dropped.
+    """
+    frame_size = max(2, int(round(frame_duration * sample_rate)))
+    energies, crossing_rates = [], []
+    remainder = np.zeros(0, dtype=np.int16)
+
+    for block in iter_pcm_blocks(audio_path, sample_rate=sample_rate):
+        samples = np.concatenate([remainder, block])
+        num_frames = len(samples) // frame_size
+        frames = samples[:num_frames * frame_size].astype(np.float32).reshape(num_frames, frame_size)
+        rms = np.sqrt(np.mean(frames * frames, axis=1))
+        energies.append(20 * np.log10(rms / FULL_SCALE + 1e-9))
+        crossing_rates.append(np.mean(np.signbit(frames[:, 1:]) != np.signbit(frames[:, :-1]), axis=1))
+        remainder = samples[num_frames * frame_size:]
+
+    if not energies:
+        return np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.float32)
+    return np.concatenate(energies).astype(np.float32), np.concatenate(crossing_rates).astype(np.float32)
+
+
+def _runs(mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the start and end frames (exclusive) of the runs of True in a boolean mask.
+    """
+    edges = np.flatnonzero(np.diff(np.concatenate([[0], mask.astype(np.int8), [0]])))
+    return edges[::2], edges[1::2]
+
+
+def find_speech_segments(
+        energy: np.ndarray,
+        zero_crossing_rate: np.ndarray,
+        frame_duration: float,
+        min_silence: float = 2.0,
+        padding: float = 0.3,
+        margin_db: float = 12.0,
+        min_threshold_db: float = -60.0,
+        max_threshold_db: float = -50.0,
+        noise_window: float = 0.5,
+        zero_crossing_threshold: float = 0.25,
+) -> List[Tuple[float, float]]:
+    """
+    Finds the spans of the audio holding speech, dropping only the pauses longer than
+    min_silence.
+
+    A frame is voiced when its energy is margin_db above the noise floor, estimated as the
+    lowest energy of the recording averaged over noise_window seconds. Only the quietest
+    stretch sets the floor, so a quiet speaker is not taken for noise however little silence
+    the recording has; and the threshold never exceeds max_threshold_db, so a recording
+    without any pause is kept whole. Unvoiced consonants are quieter but noisy, so a frame
+    with half the margin is also speech when its zero-crossing rate is high.
+
+    Parameters
+    ----------
+    energy : np.ndarray
+        The energy of each frame in dBFS, see compute_frame_features.
+    zero_crossing_rate : np.ndarray
+        The zero-crossing rate of each frame.
+    frame_duration : float
+        The duration of a frame in seconds.
+    min_silence : float, optional
+        The shortest pause removed, in seconds, by default 2.0.
+    padding : float, optional
+        The silence kept on each side of the speech, in seconds, by default 0.3.
+    margin_db : float, optional
+        How far above the noise floor the voiced frames are, by default 12.0.
+    min_threshold_db : float, optional
+        The lowest speech threshold in dBFS, so that noise over digital silence is not taken
+        for speech, by default -60.0.
+    max_threshold_db : float, optional
+        The highest speech threshold in dBFS, which quiet speech stays above, by default -50.0.
+    noise_window : float, optional
+        The duration over which the energy is averaged to find the noise floor, in seconds,
+        by default 0.5.
+    zero_crossing_threshold : float, optional
+        The zero-crossing rate above which a quiet frame is unvoiced speech, by default 0.25.
+
+    Returns
+    -------
+    List[Tuple[float, float]]
+        The start and end of each speech span in seconds, in playback order.
+    """
+    if len(energy) == 0:
+        return []
+
+    window_frames = min(len(energy), max(1, int(round(noise_window / frame_duration))))
+    noise_floor = float(np.convolve(energy, np.ones(window_frames) / window_frames, mode="valid").min())
+    threshold = min(max(noise_floor + margin_db, min_threshold_db), max_threshold_db)
+    speech = (energy > threshold) | ((energy > threshold - margin_db / 2)
+                                     & (zero_crossing_rate > zero_crossing_threshold))
+
+    # Fill the pauses too short to remove, padding included
+    padding_frames = int(round(padding / frame_duration))
+    min_silence_frames = int(round(min_silence / frame_duration))
+    silence_starts, silence_ends = _runs(~speech)
+    for start, end in zip(silence_starts, silence_ends):
+        # Leading and trailing silence is removed whatever its length
+        inner = start > 0 and end < len(speech)
+        if inner and end - start < min_silence_frames + 2 * padding_frames:
+            speech[start:end] = True
+
+    speech_starts, speech_ends = _runs(speech)
+    speech_starts = np.maximum(speech_starts - padding_frames, 0)
+    speech_ends = np.minimum(speech_ends + padding_frames, len(speech))
+    return [(float(start * frame_duration), float(end * frame_duration))
+            for start, end in zip(speech_starts, speech_ends)]
+
+
+class TimestampMap:
+    """
+    Maps the positions in audio whose silences were removed back to the original recording.
+
+    Parameters
+    ----------
+    segments : List[Tuple[float, float]]
+        The spans of the original recording that were kept, in seconds and playback order.
+    """
+
+    def __init__(self, segments: List[Tuple[float, float]]):
+        self.segments = [(float(start), float(end)) for start, end in segments]
+        durations = np.array([end - start for start, end in self.segments], dtype=np.float64)
+        self.original_starts = np.array([start for start, _ in self.segments], dtype=np.float64)
+        self.trimmed_starts = np.concatenate([[0.0], np.cumsum(durations)[:-1]]) if len(durations) else durations
+
+    @property
+    def duration(self) -> float:
+        """
+        The duration of the trimmed audio in seconds.
+        """
+        return sum(end - start for start, end in self.segments)
+
+    def to_original(self, positions):
+        """
+        Returns the times in the original recording of positions in the trimmed audio.
+
+        Parameters
+        ----------
+        positions : float or np.ndarray
+            Positions in the trimmed audio, in seconds.
+
+        Returns
+        -------
+        float or np.ndarray
+            The matching times in the original recording, in seconds.
+        """
+        positions = np.asarray(positions, dtype=np.float64)
+        if not self.segments:
+            return positions if positions.ndim else float(positions)
+        index = np.clip(np.searchsorted(self.trimmed_starts, positions, side="right") - 1, 0, None)
+        original = self.original_starts[index] + positions - self.trimmed_starts[index]
+        return original if original.ndim else float(original)
+
+    def save(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as map_file:
+            json.dump({"segments": self.segments}, map_file)
+
+    @classmethod
+    def load(cls, path: str) -> "TimestampMap":
+        with open(path, "r", encoding="utf-8") as map_file:
+            return cls([tuple(segment) for segment in json.load(map_file)["segments"]])
+
+
+def write_speech_segments(
+        audio_path: str,
+        output_path: str,
+        segments: List[Tuple[float, float]],
+        codec_args: Optional[List[str]] = None,
+        sample_rate: int = 16000,
+) -> None:
+    """
+    Writes the speech spans of the audio, back to back, to a mono file.
+
+    The audio is decoded block by block, the kept samples are selected with NumPy and piped
+    to an ffmpeg encoder, so memory usage does not depend on the length of the recording.
+
+    Parameters
+    ----------
+    audio_path : str
+        The path to the audio file.
+    output_path : str
+        The path of the trimmed audio file.
+    segments : List[Tuple[float, float]]
+        The spans to keep, in seconds and playback order, see find_speech_segments.
+    codec_args : List[str], optional
+        The ffmpeg encoder arguments, by default 16-bit PCM.
+    sample_rate : int, optional
+        The sample rate of the trimmed audio in Hz, by default 16000.
+    """
+    command = [get_ffmpeg_binary(), "-hide_banner", "-loglevel", "error", "-y",
+               "-f", "s16le", "-ar", str(sample_rate), "-ac", "1", "-i", "-"]
+    command += (codec_args or ["-c:a", "pcm_s16le"]) + [output_path]
+    bounds = np.array(segments, dtype=np.float64).reshape(-1, 2) * sample_rate
+    starts, ends = np.round(bounds[:, 0]).astype(np.int64), np.round(bounds[:, 1]).astype(np.int64)
+
+    # The encoder messages go to a file: a pipe read only at the end could fill up while the
+    # samples are written, and block both processes
+    stderr_file = tempfile.TemporaryFile()
+    process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=stderr_file)
+    try:
+        position = 0
+        for block in iter_pcm_blocks(audio_path, sample_rate=sample_rate):
+            block_end = position + len(block)
+            # The spans overlapping the block
+            first = np.searchsorted(ends, position, side="right")
+            last = np.searchsorted(starts, block_end, side="left")
+            for start, end in zip(starts[first:last], ends[first:last]):
+                process.stdin.write(block[max(start, position) - position:min(end, block_end) - position].tobytes())
+            position = block_end
+    except BrokenPipeError:
+        # The encoder exited, its error is raised below
+        pass
+    finally:
+        with contextlib.suppress(BrokenPipeError):
+            process.stdin.close()
+        return_code = process.wait()
+        stderr_file.seek(0)
+        stderr = stderr_file.read()
+        stderr_file.close()
+
+    if return_code != 0:
+        raise RuntimeError("ffmpeg failed: {}".format(stderr.decode("utf-8", "replace").strip()))
+
+
+def copy_speech_segments(
+        audio_path: str,
+        output_path: str,
+        segments: List[Tuple[float, float]],
+) -> None:
+    """
+    Writes the speech spans of the audio, back to back, without decoding it.
+
+    The packets of the spans are copied by the ffmpeg concat demuxer, so audio already
+    encoded for upload is not encoded a second time. The spans are cut at packet boundaries,
+    e.g. every 20ms for Opus.
+
+    Parameters
+    ----------
+    audio_path : str
+        The path to the audio file, in the container of output_path.
+    output_path : str
+        The path of the trimmed audio file.
+    segments : List[Tuple[float, float]]
+        The spans to keep, in seconds and playback order, see find_speech_segments.
+    """
+    quoted_path = "'{}'".format(os.path.abspath(audio_path).replace("'", "'\\''"))
+    list_file = tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False, encoding="utf-8")
+    try:
+        with list_file:
+            for start, end in segments:
+                list_file.write("file {}\ninpoint {:.3f}\noutpoint {:.3f}\n".format(quoted_path, start, end))
+        run_ffmpeg(["-f", "concat", "-safe", "0", "-i", list_file.name, "-map", "0:a:0", "-c", "copy", output_path])
+    finally:
+        os.remove(list_file.name)
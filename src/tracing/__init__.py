@@ -0,0 +1 @@
+from .tracing import Span, Tracer, current_span, propagate, span, trace
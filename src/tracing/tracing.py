@@ -0,0 +1,215 @@
+import contextlib
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+from typing import Any, Callable, Dict, Iterator, Optional, TypeVar
+
+T = TypeVar("T")
+
+# Numeric span attributes summed into the metrics
+METRIC_ATTRIBUTES = ["bytes", "prompt_tokens", "completion_tokens", "retries", "cache_hits", "queue_wait"]
+
+
+class Span:
+    """
+    A timed operation of a run, with attributes such as the bytes uploaded or the tokens used.
+
+    Parameters
+    ----------
+    name : str
+        The name of the operation, e.g. "transcription" or "completion".
+    parent_id : str, optional
+        The id of the enclosing span, by default None.
+    attributes : dict, optional
+        The initial attributes of the span.
+    """
+
+    def __init__(self, name: str, parent_id: Optional[str] = None, attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.start = time.time()
+        self.duration = 0.0
+        self.error: Optional[str] = None
+
+    def set(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def add(self, key: str, amount: float = 1) -> None:
+        self.attributes[key] = self.attributes.get(key, 0) + amount
+
+
+class Tracer:
+    """
+    Writes the spans of a run to a JSON-lines file as they end, and aggregates them into
+    metrics per span name.
+
+    Parameters
+    ----------
+    trace_path : str
+        The path of the JSON-lines trace file.
+    """
+
+    def __init__(self, trace_path: str):
+        os.makedirs(os.path.dirname(trace_path) or ".", exist_ok=True)
+        self.trace_path = trace_path
+        self.trace_id = uuid.uuid4().hex
+        self.metrics: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+        self._lock = threading.Lock()
+        self._file = open(trace_path, "a", encoding="utf-8")
+
+    def record(self, span: Span) -> None:
+        record = {"trace_id": self.trace_id,
+                  "span_id": span.span_id,
+                  "parent_id": span.parent_id,
+                  "name": span.name,
+                  "start": span.start,
+                  "duration": span.duration,
+                  "thread": threading.current_thread().name,
+                  "attributes": span.attributes}
+        if span.error is not None:
+            record["error"] = span.error
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+            metrics = self.metrics[span.name]
+            metrics["count"] += 1
+            metrics["errors"] += span.error is not None
+            metrics["duration_seconds"] += span.duration
+            for key in METRIC_ATTRIBUTES:
+                value = span.attributes.get(key)
+                if isinstance(value, (int, float)):
+                    metrics[key] += value
+
+    def prometheus_text(self) -> str:
+        """
+        Returns the metrics in the Prometheus text exposition format.
+        """
+        lines = []
+        with self._lock:
+            keys = sorted({key for metrics in self.metrics.values() for key in metrics})
+            for key in keys:
+                metric = "meeting_summary_span_{}_total".format(key)
+                lines.append("# TYPE {} counter".format(metric))
+                for name in sorted(self.metrics):
+                    if key in self.metrics[name]:
+                        lines.append('{}{{span="{}"}} {:g}'.format(metric, name, self.metrics[name][key]))
+        return "\n".join(lines) + "\n"
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+_tracer: contextvars.ContextVar = contextvars.ContextVar("tracer", default=None)
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    """
+    Returns the innermost span open in the current context, or None.
+    """
+    return _current_span.get()
+
+
+@contextlib.contextmanager
+def trace(trace_path: str, metrics_path: Optional[str] = None) -> Iterator[Optional[Tracer]]:
+    """
+    Records the spans opened in the current context to a trace file.
+
+    If a trace is already being recorded, e.g. by the pipeline that called this one, the spans
+    go to it and nothing else is opened.
+
+    Parameters
+    ----------
+    trace_path : str
+        The path of the JSON-lines trace file.
+    metrics_path : str, optional
+        The path of a Prometheus text file written with the metrics of the run when it ends, by
+        default None (no metrics file).
+
+    Yields
+    ------
+    Optional[Tracer]
+        The tracer, or None if an enclosing trace is recording the spans.
+    """
+    if _tracer.get() is not None:
+        yield None
+        return
+
+    tracer = Tracer(trace_path)
+    token = _tracer.set(tracer)
+    try:
+        yield tracer
+    finally:
+        _tracer.reset(token)
+        tracer.close()
+        if metrics_path is not None:
+            with open(metrics_path, "w", encoding="utf-8") as metrics_file:
+                metrics_file.write(tracer.prometheus_text())
+
+
+@contextlib.contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Span]:
+    """
+    Times the enclosed block as a span of the current trace.
+
+    Without a trace, the span is still created, so its attributes can be set, but it is not
+    recorded.
+
+    Parameters
+    ----------
+    name : str
+        The name of the operation.
+    **attributes
+        The initial attributes of the span.
+
+    Yields
+    ------
+    Span
+        The span, whose attributes can be set until the block ends.
+    """
+    parent = _current_span.get()
+    current = Span(name, parent.span_id if parent is not None else None, attributes)
+    token = _current_span.set(current)
+    start = time.perf_counter()
+    try:
+        yield current
+    except BaseException as error:
+        current.error = "{}: {}".format(type(error).__name__, error)
+        raise
+    finally:
+        current.duration = time.perf_counter() - start
+        _current_span.reset(token)
+        tracer = _tracer.get()
+        if tracer is not None:
+            tracer.record(current)
+
+
+def propagate(function: Callable[..., T]) -> Callable[..., T]:
+    """
+    Wraps a function so that it runs in the trace and span of the caller when it is called in
+    another thread, e.g. by a ThreadPoolExecutor.
+
+    Parameters
+    ----------
+    function : Callable
+        The function to wrap.
+
+    Returns
+    -------
+    Callable
+        The wrapped function.
+    """
+    context = contextvars.copy_context()
+
+    def run(*args: Any, **kwargs: Any) -> T:
+        return context.copy().run(function, *args, **kwargs)
+
+    return run
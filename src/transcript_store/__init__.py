@@ -0,0 +1,6 @@
+from .transcript_store import (
+    TranscriptSegments,
+    build_segments,
+    load_transcript_segments,
+    write_transcript_segments,
+)
@@ -0,0 +1,302 @@
+import hashlib
+import json
+import mmap
+import os
+import re
+import shutil
+from typing import Callable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+FORMAT_VERSION = 1
+COLUMNS = ["start", "end", "chunk", "tokens", "token_offsets", "text_offsets"]
+
+# Segments end after a sentence or at a new line
+SEGMENT_PATTERN = re.compile(r"[^\n]*?[.!?][\"')\]]*(?=\s|$)|[^\n]+")
+
+
+def text_sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def build_segments(
+        chunk_texts: List[str],
+        chunk_spans: List[Tuple[float, float]],
+        count_tokens: Callable[[str], int],
+        chunk_ids: Optional[List[int]] = None,
+        chunk_segments: Optional[List[List[Tuple[float, float, str]]]] = None,
+) -> Tuple[str, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Splits the transcriptions of the chunks into sentences, and dates them.
+
+    With the segments dated by the transcription model, the time of a sentence is
+    interpolated within the segment it starts or ends in. Otherwise it is interpolated from
+    its position in the text of its chunk.
+
+    Parameters
+    ----------
+    chunk_texts : List[str]
+        The transcription of each chunk, in playback order.
+    chunk_spans : List[Tuple[float, float]]
+        The start and end of each chunk in the recording, in seconds.
+    count_tokens : Callable[[str], int]
+        The function counting the tokens of a segment.
+    chunk_ids : List[int], optional
+        The id of each chunk, by default its index.
+    chunk_segments : List[List[Tuple[float, float, str]]], optional
+        The start and end in the recording, in seconds, and the text of the segments of each
+        chunk, whose texts joined by spaces make its transcription, by default None.
+
+    Returns
+    -------
+    Tuple[str, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]
+        The transcript, i.e. the chunk texts joined by new lines, and the start, end, chunk
+        id, token count and byte range in the transcript of each segment. The byte ranges are
+        given as the n + 1 offsets of the segment starts and of the end of the transcript.
+    """
+    if chunk_ids is None:
+        chunk_ids = list(range(len(chunk_texts)))
+
+    text = "\n".join(chunk_texts)
+    starts, ends, chunks, boundaries = [], [], [], []
+    offset = 0
+    for k, (chunk_id, chunk_text, (chunk_start, chunk_end)) in enumerate(zip(chunk_ids, chunk_texts, chunk_spans)):
+        # The times of the characters are interpolated between these positions
+        positions, times = [0, max(len(chunk_text), 1)], [chunk_start, chunk_end]
+        timed = chunk_segments is not None and bool(chunk_segments[k])
+        if timed:
+            positions, times = [], []
+            position = 0
+            for segment_start, segment_end, segment_text in chunk_segments[k]:
+                positions += [position, position + len(segment_text)]
+                times += [segment_start, segment_end]
+                position += len(segment_text) + 1
+        for match in SEGMENT_PATTERN.finditer(chunk_text):
+            if not match.group().strip():
+                continue
+            # A dated sentence starts at its first word, not in the pause before it
+            first = match.start() + len(match.group()) - len(match.group().lstrip()) if timed else match.start()
+            starts.append(float(np.interp(first, positions, times)))
+            ends.append(float(np.interp(match.end(), positions, times)))
+            chunks.append(chunk_id)
+            boundaries.append(offset + match.start())
+        offset += len(chunk_text) + 1
+
+    # Each segment runs up to the next one, white space included, so the segments cover the
+    # whole transcript and their token counts add up to the tokens of the transcript
+    if boundaries:
+        boundaries[0] = 0
+    boundaries.append(len(text))
+    pieces = [text[start:end] for start, end in zip(boundaries, boundaries[1:])]
+    text_offsets = np.concatenate([[0], np.cumsum([len(piece.encode("utf-8")) for piece in pieces],
+                                                  dtype=np.int64)])
+    if not pieces:
+        text_offsets = np.array([len(text.encode("utf-8"))], dtype=np.int64)
+    return (text,
+            np.array(starts, dtype=np.float64),
+            np.array(ends, dtype=np.float64),
+            np.array(chunks, dtype=np.int32),
+            np.array([count_tokens(piece) for piece in pieces], dtype=np.int32),
+            text_offsets.astype(np.int64))
+
+
+def write_transcript_segments(
+        directory: str,
+        text: str,
+        starts: np.ndarray,
+        ends: np.ndarray,
+        chunk_ids: np.ndarray,
+        token_counts: np.ndarray,
+        text_offsets: np.ndarray,
+        model: str,
+) -> None:
+    """
+    Writes a structured transcript: one .npy file per column, the text and a metadata file.
+
+    The folder is written next to it and then moved in place, so readers never see a partial
+    transcript.
+
+    Parameters
+    ----------
+    directory : str
+        The folder of the structured transcript.
+    text : str
+        The transcript.
+    starts, ends : np.ndarray
+        The start and end of each segment in seconds.
+    chunk_ids : np.ndarray
+        The audio chunk each segment was transcribed from.
+    token_counts : np.ndarray
+        The number of tokens of each segment.
+    text_offsets : np.ndarray
+        The byte offset of each segment in the transcript, followed by its length.
+    model : str
+        The model whose tokenizer counted the tokens.
+    """
+    temporary = directory.rstrip(os.sep) + ".tmp"
+    shutil.rmtree(temporary, ignore_errors=True)
+    os.makedirs(temporary)
+
+    token_counts = np.asarray(token_counts, dtype=np.int32)
+    columns = {"start": np.asarray(starts, dtype=np.float64),
+               "end": np.asarray(ends, dtype=np.float64),
+               "chunk": np.asarray(chunk_ids, dtype=np.int32),
+               "tokens": token_counts,
+               # Tokens before each segment, and in total
+               "token_offsets": np.concatenate([[0], np.cumsum(token_counts, dtype=np.int64)]),
+               "text_offsets": np.asarray(text_offsets, dtype=np.int64)}
+    for name, column in columns.items():
+        np.save(os.path.join(temporary, name + ".npy"), column)
+    with open(os.path.join(temporary, "text.bin"), "wb") as text_file:
+        text_file.write(text.encode("utf-8"))
+    with open(os.path.join(temporary, "meta.json"), "w", encoding="utf-8") as meta_file:
+        json.dump({"version": FORMAT_VERSION, "model": model, "segments": len(token_counts),
+                   "text_sha256": text_sha256(text)}, meta_file)
+
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(temporary, directory)
+
+
+class TranscriptSegments:
+    """
+    A structured transcript, whose columns are memory-mapped.
+
+    Only the columns and the bytes of the text that a query touches are read from disk, so
+    loading a time range or a token window does not depend on the length of the meeting.
+
+    Parameters
+    ----------
+    directory : str
+        The folder of the structured transcript, see write_transcript_segments.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        with open(os.path.join(directory, "meta.json"), "r", encoding="utf-8") as meta_file:
+            self.meta = json.load(meta_file)
+        if self.meta.get("version") != FORMAT_VERSION:
+            raise ValueError("Unsupported structured transcript version {!r} in {}".format(
+                self.meta.get("version"), directory))
+        for name in COLUMNS:
+            setattr(self, name, np.load(os.path.join(directory, name + ".npy"), mmap_mode="r"))
+
+        self._text_file = open(os.path.join(directory, "text.bin"), "rb")
+        size = os.fstat(self._text_file.fileno()).st_size
+        self._text = mmap.mmap(self._text_file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    @property
+    def model(self) -> str:
+        return self.meta["model"]
+
+    @property
+    def total_tokens(self) -> int:
+        return int(self.token_offsets[-1])
+
+    def __len__(self) -> int:
+        return len(self.tokens)
+
+    def close(self) -> None:
+        if isinstance(self._text, mmap.mmap):
+            self._text.close()
+        self._text_file.close()
+
+    def __enter__(self) -> "TranscriptSegments":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def segment_text(self, first: int, last: int) -> str:
+        """
+        Returns the text of the segments first to last (exclusive).
+        """
+        if first >= last:
+            return ""
+        return self._text[int(self.text_offsets[first]):int(self.text_offsets[last])].decode("utf-8")
+
+    def text(self) -> str:
+        """
+        Returns the whole transcript.
+        """
+        return self._text[:].decode("utf-8")
+
+    def time_range(self, start: float, end: float) -> Tuple[int, int]:
+        """
+        Returns the segments overlapping a time range of the recording.
+
+        Parameters
+        ----------
+        start : float
+            The start of the range in seconds.
+        end : float
+            The end of the range in seconds.
+
+        Returns
+        -------
+        Tuple[int, int]
+            The first segment and the one after the last, to pass to segment_text.
+        """
+        # The segments are in playback order, so both columns are sorted
+        first = int(np.searchsorted(self.end, start, side="right"))
+        last = int(np.searchsorted(self.start, end, side="left"))
+        return first, max(first, last)
+
+    def token_window(self, first_token: int, max_tokens: int) -> Tuple[int, int]:
+        """
+        Returns the whole segments that fit in a window of tokens.
+
+        Parameters
+        ----------
+        first_token : int
+            The index of the first token of the window, which is moved to the start of its
+            segment.
+        max_tokens : int
+            The size of the window. A segment longer than the window is returned on its own.
+
+        Returns
+        -------
+        Tuple[int, int]
+            The first segment and the one after the last, to pass to segment_text.
+        """
+        first = max(int(np.searchsorted(self.token_offsets, first_token, side="right")) - 1, 0)
+        if first >= len(self):
+            return len(self), len(self)
+        budget_end = self.token_offsets[first] + max_tokens
+        last = int(np.searchsorted(self.token_offsets, budget_end, side="right")) - 1
+        return first, min(max(last, first + 1), len(self))
+
+    def token_windows(self, max_tokens: int) -> Iterator[Tuple[int, int]]:
+        """
+        Yields consecutive token windows covering the transcript, see token_window.
+        """
+        first = 0
+        while first < len(self):
+            first, last = self.token_window(int(self.token_offsets[first]), max_tokens)
+            yield first, last
+            first = last
+
+
+def load_transcript_segments(directory: str, text: Optional[str] = None) -> Optional[TranscriptSegments]:
+    """
+    Opens a structured transcript, if there is one and it matches the text.
+
+    Parameters
+    ----------
+    directory : str
+        The folder of the structured transcript.
+    text : str, optional
+        The transcript the segments must describe, e.g. after the text file was edited, by
+        default not checked.
+
+    Returns
+    -------
+    Optional[TranscriptSegments]
+        The structured transcript, or None.
+    """
+    if not os.path.exists(os.path.join(directory, "meta.json")):
+        return None
+    segments = TranscriptSegments(directory)
+    if text is not None and segments.meta["text_sha256"] != text_sha256(text):
+        segments.close()
+        return None
+    return segments
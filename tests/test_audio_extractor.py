@@ -1,6 +1,13 @@
 import os
+import shutil
+import stat
+import tempfile
+import threading
 import unittest
-from audio_extractor import extract_audio_from_video
+from unittest import mock
+
+from audio_extractor import extract_audio_from_video, extract_audio_segments
+from media_tools import iter_pcm_blocks, probe_audio, run_ffmpeg
 
 
 class TestAudioExtractor(unittest.TestCase):
@@ -22,6 +29,72 @@ class TestAudioExtractor(unittest.TestCase):
         if os.path.exists(output_audio):
             os.remove(output_audio)
 
+    def test_extract_audio_single_pass(self) -> None:
+        """
+        Test if the audio is transcoded to mono speech-rate audio, or copied when its codec fits.
+        """
+        output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, output_dir)
+        input_video = os.path.join(output_dir, "sample_video.mp4")
+        run_ffmpeg(["-f", "lavfi", "-i", "sine=frequency=440:duration=5",
+                    "-f", "lavfi", "-i", "testsrc=duration=5:size=64x48",
+                    "-ac", "2", "-c:a", "aac", "-shortest", input_video])
+
+        wav_audio = os.path.join(output_dir, "sample_audio.wav")
+        extract_audio_from_video(input_video, wav_audio, start_time=1.0, end_time=3.0)
+        wav_info = probe_audio(wav_audio)
+        self.assertEqual((wav_info.codec, wav_info.channels, wav_info.sample_rate), ("pcm_s16le", 1, 16000))
+        self.assertAlmostEqual(wav_info.duration, 2.0, delta=0.1)
+
+        m4a_audio = os.path.join(output_dir, "sample_audio.m4a")
+        extract_audio_from_video(input_video, m4a_audio)
+        m4a_info = probe_audio(m4a_audio)
+        self.assertEqual((m4a_info.codec, m4a_info.channels), ("aac", 2))
+
+    def test_extract_audio_segments(self) -> None:
+        """
+        Test if the time range is extracted as consecutive segments that cover it entirely.
+        """
+        output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, output_dir)
+        input_video = os.path.join(output_dir, "sample_video.mp4")
+        run_ffmpeg(["-f", "lavfi", "-i", "sine=frequency=440:duration=8",
+                    "-f", "lavfi", "-i", "testsrc=duration=8:size=64x48",
+                    "-c:a", "aac", "-shortest", input_video])
+
+        segments = extract_audio_segments(input_video, os.path.join(output_dir, "segments"), 4,
+                                          audio_format="wav", max_workers=2)
+        self.assertEqual(len(segments), 4)
+        self.assertAlmostEqual(sum(probe_audio(segment).duration for segment in segments), 8.0, delta=0.1)
+
+        output_audio = os.path.join(output_dir, "sample_audio.wav")
+        extract_audio_from_video(input_video, output_audio, num_segments=4, max_workers=2)
+        self.assertAlmostEqual(probe_audio(output_audio).duration, 8.0, delta=0.1)
+
+    def test_iter_pcm_blocks_with_verbose_decoder(self) -> None:
+        """
+        Test if a decoder writing more messages than a pipe holds before its samples does not
+        block the reader.
+        """
+        output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, output_dir)
+        decoder = os.path.join(output_dir, "ffmpeg")
+        with open(decoder, "w") as script:
+            script.write("#!/bin/sh\nhead -c 1000000 /dev/zero | tr '\\0' w >&2\nhead -c 64000 /dev/zero\n")
+        os.chmod(decoder, os.stat(decoder).st_mode | stat.S_IEXEC)
+        samples = []
+
+        def read() -> None:
+            samples.extend(len(block) for block in iter_pcm_blocks("meeting.mp4", block_duration=1.0))
+
+        with mock.patch("media_tools.media_tools.get_ffmpeg_binary", return_value=decoder):
+            reader = threading.Thread(target=read, daemon=True)
+            reader.start()
+            reader.join(timeout=30)
+
+        self.assertFalse(reader.is_alive())
+        self.assertEqual(samples, [16000, 16000])
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,76 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from batch_runner import discover_jobs, format_batch_report, run_batch
+
+
+class TestBatchRunner(unittest.TestCase):
+    """
+    Test cases for the batch mode in batch_runner.py.
+    """
+
+    def setUp(self) -> None:
+        self.working_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.working_dir)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(self.working_dir)
+        files = ["videos/standup.mp4", "audios/standup.wav", "videos/review.mp4",
+                 "audios/retro.mp3", "transcriptions/transcription_planning.txt", "transcriptions/notes.md"]
+        for file_name in files:
+            path = os.path.join("projects", "demo", file_name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w", encoding="utf-8") as file:
+                file.write("content")
+
+    def test_discover_jobs(self) -> None:
+        """
+        Test if every meeting is found once, from its most advanced stage.
+        """
+        jobs = discover_jobs("demo")
+
+        self.assertEqual([(job.name, job.kind) for job in jobs],
+                         [("planning", "text"), ("retro", "audio"), ("review", "video"), ("standup", "audio")])
+
+    def test_run_batch_records_failures(self) -> None:
+        """
+        Test if a failing file is reported without stopping the other ones.
+        """
+        jobs = [job for job in discover_jobs("demo") if job.kind != "video"]
+
+        with mock.patch("batch_runner.batch_runner.audio_to_summary",
+                        side_effect=[None, RuntimeError("rate limited")]) as audio_to_summary, \
+                mock.patch("batch_runner.batch_runner.text_to_summary") as text_to_summary:
+            jobs = run_batch("demo", "key", max_concurrency=1, jobs=jobs)
+
+        self.assertEqual(audio_to_summary.call_count, 2)
+        text_to_summary.assert_called_once_with("demo", "content", "planning", "key", cache_completions=False,
+                                                requests_per_minute=None, tokens_per_minute=None)
+        self.assertEqual([job.status for job in jobs], ["done", "done", "failed"])
+        report = format_batch_report(jobs, wall_time=10.0)
+        self.assertIn("transcribe+summarize: rate limited", report)
+        self.assertIn("3 files, 2 done, 1 failed", report)
+
+    def test_run_batch_separates_queue_time(self) -> None:
+        """
+        Test if the time a job waits for a free worker is not counted as its processing time.
+        """
+        jobs = [job for job in discover_jobs("demo") if job.kind == "audio"]
+
+        with mock.patch("batch_runner.batch_runner.audio_to_summary",
+                        side_effect=lambda *args, **kwargs: time.sleep(0.3)):
+            jobs = run_batch("demo", "key", max_concurrency=1, jobs=jobs)
+
+        self.assertEqual([job.status for job in jobs], ["done", "done"])
+        for job in jobs:
+            self.assertAlmostEqual(job.duration, 0.3, delta=0.1)
+        self.assertLess(jobs[0].wait_time, 0.1)
+        self.assertAlmostEqual(jobs[1].wait_time, 0.3, delta=0.1)
+        self.assertIn("wait s", format_batch_report(jobs, wall_time=0.6))
+
+
+if __name__ == "__main__":
+    unittest.main()
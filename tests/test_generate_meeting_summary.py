@@ -0,0 +1,82 @@
+import unittest
+from unittest import mock
+
+from generate_meeting_summary import generate_meeting_summary, merge_summaries
+from generate_meeting_summary.generate_meeting_summary import group_summaries
+from openai_api_interaction import OpenAICompletionAPI
+
+
+def count_words(text, model="gpt-4o"):
+    return len(text.split())
+
+
+class TestGenerateMeetingSummary(unittest.TestCase):
+    """
+    Test cases for the generate_meeting_summary function in generate_meeting_summary.py.
+    """
+
+    def setUp(self) -> None:
+        patcher = mock.patch("generate_meeting_summary.generate_meeting_summary.count_tokens", side_effect=count_words)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.config = OpenAICompletionAPI(api_key="key", max_tokens=100, merge_fan_in=2)
+
+    def test_group_summaries(self) -> None:
+        """
+        Test if the groups respect the fan-in and the token budget, and hold at least two summaries.
+        """
+        summaries = ["a b", "c d", "e f g h i", "j", "k"]
+
+        groups = group_summaries(summaries, "gpt-4o", token_budget=6, fan_in=3)
+
+        self.assertEqual(groups, [["a b", "c d"], ["e f g h i", "j"], ["k"]])
+
+    def test_merge_summaries_is_hierarchical(self) -> None:
+        """
+        Test if the summaries are merged in rounds of bounded fan-in until one remains.
+        """
+        with mock.patch("generate_meeting_summary.generate_meeting_summary.get_openai_client"), \
+                mock.patch("generate_meeting_summary.generate_meeting_summary.create_chat_completion",
+                           return_value=["merged"]) as create_chat_completion:
+            merged_summary = merge_summaries(["one", "two", "three", "four", "five"], self.config)
+
+        # 5 summaries -> 3 (two merges) -> 2 (one merge) -> 1 (one merge)
+        self.assertEqual(merged_summary, "merged")
+        self.assertEqual(create_chat_completion.call_count, 4)
+
+    def test_repeated_lines_are_not_merged_again(self) -> None:
+        """
+        Test if the lines of the partial summaries repeating an earlier line are removed
+        before the merge.
+        """
+        config = OpenAICompletionAPI(api_key="key", max_tokens=100, dedup_threshold=0.8)
+        summaries = ["Agenda: review the Q3 budget of the marketing team.\nAlice presents the roadmap.",
+                     "Agenda: review the Q3 budget of the marketing team\nBob raises the hiring freeze."]
+        with mock.patch("generate_meeting_summary.generate_meeting_summary.get_openai_client"), \
+                mock.patch("generate_meeting_summary.generate_meeting_summary.create_chat_completion",
+                           return_value=["merged"]) as create_chat_completion, \
+                mock.patch("builtins.print"):
+            merge_summaries(summaries, config)
+
+        prompt = create_chat_completion.call_args[0][2][1]["content"]
+        self.assertEqual(prompt.count("Agenda: review the Q3 budget"), 1)
+        self.assertIn("Bob raises the hiring freeze.", prompt)
+
+    def test_single_chunk_is_not_merged(self) -> None:
+        """
+        Test if a text that fits in one request is summarized with the prompt template in one call.
+        """
+        with mock.patch("generate_meeting_summary.generate_meeting_summary.get_openai_client"), \
+                mock.patch("generate_meeting_summary.generate_meeting_summary.split_text_by_tokens",
+                           side_effect=lambda text, model, budget: [text]), \
+                mock.patch("generate_meeting_summary.generate_meeting_summary.create_chat_completion",
+                           return_value=["structured"]) as create_chat_completion:
+            meeting_summary = generate_meeting_summary("notes", self.config, "STRUCTURE\n<<<CHUNK>>>\nSUMMARY:")
+
+        self.assertEqual(meeting_summary, "structured")
+        messages = create_chat_completion.call_args[0][2]
+        self.assertEqual(messages[1]["content"], "STRUCTURE\nnotes\nSUMMARY:")
+
+
+if __name__ == "__main__":
+    unittest.main()
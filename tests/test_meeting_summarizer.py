@@ -1,5 +1,28 @@
+import os
+import re
+import shutil
+import tempfile
 import unittest
-from meeting_summarizer import summarize_transcription
+from unittest import mock
+
+from meeting_summarizer import create_messages_from_segments, summarize_transcription, split_text_by_tokens
+from meeting_summarizer.dedup import (HASH_PRIME, PERMUTATION_A, PERMUTATION_B, deduplicate_passages,
+                                     find_near_duplicates, minhash_signatures, shingle_hashes)
+from meeting_summarizer.extractive import reduce_transcript, score_sentences, split_sentences
+from openai_api_interaction import OpenAICompletionAPI
+from transcript_store import build_segments, load_transcript_segments, write_transcript_segments
+
+
+class WordEncoding:
+    """
+    A tokenizer with one token per word, standing in for tiktoken.
+    """
+
+    def encode_ordinary(self, text):
+        return re.findall(r"\s*\S+|\s+", text)
+
+    def decode_tokens_bytes(self, tokens):
+        return [token.encode("utf-8") for token in tokens]
 
 
 class TestMeetingSummarizer(unittest.TestCase):
@@ -25,5 +48,202 @@ class TestMeetingSummarizer(unittest.TestCase):
         self.assertTrue(len(summary) > 0)
 
 
+class TestSplitTextByTokens(unittest.TestCase):
+    """
+    Test cases for the split_text_by_tokens function in utils.py.
+    """
+
+    def setUp(self) -> None:
+        patcher = mock.patch("meeting_summarizer.utils.get_encoding", return_value=WordEncoding())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_chunks_end_on_sentence_boundaries(self) -> None:
+        """
+        Test if the chunks fill the budget up to the last sentence end and cover the whole text.
+        """
+        text = "Alice: one two three. four five six seven.\nBob: eight nine ten eleven twelve."
+
+        chunks = split_text_by_tokens(text, "gpt-4o", max_tokens=8)
+
+        self.assertEqual(chunks, ["Alice: one two three. four five six seven.",
+                                  "\nBob: eight nine ten eleven twelve."])
+        self.assertEqual("".join(chunks), text)
+
+    def test_chunks_without_boundary_are_cut_at_the_budget(self) -> None:
+        """
+        Test if a text without sentence ends is cut exactly at the token budget.
+        """
+        text = " ".join(["wörd"] * 10)
+
+        chunks = split_text_by_tokens(text, "gpt-4o", max_tokens=4)
+
+        self.assertEqual([len(chunk.split()) for chunk in chunks], [4, 4, 2])
+        self.assertEqual("".join(chunks), text)
+
+
+class TestCreateMessagesFromSegments(unittest.TestCase):
+    """
+    Test cases for the create_messages_from_segments function in utils.py.
+    """
+
+    def test_chunks_are_cut_from_cached_token_counts(self) -> None:
+        """
+        Test if the chunks are cut between segments without tokenizing the transcript, and a
+        segment longer than a chunk is split on its own.
+        """
+        output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, output_dir)
+        chunk_texts = ["Alice: one two three. four five six seven.", "Bob: " + " ".join(["word"] * 14) + "."]
+        directory = os.path.join(output_dir, "transcription_meeting.segments")
+        encoding = WordEncoding()
+        columns = build_segments(chunk_texts, [(0.0, 10.0), (10.0, 20.0)],
+                                 lambda text: len(encoding.encode_ordinary(text)))
+        write_transcript_segments(directory, *columns, model="gpt-4o")
+
+        # 8 tokens for the messages, 11 for the system prompt, 6 for the completion: 10 left
+        with mock.patch.dict("meeting_summarizer.utils.TOKEN_LIMIT_PER_MODEL", {"gpt-4o": 35}), \
+                mock.patch("meeting_summarizer.utils.get_encoding", return_value=encoding) as get_encoding, \
+                load_transcript_segments(directory) as segments:
+            encoding.encode_ordinary = mock.Mock(side_effect=encoding.encode_ordinary)
+            messages = create_messages_from_segments(segments, num_token_completion=6)
+
+        chunks = [message["content"] for message in messages[1:]]
+        self.assertEqual(chunks, ["Alice: one two three. four five six seven.\n",
+                                  "Bob: word word word word word word word word word",
+                                  " word word word word word."])
+        # Only the system prompt and the long segment were tokenized
+        self.assertEqual([call.args[0] for call in encoding.encode_ordinary.call_args_list],
+                         [messages[0]["content"], "Bob: " + " ".join(["word"] * 14) + "."])
+        get_encoding.assert_called()
+
+
+class TestExtractiveReduction(unittest.TestCase):
+    """
+    Test cases for the extractive reduction of extractive.py.
+    """
+
+    transcript = ("Alice: Hello everyone. Yeah. Okay.\n"
+                  "Bob: The Q3 budget for the marketing team is over by ten percent.\n"
+                  "Carol: Did anyone watch the game yesterday?\n"
+                  "Bob: Yeah. Yeah.\n"
+                  "Alice: We need to cut the Q3 marketing budget by ten percent.")
+
+    def test_central_sentences_are_kept_in_order(self) -> None:
+        """
+        Test if the sentences about the main topic are kept in transcript order within the
+        token budget, and the small talk, filler and repetitions are dropped.
+        """
+        sentences = split_sentences(self.transcript)
+        self.assertEqual("".join(sentences), self.transcript)
+        scores = score_sentences(sentences)
+        # The second "Yeah." repeats the first one
+        self.assertEqual(scores[sentences.index(" Yeah.\n")], float("-inf"))
+
+        reduced, stats = reduce_transcript(self.transcript, 0.65, lambda text: len(text.split()))
+
+        self.assertEqual(reduced, "Bob: The Q3 budget for the marketing team is over by ten percent.\n"
+                                  "Alice: We need to cut the Q3 marketing budget by ten percent.")
+        self.assertEqual(stats, {"tokens_before": 40, "tokens_after": 25, "tokens_saved": 15,
+                                 "sentences_before": 8, "sentences_after": 2})
+
+    def test_summarize_reduced_transcription(self) -> None:
+        """
+        Test if only the reduced transcription is sent to the model with a compression ratio.
+        """
+        config = OpenAICompletionAPI(api_key="key", max_tokens=6, compression_ratio=0.65)
+        with mock.patch("meeting_summarizer.meeting_summarizer.get_openai_client"), \
+                mock.patch("meeting_summarizer.utils.get_encoding", return_value=WordEncoding()), \
+                mock.patch("meeting_summarizer.meeting_summarizer.create_chat_completion",
+                           return_value=iter(["summary"])) as create_chat_completion, \
+                mock.patch("builtins.print"):
+            summary = summarize_transcription(self.transcript, config)
+
+        self.assertEqual(summary, "summary")
+        sent = create_chat_completion.call_args.args[2][1]["content"]
+        self.assertNotIn("game", sent)
+        self.assertIn("cut the Q3 marketing budget", sent)
+
+
+class TestDeduplication(unittest.TestCase):
+    """
+    Test cases for the near-duplicate removal of dedup.py.
+    """
+
+    def test_near_duplicates_are_removed(self) -> None:
+        """
+        Test if the passages nearly repeating an earlier one are removed, the short ones are
+        kept, and the tokens removed are counted.
+        """
+        passages = ["Can you hear me now, can you hear me?",
+                    "The Q3 budget for the marketing team is over by ten percent.",
+                    "Yes.",
+                    "can you hear me now? Can you hear me",
+                    "Yes.",
+                    "The Q3 budget of the sales team is on track."]
+
+        self.assertEqual(find_near_duplicates(passages, threshold=0.8).tolist(),
+                         [False, False, False, True, False, False])
+        kept, stats = deduplicate_passages(passages, [len(passage.split()) for passage in passages], threshold=0.8)
+
+        self.assertEqual(kept, [0, 1, 2, 4, 5])
+        self.assertEqual(stats, {"passages_removed": 1, "tokens_removed": 9})
+        # Only identical shingles are duplicates at 1.0
+        self.assertFalse(find_near_duplicates(passages[1:2] + ["The Q3 budget for the marketing team is over."],
+                                              threshold=1.0).any())
+
+    def test_minhash_matches_python_integers(self) -> None:
+        """
+        Test if the NumPy signatures equal (a * x + b) mod p computed with Python integers,
+        which do not overflow, including for hashes close to 2^32.
+        """
+        # a * x + b never reaches 2^64 for 32-bit hashes
+        self.assertLess(int(PERMUTATION_A.max()) * (2 ** 32 - 1) + int(PERMUTATION_B.max()), 2 ** 64)
+        passages = ["The Q3 budget for the marketing team is over by ten percent.", "Can you hear me now?"]
+        indices, signatures = minhash_signatures(passages, 3)
+
+        for row, passage in zip(indices, passages):
+            hashes = shingle_hashes(passage, 3)
+            expected = [min((int(a) * x + int(b)) % HASH_PRIME for x in hashes)
+                        for a, b in zip(PERMUTATION_A, PERMUTATION_B)]
+            self.assertEqual(signatures[row].tolist(), expected)
+        with mock.patch("meeting_summarizer.dedup.shingle_hashes", return_value=[2 ** 32 - 1, 2 ** 32 - 2]):
+            _, signatures = minhash_signatures(["large hashes"], 3)
+        self.assertEqual(signatures[0].tolist(),
+                         [min((int(a) * x + int(b)) % HASH_PRIME for x in [2 ** 32 - 1, 2 ** 32 - 2])
+                          for a, b in zip(PERMUTATION_A, PERMUTATION_B)])
+
+    def test_reduced_segments_are_chunked_from_cached_token_counts(self) -> None:
+        """
+        Test if a structured transcript without its repeated sentences is chunked from its
+        cached token counts, without tokenizing the transcript again.
+        """
+        output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, output_dir)
+        chunk_texts = ["Can you hear me now? The budget is approved.",
+                       "Can you hear me now? The roadmap is late."]
+        directory = os.path.join(output_dir, "transcription_meeting.segments")
+        encoding = WordEncoding()
+        columns = build_segments(chunk_texts, [(0.0, 10.0), (10.0, 20.0)],
+                                 lambda text: len(encoding.encode_ordinary(text)))
+        write_transcript_segments(directory, *columns, model="gpt-4o")
+        config = OpenAICompletionAPI(api_key="key", max_tokens=6, dedup_threshold=0.8)
+
+        with mock.patch("meeting_summarizer.utils.get_encoding", return_value=encoding), \
+                mock.patch("meeting_summarizer.meeting_summarizer.get_openai_client"), \
+                mock.patch("meeting_summarizer.meeting_summarizer.create_chat_completion",
+                           return_value=iter(["summary"])) as create_chat_completion, \
+                mock.patch("builtins.print"), \
+                load_transcript_segments(directory) as segments:
+            encoding.encode_ordinary = mock.Mock(side_effect=encoding.encode_ordinary)
+            summarize_transcription("\n".join(chunk_texts), config, segments=segments)
+
+        self.assertEqual(create_chat_completion.call_args.args[2][1]["content"],
+                         "Can you hear me now? The budget is approved.\n The roadmap is late.")
+        # Only the system prompt was tokenized
+        self.assertEqual([call.args[0] for call in encoding.encode_ordinary.call_args_list],
+                         [create_chat_completion.call_args.args[2][0]["content"]])
+
+
 if __name__ == "__main__":
     unittest.main()
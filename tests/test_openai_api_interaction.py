@@ -0,0 +1,87 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from openai_api_interaction import OpenAIAudioAPI, OpenAICompletionAPI, create_chat_completion, get_openai_client
+from response_cache import get_cache
+from tracing import trace
+
+
+class TestChatCompletion(unittest.TestCase):
+    """
+    Test cases for the create_chat_completion function in chat_completion.py.
+    """
+
+    def test_identical_requests_are_served_from_cache(self) -> None:
+        """
+        Test if a request identical to an earlier one does not reach the API.
+        """
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        client = mock.Mock()
+        client.chat.completions.create.return_value.choices = [mock.Mock(message=mock.Mock(content=" summary "))]
+        config = OpenAICompletionAPI(api_key="key", cache_dir=cache_dir)
+        messages = [{"role": "user", "content": "transcript"}]
+
+        self.assertEqual(create_chat_completion(client, config, messages), ["summary"])
+        self.assertEqual(create_chat_completion(client, config, messages), ["summary"])
+        config.temperature = 0.2
+        self.assertEqual(create_chat_completion(client, config, messages), ["summary"])
+
+        self.assertEqual(client.chat.completions.create.call_count, 2)
+        self.assertEqual(get_cache(cache_dir).stats(), {"hits": 1, "misses": 2, "entries": 2})
+
+    def test_streamed_completion_is_passed_to_callback(self) -> None:
+        """
+        Test if a streamed completion reaches the callback piece by piece and is returned whole.
+        """
+        client = mock.Mock()
+        pieces = [" The ", None, "meeting ", "ended."]
+        chunks = [mock.Mock(choices=[mock.Mock(delta=mock.Mock(content=piece))], usage=None) for piece in pieces]
+        # The usage is sent in a last chunk without choices
+        chunks.append(mock.Mock(choices=[], usage=mock.Mock(prompt_tokens=12, completion_tokens=4)))
+        client.chat.completions.create.return_value = iter(chunks)
+        config = OpenAICompletionAPI(api_key="key", stream=True)
+        received = []
+
+        trace_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, trace_dir)
+        with trace(os.path.join(trace_dir, "run.jsonl")):
+            contents = create_chat_completion(client, config, [{"role": "user", "content": "transcript"}],
+                                              received.append)
+
+        self.assertEqual(contents, ["The meeting ended."])
+        self.assertEqual(received, [" The ", "meeting ", "ended."])
+        self.assertTrue(client.chat.completions.create.call_args.kwargs["stream"])
+        self.assertEqual(client.chat.completions.create.call_args.kwargs["stream_options"], {"include_usage": True})
+        with open(os.path.join(trace_dir, "run.jsonl"), "r", encoding="utf-8") as trace_file:
+            attributes = json.loads(trace_file.readline())["attributes"]
+        self.assertEqual((attributes["prompt_tokens"], attributes["completion_tokens"]), (12, 4))
+
+
+class TestOpenAIClient(unittest.TestCase):
+    """
+    Test cases for the get_openai_client function in client.py.
+    """
+
+    def test_client_is_shared_between_configurations(self) -> None:
+        """
+        Test if configurations with the same key, URL and timeout share one client.
+        """
+        audio_config = OpenAIAudioAPI(api_key="key", file_path="audio.mp3", base_url="http://localhost:8000/v1")
+        completion_config = OpenAICompletionAPI(api_key="key", base_url="http://localhost:8000/v1")
+
+        client = get_openai_client(audio_config)
+
+        self.assertIs(get_openai_client(completion_config), client)
+        self.assertEqual(str(client.base_url), "http://localhost:8000/v1/")
+        self.assertEqual(client.max_retries, 0)
+        completion_config.timeout = 30.0
+        self.assertIsNot(get_openai_client(completion_config), client)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,134 @@
+import io
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+from media_tools import run_ffmpeg
+from pipelines import save_text, stream_text, video_to_summary_pipelined
+from tracing import span
+
+
+class TestPipelines(unittest.TestCase):
+    """
+    Test cases for the pipelines in pipelines.py.
+    """
+
+    def setUp(self) -> None:
+        self.working_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.working_dir)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(self.working_dir)
+        for folder in ["audios", "summaries", "transcriptions", "videos"]:
+            os.makedirs(os.path.join("projects", "demo", folder))
+        run_ffmpeg(["-f", "lavfi", "-i", "sine=frequency=440:duration=12",
+                    "-f", "lavfi", "-i", "testsrc=duration=12:size=64x48",
+                    "-c:a", "aac", "-shortest", "projects/demo/videos/meeting.mp4"])
+
+    def test_video_to_summary_pipelined(self) -> None:
+        """
+        Test if the segments are transcribed in order and summarized in batches as they arrive.
+        """
+        def transcribe(audio_chunks, config):
+            return [os.path.basename(audio_chunks[0]).split(".")[0]]
+
+        with mock.patch("speech_transcriber.transcribe_audio_chunks", side_effect=transcribe), \
+                mock.patch("pipelines.count_tokens", return_value=1), \
+                mock.patch("pipelines.summarize_transcription",
+                           side_effect=lambda transcription, config: transcription.upper()) as summarize, \
+                mock.patch("pipelines.summary_to_meeting_summary") as meeting_summary:
+            video_to_summary_pipelined("demo", "meeting.mp4", "key", segment_duration=3.0,
+                                       extract_workers=2, transcribe_workers=2, map_tokens=2)
+
+        with open("projects/demo/transcriptions/transcription_meeting.txt", encoding="utf-8") as transcription:
+            self.assertEqual(transcription.read().split(), ["meeting_segment_{:04d}".format(i) for i in range(4)])
+        self.assertEqual(summarize.call_count, 2)
+        meeting_summary.assert_called_once_with(
+            "demo", "MEETING_SEGMENT_0000\nMEETING_SEGMENT_0001\nMEETING_SEGMENT_0002\nMEETING_SEGMENT_0003",
+            "meeting", "key", cache_completions=False, requests_per_minute=None, tokens_per_minute=None)
+
+    def test_video_to_summary_pipelined_stitches_and_resumes(self) -> None:
+        """
+        Test if the words transcribed twice in the overlap of two segments are kept once, and if
+        a rerun after a failure only redoes the segments and summaries that were not recorded.
+        """
+        texts = ["we start with the budget", "with the budget is approved",
+                 "budget is approved next item", "approved next item thanks everyone"]
+
+        def transcribe(audio_chunks, config):
+            return [texts[int(os.path.basename(audio_chunks[0]).split(".")[0].split("_")[-1])]]
+
+        def fail_on_second_batch(transcription, config):
+            if "next item" in transcription:
+                raise RuntimeError("API error")
+            return transcription.upper()
+
+        with mock.patch("speech_transcriber.transcribe_audio_chunks", side_effect=transcribe) as first_run, \
+                mock.patch("pipelines.count_tokens", return_value=1), \
+                mock.patch("pipelines.summarize_transcription", side_effect=fail_on_second_batch), \
+                mock.patch("pipelines.summary_to_meeting_summary"):
+            with self.assertRaises(RuntimeError):
+                video_to_summary_pipelined("demo", "meeting.mp4", "key", segment_duration=3.0,
+                                           extract_workers=2, transcribe_workers=2, map_tokens=2)
+        self.assertEqual(first_run.call_count, 4)
+
+        with mock.patch("speech_transcriber.transcribe_audio_chunks", side_effect=transcribe) as second_run, \
+                mock.patch("pipelines.count_tokens", return_value=1), \
+                mock.patch("pipelines.summarize_transcription",
+                           side_effect=lambda transcription, config: transcription.upper()) as summarize, \
+                mock.patch("pipelines.summary_to_meeting_summary"):
+            video_to_summary_pipelined("demo", "meeting.mp4", "key", segment_duration=3.0,
+                                       extract_workers=2, transcribe_workers=2, map_tokens=2)
+
+        second_run.assert_not_called()
+        summarize.assert_called_once_with("next item\nthanks everyone", mock.ANY)
+        with open("projects/demo/transcriptions/transcription_meeting.txt", encoding="utf-8") as transcription:
+            self.assertEqual(transcription.read(), "we start with the budget\nis approved\nnext item\nthanks everyone")
+        with open("projects/demo/summaries/summary_meeting.txt", encoding="utf-8") as summary:
+            self.assertEqual(summary.read(), "WE START WITH THE BUDGET\nIS APPROVED\nNEXT ITEM\nTHANKS EVERYONE")
+
+    def test_save_text_survives_a_locked_index(self) -> None:
+        """
+        Test if an artifact is still written when the search index cannot be updated.
+        """
+        output_path = "projects/demo/summaries/summary_meeting.txt"
+        with mock.patch("pipelines.index_artifact", side_effect=sqlite3.OperationalError("database is locked")), \
+                mock.patch("sys.stdout", new_callable=io.StringIO) as stdout:
+            save_text("The meeting ended.", output_path)
+
+        with open(output_path, encoding="utf-8") as summary:
+            self.assertEqual(summary.read(), "The meeting ended.")
+        self.assertIn("database is locked", stdout.getvalue())
+
+    def test_stream_text_echo_is_opt_in(self) -> None:
+        """
+        Test if streamed text is always written to the file, and to stdout only with echo.
+        """
+        for echo in [False, True]:
+            with mock.patch("sys.stdout", new_callable=io.StringIO) as stdout:
+                with stream_text("projects/demo/summaries/summary_meeting.txt", echo) as on_token:
+                    on_token("The meeting ")
+                    on_token("ended.")
+            with open("projects/demo/summaries/summary_meeting.txt", encoding="utf-8") as summary:
+                self.assertEqual(summary.read(), "The meeting ended.")
+            self.assertEqual("The meeting ended." in stdout.getvalue(), echo)
+
+    def test_stream_text_records_time_to_first_token(self) -> None:
+        """
+        Test if the time to the first token is recorded on the enclosing span, without echo.
+        """
+        with span("summarize") as summarize_span, \
+                stream_text("projects/demo/summaries/summary_meeting.txt") as on_token:
+            self.assertNotIn("first_token_seconds", summarize_span.attributes)
+            on_token("The meeting ")
+            first_token_seconds = summarize_span.attributes["first_token_seconds"]
+            on_token("ended.")
+
+        self.assertGreaterEqual(first_token_seconds, 0.0)
+        self.assertEqual(summarize_span.attributes["first_token_seconds"], first_token_seconds)
+
+
+if __name__ == "__main__":
+    unittest.main()
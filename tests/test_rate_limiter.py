@@ -0,0 +1,88 @@
+import time
+import unittest
+from unittest import mock
+
+import httpx
+import openai
+
+from rate_limiter import RateLimiter, get_rate_limiter, rate_limiter_stats
+
+
+class TestRateLimiter(unittest.TestCase):
+    """
+    Test cases for the RateLimiter class in rate_limiter.py.
+    """
+
+    def test_requests_wait_for_the_token_quota(self) -> None:
+        """
+        Test if a request waits until the token bucket has refilled enough for it.
+        """
+        # 6000 tokens per minute refill 100 tokens per second
+        limiter = RateLimiter(requests_per_minute=6000, tokens_per_minute=6000)
+
+        self.assertLess(limiter.acquire(6000), 0.05)
+        start = time.monotonic()
+        limiter.acquire(10)
+
+        self.assertGreaterEqual(time.monotonic() - start, 0.08)
+        stats = limiter.stats()
+        self.assertEqual(stats["requests"], 2)
+        self.assertEqual(stats["queue_depth"], 0)
+        self.assertGreaterEqual(stats["max_wait"], 0.08)
+
+    def test_rate_limit_error_honours_retry_after(self) -> None:
+        """
+        Test if a request failing with a rate limit error waits for the Retry-After delay rather than
+        the exponential backoff.
+        """
+        request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+        response = httpx.Response(429, headers={"retry-after-ms": "100"}, request=request)
+        function = mock.Mock(side_effect=[
+            openai.RateLimitError("Rate limit reached", response=response, body=None),
+            "completion",
+        ])
+        limiter = RateLimiter(max_retries=2)
+
+        with mock.patch("rate_limiter.rate_limiter.time.sleep") as sleep:
+            self.assertEqual(limiter.call(function), "completion")
+
+        sleep.assert_not_called()
+        self.assertGreaterEqual(limiter.stats()["max_wait"], 0.09)
+        self.assertEqual(function.call_count, 2)
+        self.assertEqual(limiter.stats()["rate_limited"], 1)
+        self.assertEqual(limiter.stats()["retries"], 1)
+
+    def test_shared_limiter_merges_quotas(self) -> None:
+        """
+        Test if the quotas given by later callers are added to the shared limiter, if
+        conflicting quotas are rejected, and if reading the stats does not create a limiter.
+        """
+        self.assertIsNone(rate_limiter_stats("test-merge"))
+        limiter = get_rate_limiter("test-merge")
+        self.assertIsNone(limiter.request_bucket)
+
+        self.assertIs(get_rate_limiter("test-merge", requests_per_minute=60, tokens_per_minute=1000), limiter)
+        self.assertIs(get_rate_limiter("test-merge"), limiter)
+        self.assertEqual((limiter.request_bucket.capacity, limiter.token_bucket.capacity), (60, 1000))
+        with self.assertRaises(ValueError):
+            get_rate_limiter("test-merge", requests_per_minute=120)
+        self.assertEqual(rate_limiter_stats("test-merge")["requests"], 0)
+
+    def test_retries_are_given_per_call(self) -> None:
+        """
+        Test if a request is retried as many times as its caller asked, whatever the other
+        callers of the limiter asked.
+        """
+        request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+        error = openai.InternalServerError("Server error", response=httpx.Response(500, request=request), body=None)
+        limiter = RateLimiter(max_retries=3)
+        function = mock.Mock(side_effect=error)
+
+        with mock.patch("rate_limiter.rate_limiter.time.sleep"), self.assertRaises(openai.InternalServerError):
+            limiter.call(function, max_retries=1)
+
+        self.assertEqual(function.call_count, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
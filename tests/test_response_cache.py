@@ -0,0 +1,89 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+import unittest
+
+from response_cache import ResponseCache, get_cache
+
+
+class TestResponseCache(unittest.TestCase):
+    """
+    Test cases for the ResponseCache class in response_cache.py.
+    """
+
+    def setUp(self) -> None:
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+
+    def test_get_and_set(self) -> None:
+        """
+        Test if a stored value is returned, also by a new cache opened on the same folder.
+        """
+        cache = ResponseCache(self.cache_dir)
+        self.assertIsNone(cache.get("key"))
+
+        cache.set("key", "value")
+
+        self.assertEqual(cache.get("key"), "value")
+        self.assertEqual(ResponseCache(self.cache_dir).get("key"), "value")
+
+    def test_least_recently_used_entries_are_evicted(self) -> None:
+        """
+        Test if the least recently used entries are evicted when the cache exceeds its size.
+        """
+        cache = ResponseCache(self.cache_dir, max_size=20)
+        cache.set("a", "x" * 8)
+        cache.set("b", "x" * 8)
+        cache.get("a")
+
+        cache.set("c", "x" * 8)
+
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNotNone(cache.get("c"))
+
+    def test_expired_entries_are_misses(self) -> None:
+        """
+        Test if an entry is no longer returned after its time to live, and if hits and misses are counted.
+        """
+        cache = ResponseCache(self.cache_dir)
+        cache.set("short", "value", ttl=0.01)
+        cache.set("long", "value", ttl=60)
+        time.sleep(0.02)
+
+        self.assertIsNone(cache.get("short"))
+        self.assertEqual(cache.get("long"), "value")
+        self.assertEqual(cache.stats(), {"hits": 1, "misses": 1, "entries": 1})
+
+    def test_cache_without_expiry_column_is_migrated(self) -> None:
+        """
+        Test if a cache written before the entries could expire is still read, and can store
+        entries with a time to live.
+        """
+        connection = sqlite3.connect(os.path.join(self.cache_dir, "cache.sqlite3"))
+        with connection:
+            connection.execute("CREATE TABLE entries (key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                               "size INTEGER NOT NULL, accessed REAL NOT NULL)")
+            connection.execute("INSERT INTO entries VALUES ('old', 'value', 5, 0)")
+        connection.close()
+
+        cache = ResponseCache(self.cache_dir)
+        cache.set("new", "value", ttl=60)
+
+        self.assertEqual(cache.get("old"), "value")
+        self.assertEqual(cache.get("new"), "value")
+
+    def test_shared_cache_keeps_its_size(self) -> None:
+        """
+        Test if getting the shared cache without a size, e.g. to read its stats, keeps the
+        size set by an earlier caller.
+        """
+        self.assertEqual(get_cache(self.cache_dir, max_size=1024).max_size, 1024)
+        self.assertEqual(get_cache(self.cache_dir).max_size, 1024)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from run_manifest import RunManifest
+
+
+class TestRunManifest(unittest.TestCase):
+    """
+    Test cases for the RunManifest class in run_manifest.py.
+    """
+
+    def setUp(self) -> None:
+        self.output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.output_dir)
+        self.path = os.path.join(self.output_dir, "manifests", "meeting.json")
+
+    def test_interrupted_run_is_resumed(self) -> None:
+        """
+        Test if the stages and chunk results of an interrupted run are found by the next run.
+        """
+        manifest = RunManifest(self.path, "signature")
+        manifest.complete_stage("extraction", audio_path="meeting.wav")
+        manifest.save_chunk_result("transcription", 0, "hello")
+
+        manifest = RunManifest(self.path, "signature")
+
+        self.assertTrue(manifest.resumed)
+        self.assertEqual(manifest.stage_info("extraction"), {"audio_path": "meeting.wav"})
+        self.assertEqual(manifest.chunk_result("transcription", 0), "hello")
+        self.assertIsNone(manifest.chunk_result("transcription", 1))
+
+    def test_changed_input_or_completed_run_starts_over(self) -> None:
+        """
+        Test if the manifest starts over when the input changed or the previous run completed.
+        """
+        manifest = RunManifest(self.path, "signature")
+        manifest.complete_stage("extraction")
+
+        self.assertFalse(RunManifest(self.path, "other signature").stage_done("extraction"))
+
+        manifest.complete()
+        self.assertFalse(RunManifest(self.path, "signature").resumed)
+
+
+if __name__ == "__main__":
+    unittest.main()
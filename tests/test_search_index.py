@@ -0,0 +1,103 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from search_index import SearchIndex, describe_artifact, get_search_index, index_artifact
+
+
+class TestSearchIndex(unittest.TestCase):
+    """
+    Test cases for the full-text index of search_index.py.
+    """
+
+    def setUp(self) -> None:
+        self.projects_dir = os.path.join(tempfile.mkdtemp(), "projects")
+        self.addCleanup(shutil.rmtree, os.path.dirname(self.projects_dir))
+        for project in ["alpha", "beta"]:
+            for folder in ["transcriptions", "summaries"]:
+                os.makedirs(os.path.join(self.projects_dir, project, folder))
+
+    def write(self, project: str, file_name: str, text: str) -> str:
+        folder = "transcriptions" if file_name.startswith("transcription_") else "summaries"
+        path = os.path.join(self.projects_dir, project, folder, file_name)
+        with open(path, "w", encoding="utf-8") as artifact:
+            artifact.write(text)
+        index_artifact(path, text)
+        return path
+
+    def test_describe_artifact(self) -> None:
+        """
+        Test if the project, meeting and kind are read from the artifact paths.
+        """
+        self.assertEqual(describe_artifact("projects/alpha/summaries/meeting_summary_kickoff.txt"),
+                         ("alpha", "kickoff", "meeting_summary"))
+        self.assertEqual(describe_artifact("projects/alpha/summaries/summary_kickoff.txt"),
+                         ("alpha", "kickoff", "summary"))
+        self.assertEqual(describe_artifact("projects/alpha/transcriptions/notes.txt"),
+                         ("alpha", "notes", "transcription"))
+        self.assertIsNone(describe_artifact("projects/alpha/transcriptions/timestamps_kickoff.json"))
+        self.assertIsNone(describe_artifact("projects/alpha/audios/kickoff.txt"))
+
+    def test_search_ranks_meetings(self) -> None:
+        """
+        Test if the meetings matching every word are ranked, with a snippet per artifact, and
+        if rewriting an artifact replaces its previous version.
+        """
+        self.write("alpha", "transcription_kickoff.txt", "We talked about the Q3 budget. The budget is tight, "
+                                                         "the budgets of Q3 must be cut.")
+        self.write("alpha", "meeting_summary_kickoff.txt", "Decision: reduce the Q3 budget.")
+        self.write("beta", "transcription_retro.txt", "The Q3 roadmap and, briefly, the budget.")
+        self.write("beta", "transcription_standup.txt", "Nothing about money.")
+
+        with SearchIndex(self.projects_dir) as index:
+            results = index.search("q3 budgets")
+            self.assertEqual([(result.project, result.meeting) for result in results],
+                             [("alpha", "kickoff"), ("beta", "retro")])
+            self.assertEqual(sorted(kind for kind, _ in results[0].snippets), ["meeting_summary", "transcription"])
+            self.assertIn("[budget]", results[0].snippets[0][1])
+            self.assertEqual(len(index.search("budget", project="beta")), 1)
+            # Quotes and operators are searched as words
+            self.assertEqual(index.search('budget" OR (money'), [])
+
+        self.write("beta", "transcription_standup.txt", "The budget was approved.")
+        with SearchIndex(self.projects_dir) as index:
+            self.assertEqual(len(index.search("budget", project="beta")), 2)
+            self.assertEqual(index.search("money"), [])
+
+    def test_update_directory(self) -> None:
+        """
+        Test if only the files added or changed since they were indexed are read, and if the
+        deleted files are removed.
+        """
+        path = self.write("alpha", "transcription_kickoff.txt", "The budget.")
+        added = os.path.join(self.projects_dir, "alpha", "transcriptions", "planning.txt")
+        with open(added, "w", encoding="utf-8") as artifact:
+            artifact.write("The hiring plan.")
+        os.makedirs(os.path.join(self.projects_dir, "alpha", "transcriptions", "transcription_kickoff.segments"))
+
+        with SearchIndex(self.projects_dir) as index:
+            self.assertEqual(index.update_directory(), {"indexed": 1, "unchanged": 1, "removed": 0})
+            self.assertEqual(index.search("hiring")[0].meeting, "planning")
+
+            os.remove(path)
+            self.assertEqual(index.update_directory(), {"indexed": 0, "unchanged": 1, "removed": 1})
+            self.assertEqual(index.search("budget"), [])
+
+    def test_index_artifact_reuses_the_connection(self) -> None:
+        """
+        Test if writing artifacts one after the other opens the index once.
+        """
+        self.write("alpha", "transcription_kickoff.txt", "The budget.")
+        with mock.patch("sqlite3.connect") as connect:
+            self.write("alpha", "summary_kickoff.txt", "Budget approved.")
+            self.write("beta", "transcription_standup.txt", "The hiring plan.")
+
+        connect.assert_not_called()
+        self.assertIs(get_search_index(self.projects_dir), get_search_index(self.projects_dir))
+        self.assertEqual(len(get_search_index(self.projects_dir).search("budget")), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
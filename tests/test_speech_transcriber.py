@@ -1,5 +1,34 @@
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import types
 import unittest
-from speech_transcriber import transcribe_audio
+from unittest import mock
+
+import httpx
+import numpy as np
+import openai
+from openai.types.audio import Transcription
+
+from media_tools import probe_audio, run_ffmpeg
+from openai_api_interaction import OpenAIAudioAPI
+from run_manifest import RunManifest
+from speech_transcriber import get_backend, select_backend, transcribe_audio, transcribe_audio_chunks
+from speech_transcriber.backends import LocalWhisperBackend, record_throughput
+from speech_transcriber.vad import TimestampMap, find_speech_segments
+from transcript_store import load_transcript_segments
+from speech_transcriber.speech_transcriber import (
+    date_chunk_segments,
+    encode_for_upload,
+    find_silence_cut_points,
+    merge_overlapping_transcripts,
+    split_audio_file_by_size,
+    transcribe_chunk,
+    trim_silence,
+    upload_savings,
+)
 
 
 class TestSpeechTranscriber(unittest.TestCase):
@@ -20,6 +49,335 @@ class TestSpeechTranscriber(unittest.TestCase):
         self.assertTrue(isinstance(transcriptions, list))
         self.assertTrue(len(transcriptions) > 0)
 
+    def test_transcribe_chunk_retries_transient_errors(self) -> None:
+        """
+        Test if a chunk that fails with a transient error is retried on its own.
+        """
+        with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as chunk:
+            chunk.write(b"RIFF")
+        self.addCleanup(os.remove, chunk.name)
+
+        client = mock.Mock()
+        client.audio.transcriptions.create.side_effect = [
+            openai.APIConnectionError(request=httpx.Request("POST", "https://api.openai.com")),
+            " hello world ",
+        ]
+        config = OpenAIAudioAPI(api_key="key", file_path=chunk.name, max_retries=2)
+
+        with mock.patch("rate_limiter.rate_limiter.time.sleep"):
+            transcription = transcribe_chunk(client, chunk.name, config)
+
+        self.assertEqual(transcription, "hello world")
+        self.assertEqual(client.audio.transcriptions.create.call_count, 2)
+
+    def test_split_audio_file_by_size(self) -> None:
+        """
+        Test if the audio is split into chunks below the size limit without losing audio.
+        """
+        output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, output_dir)
+        audio_path = os.path.join(output_dir, "sample_audio.wav")
+        run_ffmpeg(["-f", "lavfi", "-i", "sine=frequency=440:duration=30", "-ac", "2", audio_path])
+
+        max_chunk_size = 1024 * 1024
+        audio_chunks = split_audio_file_by_size(audio_path, max_chunk_size, os.path.join(output_dir, "chunks"))
+
+        self.assertEqual(len(audio_chunks), 6)
+        self.assertTrue(all(os.path.getsize(chunk) <= max_chunk_size for chunk in audio_chunks))
+        self.assertAlmostEqual(sum(probe_audio(chunk).duration for chunk in audio_chunks), 30.0, delta=0.1)
+
+    def test_encode_for_upload(self) -> None:
+        """
+        Test if the audio is encoded to a mono speech codec before it is uploaded, and only the
+        encoded file is uploaded.
+        """
+        output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, output_dir)
+        audio_path = os.path.join(output_dir, "sample_audio.wav")
+        run_ffmpeg(["-f", "lavfi", "-i", "sine=frequency=440:duration=30", "-ac", "2", "-ar", "44100", audio_path])
+
+        upload_path = encode_for_upload(audio_path, os.path.join(output_dir, "upload"))
+
+        info = probe_audio(upload_path)
+        self.assertEqual((os.path.splitext(upload_path)[1], info.codec, info.channels), (".ogg", "opus", 1))
+        self.assertAlmostEqual(info.duration, 30.0, delta=0.1)
+        # An encoded file is not encoded again
+        self.assertEqual(encode_for_upload(upload_path, os.path.join(output_dir, "again")), upload_path)
+        savings = upload_savings(audio_path, upload_path, max_chunk_size=1024 * 1024)
+        self.assertGreater(savings["bytes_per_minute_before"], 20 * savings["bytes_per_minute_after"])
+        self.assertEqual((savings["chunks_before"], savings["chunks_after"]), (6, 1))
+
+        config = OpenAIAudioAPI(api_key="key", file_path=audio_path, upload_codec="mp3")
+        uploads = []
+
+        def create(file, **kwargs):
+            uploads.append((os.path.basename(file.name), probe_audio(file.name).channels))
+            return "la"
+
+        with mock.patch("speech_transcriber.backends.get_openai_client") as get_client:
+            get_client.return_value.audio.transcriptions.create.side_effect = create
+            self.assertEqual(transcribe_audio(config), "la")
+
+        self.assertEqual(uploads, [("sample_audio_upload.mp3", 1)])
+
+    def test_find_speech_segments(self) -> None:
+        """
+        Test if only the pauses longer than min_silence are removed, and if the positions in
+        the trimmed audio map back to the original recording.
+        """
+        # In frames of 100ms: 2s of speech, a 1s pause, 2s of speech, a 5s pause, then a
+        # hissed consonant and 1s of speech
+        energy = np.concatenate([np.full(20, -20.0), np.full(10, -70.0), np.full(20, -20.0),
+                                 np.full(50, -70.0), np.full(2, -62.0), np.full(10, -20.0)])
+        zero_crossing_rate = np.full(len(energy), 0.05)
+        zero_crossing_rate[100:102] = 0.4
+
+        segments = find_speech_segments(energy, zero_crossing_rate, frame_duration=0.1, min_silence=2.0, padding=0.2)
+
+        self.assertEqual(len(segments), 2)
+        np.testing.assert_allclose(segments, [(0.0, 5.2), (9.8, 11.2)])
+        timestamp_map = TimestampMap(segments)
+        self.assertAlmostEqual(timestamp_map.duration, 6.6)
+        np.testing.assert_allclose(timestamp_map.to_original([1.0, 5.2, 6.0]), [1.0, 9.8, 10.6])
+        self.assertAlmostEqual(timestamp_map.to_original(5.0), 5.0)
+
+    def test_quiet_speaker_is_not_trimmed(self) -> None:
+        """
+        Test if continuous speech at two levels is kept whole, with or without a short pause
+        between the speakers.
+        """
+        frame_duration = 0.03
+        random = np.random.RandomState(0)
+        loud = -20.0 + random.uniform(-3, 3, 2000)
+        quiet = -34.0 + random.uniform(-3, 3, 2000)
+        pause = np.full(33, -90.0)
+
+        for energy in [np.concatenate([loud, quiet]), np.concatenate([loud, pause, quiet])]:
+            segments = find_speech_segments(energy, np.full(len(energy), 0.05), frame_duration)
+            self.assertEqual(len(segments), 1)
+            np.testing.assert_allclose(segments[0], (0.0, len(energy) * frame_duration))
+
+    def test_trim_silence_copies_encoded_audio(self) -> None:
+        """
+        Test if audio already encoded for upload is trimmed without being encoded again.
+        """
+        output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, output_dir)
+        audio_path = os.path.join(output_dir, "sample_audio.ogg")
+        run_ffmpeg(["-f", "lavfi", "-i", "sine=frequency=300:duration=5:sample_rate=16000",
+                    "-f", "lavfi", "-i", "anullsrc=r=16000:cl=mono:d=10",
+                    "-f", "lavfi", "-i", "sine=frequency=500:duration=5:sample_rate=16000",
+                    "-filter_complex", "[0:a][1:a][2:a]concat=n=3:v=0:a=1", "-ac", "1",
+                    "-c:a", "libopus", "-b:a", "24000", audio_path])
+        config = OpenAIAudioAPI(api_key="key", file_path=audio_path, trim_silence=True)
+
+        with mock.patch("speech_transcriber.speech_transcriber.write_speech_segments") as write_speech_segments:
+            trimmed_path, timestamp_map = trim_silence(audio_path, os.path.join(output_dir, "trimmed"), config)
+
+        write_speech_segments.assert_not_called()
+        info = probe_audio(trimmed_path)
+        self.assertEqual((os.path.splitext(trimmed_path)[1], info.codec, info.channels), (".ogg", "opus", 1))
+        self.assertAlmostEqual(info.duration, timestamp_map.duration, delta=0.1)
+        self.assertAlmostEqual(timestamp_map.duration, 10.6, delta=0.1)
+
+    def test_transcribe_audio_trims_silence(self) -> None:
+        """
+        Test if the long pauses are not uploaded, and if their map is written and used to date
+        the structured transcript, from the times of the segments, in the original recording.
+        """
+        output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, output_dir)
+        audio_path = os.path.join(output_dir, "sample_audio.wav")
+        run_ffmpeg(["-f", "lavfi", "-i", "sine=frequency=300:duration=5:sample_rate=16000",
+                    "-f", "lavfi", "-i", "anullsrc=r=16000:cl=mono:d=10",
+                    "-f", "lavfi", "-i", "sine=frequency=500:duration=5:sample_rate=16000",
+                    "-filter_complex", "[0:a][1:a][2:a]concat=n=3:v=0:a=1", audio_path])
+        map_path = os.path.join(output_dir, "timestamps.json")
+        segments_path = os.path.join(output_dir, "transcription_sample_audio.segments")
+        config = OpenAIAudioAPI(api_key="key", file_path=audio_path, trim_silence=True, timestamp_map_path=map_path,
+                                segments_path=segments_path)
+        durations = []
+
+        def create(file, response_format, **kwargs):
+            durations.append(probe_audio(file.name).duration)
+            self.assertEqual(response_format, "verbose_json")
+            return Transcription(text="Hello there. La la la la.",
+                                 segments=[{"start": 0.0, "end": 1.5, "text": " Hello there."},
+                                           {"start": 4.0, "end": 10.6, "text": " La la la la."}])
+
+        with mock.patch("speech_transcriber.backends.get_openai_client") as get_client, \
+                mock.patch("meeting_summarizer.utils.count_tokens", side_effect=lambda text, model: len(text.split())):
+            get_client.return_value.audio.transcriptions.create.side_effect = create
+            self.assertEqual(transcribe_audio(config), "Hello there. La la la la.")
+
+        self.assertEqual(len(durations), 1)
+        self.assertAlmostEqual(durations[0], 10.6, delta=0.1)
+        timestamp_map = TimestampMap.load(map_path)
+        self.assertAlmostEqual(timestamp_map.to_original(7.0), 16.4, delta=0.1)
+        with load_transcript_segments(segments_path) as segments:
+            self.assertEqual(list(segments.tokens), [2, 4])
+            np.testing.assert_allclose([segments.start[0], segments.end[0]], [0.0, 1.5])
+            # The second sentence starts in the first tone, and ends with the second one
+            self.assertAlmostEqual(segments.start[1], 4.0, delta=0.1)
+            self.assertAlmostEqual(segments.end[1], 20.0, delta=0.1)
+
+    def test_find_silence_cut_points(self) -> None:
+        """
+        Test if the chunk boundaries are placed in the pauses of the audio.
+        """
+        # 6 seconds of speech followed by 1 second of silence, in frames of 50ms
+        pattern = np.concatenate([np.full(120, 1000.0), np.zeros(20)])
+        energy = np.tile(pattern, 6)
+
+        cut_points = find_silence_cut_points(energy, frame_duration=0.05, chunk_duration=10.0, search_window=5.0)
+
+        self.assertEqual(cut_points, [6.5, 13.5, 20.5, 27.5, 34.5])
+
+    def test_merge_overlapping_transcripts(self) -> None:
+        """
+        Test if the words transcribed in the overlap of two chunks appear only once.
+        """
+        transcriptions = [
+            "Let's start. The budget for Q3 is",
+            "the budget for Q3 is approved, next item.",
+            "Thanks everyone.",
+        ]
+
+        transcription = merge_overlapping_transcripts(transcriptions)
+
+        self.assertEqual(transcription,
+                         "Let's start. The budget for Q3 is\napproved, next item.\nThanks everyone.")
+
+    def test_date_chunk_segments(self) -> None:
+        """
+        Test if the segments are dated in the audio, and if the ones transcribed twice in the
+        overlap of two chunks are kept once.
+        """
+        # Chunks of 0-10 and 8-20 seconds, the second one adding 10-20
+        chunk_segments = [[(0.0, 5.0, "Let's start."), (5.0, 9.5, "The budget is")],
+                          [(0.5, 1.5, "budget is"), (2.5, 6.0, "approved."), (6.0, 12.0, "Thanks.")]]
+
+        dated = date_chunk_segments(chunk_segments, [(0.0, 10.0), (10.0, 20.0)], overlap=2.0)
+
+        self.assertEqual(dated, [[(0.0, 5.0, "Let's start."), (5.0, 9.5, "The budget is")],
+                                 [(10.5, 14.0, "approved."), (14.0, 20.0, "Thanks.")]])
+
+    def test_transcribe_audio_chunks_uses_cache(self) -> None:
+        """
+        Test if only the chunks that changed since the previous run are uploaded again.
+        """
+        output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, output_dir)
+        audio_chunks = []
+        for i in range(3):
+            audio_chunks.append(os.path.join(output_dir, "chunk_{}.wav".format(i)))
+            with open(audio_chunks[-1], "wb") as chunk:
+                chunk.write(bytes([i]) * 16)
+        config = OpenAIAudioAPI(api_key="key", file_path=audio_chunks[0], cache_dir=os.path.join(output_dir, "cache"))
+
+        texts = {bytes([0]): "one", bytes([1]): "two", bytes([2]): "three", b"c": "TWO"}
+
+        with mock.patch("speech_transcriber.backends.get_openai_client") as get_client:
+            get_client.return_value.audio.transcriptions.create.side_effect = \
+                lambda file, **kwargs: texts[file.read(1)]
+            self.assertEqual(transcribe_audio_chunks(audio_chunks, config), ["one", "two", "three"])
+
+            with open(audio_chunks[1], "wb") as chunk:
+                chunk.write(b"changed")
+            self.assertEqual(transcribe_audio_chunks(audio_chunks, config), ["one", "TWO", "three"])
+
+        self.assertEqual(get_client.return_value.audio.transcriptions.create.call_count, 4)
+
+    def test_transcribe_audio_chunks_resumes_from_manifest(self) -> None:
+        """
+        Test if a rerun after a failed chunk only uploads that chunk.
+        """
+        output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, output_dir)
+        audio_chunks = []
+        for i in range(3):
+            audio_chunks.append(os.path.join(output_dir, "chunk_{}.wav".format(i)))
+            with open(audio_chunks[-1], "wb") as chunk:
+                chunk.write(bytes([i]))
+        config = OpenAIAudioAPI(api_key="key", file_path=audio_chunks[0], max_retries=0)
+        manifest_path = os.path.join(output_dir, "meeting.json")
+        error = openai.APIConnectionError(request=httpx.Request("POST", "https://api.openai.com"))
+
+        def fail_on_second_chunk(file, **kwargs):
+            index = file.read(1)[0]
+            if index == 1:
+                raise error
+            return "text {}".format(index)
+
+        with mock.patch("speech_transcriber.backends.get_openai_client") as get_client:
+            create = get_client.return_value.audio.transcriptions.create
+            create.side_effect = fail_on_second_chunk
+            with self.assertRaises(openai.APIConnectionError):
+                transcribe_audio_chunks(audio_chunks, config, RunManifest(manifest_path, "signature"))
+
+            create.side_effect = lambda file, **kwargs: "text {}".format(file.read(1)[0])
+            transcriptions = transcribe_audio_chunks(audio_chunks, config, RunManifest(manifest_path, "signature"))
+
+        self.assertEqual(transcriptions, ["text 0", "text 1", "text 2"])
+        self.assertEqual(create.call_count, 4)
+
+    def test_local_backend_transcribes_chunks_concurrently(self) -> None:
+        """
+        Test if the local backend loads one model and transcribes the chunks on its workers.
+        """
+        output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, output_dir)
+        audio_chunks = [os.path.join(output_dir, "chunk_{}.wav".format(i)) for i in range(4)]
+        config = OpenAIAudioAPI(api_key="key", file_path=audio_chunks[0], backend="local", local_workers=2)
+
+        threads = set()
+        segment = types.SimpleNamespace
+        whisper_model = mock.Mock()
+
+        def transcribe(chunk_path, **kwargs):
+            threads.add(threading.current_thread().name)
+            return iter([segment(start=0.0, end=1.5, text=" text"),
+                         segment(start=1.5, end=2.0, text=" of {} ".format(os.path.basename(chunk_path)))]), None
+
+        whisper_model.return_value.transcribe.side_effect = transcribe
+        faster_whisper = types.ModuleType("faster_whisper")
+        faster_whisper.WhisperModel = whisper_model
+        with mock.patch.dict(sys.modules, {"faster_whisper": faster_whisper}):
+            transcriptions = transcribe_audio_chunks(audio_chunks, config, backend=LocalWhisperBackend())
+
+        self.assertEqual(transcriptions, ["text of chunk_{}.wav".format(i) for i in range(4)])
+        whisper_model.assert_called_once_with("small", device="cpu", compute_type="int8",
+                                              cpu_threads=mock.ANY, num_workers=2)
+        self.assertLessEqual(len(threads), 2)
+        # The times of the segments are kept for the structured transcript
+        with mock.patch.dict(sys.modules, {"faster_whisper": faster_whisper}):
+            self.assertEqual(LocalWhisperBackend().transcribe_chunk_segments(audio_chunks[0], config),
+                             [(0.0, 1.5, "text"), (1.5, 2.0, "of chunk_0.wav")])
+
+    def test_auto_backend_selects_the_fastest(self) -> None:
+        """
+        Test if the automatic selection tries each available backend and then keeps the one
+        with the best measured throughput.
+        """
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        config = OpenAIAudioAPI(api_key="key", file_path="meeting.wav", backend="auto", cache_dir=cache_dir)
+
+        with mock.patch.object(LocalWhisperBackend, "available", return_value=True):
+            self.assertEqual(select_backend(config).name, "openai")
+            record_throughput(config, get_backend("openai"), 600, 30)
+            self.assertEqual(select_backend(config).name, "local")
+            record_throughput(config, get_backend("local"), 600, 60)
+            self.assertEqual(select_backend(config).name, "openai")
+            # The estimates follow the latest runs
+            record_throughput(config, get_backend("local"), 600, 5)
+            self.assertEqual(select_backend(config).name, "local")
+
+        with mock.patch.object(LocalWhisperBackend, "available", return_value=False):
+            self.assertEqual(select_backend(config).name, "openai")
+        with self.assertRaises(ValueError):
+            get_backend("whisper.cpp")
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,72 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from tracing import propagate, span, trace
+
+
+class TestTracing(unittest.TestCase):
+    """
+    Test cases for the trace and span functions in tracing.py.
+    """
+
+    def setUp(self) -> None:
+        self.trace_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.trace_dir)
+
+    def test_spans_are_written_to_the_trace(self) -> None:
+        """
+        Test if the spans of a run, also those of worker threads, are written with their parent
+        and attributes, and summed in the metrics.
+        """
+        trace_path = os.path.join(self.trace_dir, "run.jsonl")
+        metrics_path = os.path.join(self.trace_dir, "run.prom")
+
+        def upload(size: int) -> None:
+            with span("transcription", bytes=size) as upload_span:
+                upload_span.add("retries")
+
+        with trace(trace_path, metrics_path):
+            with span("transcribe_audio") as stage_span:
+                with ThreadPoolExecutor(max_workers=2) as executor:
+                    list(executor.map(propagate(upload), [100, 200]))
+            # A nested trace records to the enclosing one
+            with trace(os.path.join(self.trace_dir, "nested.jsonl")) as nested:
+                self.assertIsNone(nested)
+                with span("write", bytes=5):
+                    pass
+
+        with open(trace_path, "r", encoding="utf-8") as trace_file:
+            records = [json.loads(line) for line in trace_file]
+        self.assertEqual([record["name"] for record in records],
+                         ["transcription", "transcription", "transcribe_audio", "write"])
+        self.assertEqual({record["parent_id"] for record in records[:2]}, {stage_span.span_id})
+        self.assertEqual(sorted(record["attributes"]["bytes"] for record in records[:2]), [100, 200])
+        self.assertFalse(os.path.exists(os.path.join(self.trace_dir, "nested.jsonl")))
+
+        with open(metrics_path, "r", encoding="utf-8") as metrics_file:
+            metrics = metrics_file.read()
+        self.assertIn('meeting_summary_span_bytes_total{span="transcription"} 300', metrics)
+        self.assertIn('meeting_summary_span_retries_total{span="transcription"} 2', metrics)
+        self.assertIn('meeting_summary_span_count_total{span="write"} 1', metrics)
+
+    def test_failed_span_records_its_error(self) -> None:
+        """
+        Test if a span left by an exception is recorded with the error.
+        """
+        trace_path = os.path.join(self.trace_dir, "run.jsonl")
+
+        with self.assertRaises(ValueError), trace(trace_path):
+            with span("completion"):
+                raise ValueError("bad request")
+
+        with open(trace_path, "r", encoding="utf-8") as trace_file:
+            record = json.loads(trace_file.readline())
+        self.assertEqual(record["error"], "ValueError: bad request")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from transcript_store import build_segments, load_transcript_segments, write_transcript_segments
+
+
+def count_words(text: str) -> int:
+    return len(text.split())
+
+
+class TestTranscriptStore(unittest.TestCase):
+    """
+    Test cases for the structured transcripts of transcript_store.py.
+    """
+
+    def setUp(self) -> None:
+        self.output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.output_dir)
+        self.chunk_texts = ["Alice: we start with the budget. It is approved!",
+                            "Bob: the roadmap is late.\nCarol: next week."]
+        self.text = "\n".join(self.chunk_texts)
+
+    def write(self, directory: str) -> None:
+        text, starts, ends, chunks, tokens, text_offsets = build_segments(
+            self.chunk_texts, [(0.0, 48.0), (48.0, 90.0)], count_words)
+        write_transcript_segments(directory, text, starts, ends, chunks, tokens, text_offsets, "gpt-4o")
+
+    def test_segments_cover_the_transcript(self) -> None:
+        """
+        Test if the sentences are dated within their chunk, and if their texts and token
+        counts add up to the transcript.
+        """
+        directory = os.path.join(self.output_dir, "transcription_meeting.segments")
+        self.write(directory)
+
+        with load_transcript_segments(directory, self.text) as segments:
+            self.assertEqual(len(segments), 4)
+            self.assertEqual(segments.text(), self.text)
+            self.assertEqual(segments.segment_text(0, len(segments)), self.text)
+            self.assertEqual(segments.total_tokens, count_words(self.text))
+            np.testing.assert_array_equal(segments.chunk, [0, 0, 1, 1])
+            np.testing.assert_allclose(segments.start, [0.0, 32.0, 48.0, 48.0 + 42.0 * 26 / 43])
+            self.assertEqual(segments.end[-1], 90.0)
+            self.assertIsInstance(segments.start, np.memmap)
+
+        # A transcript edited since is not described by the segments
+        self.assertIsNone(load_transcript_segments(directory, self.text + " Thanks."))
+        self.assertIsNone(load_transcript_segments(os.path.join(self.output_dir, "missing.segments")))
+
+    def test_time_ranges_and_token_windows(self) -> None:
+        """
+        Test if a time range or a token window loads only the segments it overlaps.
+        """
+        directory = os.path.join(self.output_dir, "transcription_meeting.segments")
+        self.write(directory)
+
+        with load_transcript_segments(directory) as segments:
+            self.assertEqual(segments.segment_text(*segments.time_range(40.0, 60.0)),
+                             " It is approved!\nBob: the roadmap is late.\n")
+            self.assertEqual(segments.time_range(95.0, 100.0), (4, 4))
+            # Alice's sentence is 7 tokens, the other ones 3 or 5
+            self.assertEqual(segments.token_window(0, 10), (0, 2))
+            self.assertEqual(segments.token_window(8, 8), (1, 3))
+            self.assertEqual(segments.token_window(0, 4), (0, 1))
+            self.assertEqual(list(segments.token_windows(8)), [(0, 1), (1, 3), (3, 4)])
+
+
+if __name__ == "__main__":
+    unittest.main()